@@ -0,0 +1,153 @@
+"""
+Content-addressed response cache for /plan and /chat.
+
+Keys are hashes of the canonical request (model, mode, messages, sampling
+parameters, response format). Entries live in an in-memory LRU with a TTL
+and, when `response_cache_db` is set, in a SQLite file that every uvicorn
+worker on the host shares. Send `X-Cache-Bypass: 1` (or
+`Cache-Control: no-cache`) to skip the lookup; the fresh response is still
+stored.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from fastapi import Request
+
+from .prompts import canonical_json
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+def cache_key(**parts: Any) -> str:
+    return hashlib.sha256(canonical_json(parts).encode("utf-8")).hexdigest()
+
+def bypass(request: Optional[Request]) -> bool:
+    """Whether the client asked to skip cached responses."""
+    if request is None:
+        return False
+    if request.headers.get("x-cache-bypass", "").lower() in ("1", "true", "yes"):
+        return True
+    return "no-cache" in request.headers.get("cache-control", "").lower()
+
+class ResponseCache:
+    """LRU + TTL memory tier over an optional SQLite tier. Values must be JSON-serializable."""
+
+    def __init__(self, max_entries: int, ttl: float, db_path: Optional[str] = None,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    def _get_db(self) -> Optional[sqlite3.Connection]:
+        if self.db_path is None or self._db is not None:
+            return self._db
+        try:
+            db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS responses "
+                       "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+        except sqlite3.Error:
+            logger.exception("response cache: disabling disk tier at %s", self.db_path)
+            self.db_path = None
+            return None
+        self._db = db
+        return db
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        db = self._get_db()
+        if db is not None:
+            try:
+                with self._db_lock:
+                    row = db.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        expires = time.time() + self.ttl
+        self._remember(key, expires, value)
+        db = self._get_db()
+        if db is not None:
+            try:
+                with self._db_lock:
+                    db.execute("INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)",
+                               (key, json.dumps(value), expires))
+                    self._writes += 1
+                    if self._writes % 100 == 0:  # sweep expired rows now and then
+                        db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+            except sqlite3.Error:
+                logger.warning("response cache: disk write failed", exc_info=True)
+
+    def _remember(self, key: str, expires: float, value: Any):
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        db = self._get_db()
+        if db is not None:
+            with self._db_lock:
+                db.execute("DELETE FROM responses")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "disk": self.db_path is not None,
+                "enabled": self.enabled,
+            }
+
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl=settings.response_cache_ttl,
+    db_path=settings.response_cache_db,
+    enabled=settings.response_cache_enabled,
+)
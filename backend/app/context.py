@@ -0,0 +1,190 @@
+"""
+Token-budgeted context packing for chat requests.
+
+Tokens are counted locally (tiktoken when installed, otherwise a
+characters/4 estimate) and each message's count is cached, so re-sent history
+costs a dict lookup. A request is packed into the model's budget by priority:
+system prompt, latest turn, a session's summary of older turns, recent history
+(newest first, contiguous), then project context. Whatever doesn't fit is dropped or truncated the same way
+every time for the same input.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import timed
+from .settings import settings
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to the heuristic
+    tiktoken = None
+
+# Context windows (tokens); prefixes match dated model names too.
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+    "o1": 200000,
+    "o3": 200000,
+    "o4-mini": 200000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+MESSAGE_OVERHEAD = 4  # role and separators per chat message
+TRUNCATION_MARKER = "\n...[truncated]"
+_MIN_CONTEXT_TOKENS = 32  # don't bother sending a stub of project context
+
+def context_window(model: str) -> int:
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
+
+def token_budget(model: str) -> int:
+    """Prompt tokens allowed for `model`: its window minus the reply reserve, capped by settings."""
+    budget = context_window(model) - settings.context_reserve_tokens
+    if settings.context_max_tokens:
+        budget = min(budget, settings.context_max_tokens)
+    return max(budget, 0)
+
+class TokenCounter:
+    """Per-model token counting with an LRU cache of text -> count."""
+
+    def __init__(self, model: str, max_entries: int = 4096):
+        self.model = model
+        self.max_entries = max_entries
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+        self.tokenizer = "tiktoken" if self._encoding is not None else "heuristic"
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        with self._lock:
+            n = self._counts.get(text)
+            if n is not None:
+                self._counts.move_to_end(text)
+                return n
+        if self._encoding is not None:
+            n = len(self._encoding.encode(text, disallowed_special=()))
+        else:
+            n = (len(text) + 3) // 4
+        with self._lock:
+            self._counts[text] = n
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return n
+
+    def message(self, message: Dict[str, Any]) -> int:
+        return self.count(message.get("content") or "") + MESSAGE_OVERHEAD
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the head of `text` within `max_tokens`, marker included."""
+        keep = max_tokens - self.count(TRUNCATION_MARKER)
+        if keep <= 0:
+            return ""
+        if self._encoding is not None:
+            head = self._encoding.decode(self._encoding.encode(text, disallowed_special=())[:keep])
+        else:
+            head = text[:keep * 4]
+        return head + TRUNCATION_MARKER
+
+_counters: Dict[str, TokenCounter] = {}
+
+def get_counter(model: Optional[str] = None) -> TokenCounter:
+    model = model or settings.model
+    counter = _counters.get(model)
+    if counter is None:
+        counter = _counters.setdefault(model, TokenCounter(model))
+    return counter
+
+@timed("context.pack")
+def pack_messages(system_prompt: str, history: List[Dict[str, Any]], latest: Dict[str, Any],
+                  project_context: Optional[str] = None, model: Optional[str] = None,
+                  budget: Optional[int] = None,
+                  summary: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Fit a chat request into the token budget.
+
+    Returns the messages to send (system, project context, summary, history,
+    latest) and stats for ChatResponse.meta. `summary` stands for the turns
+    before `history`, so it is kept ahead of any of them.
+    """
+    counter = get_counter(model)
+    budget = token_budget(counter.model) if budget is None else budget
+    truncated = []
+
+    system = {"role": "system", "content": system_prompt}
+    used = counter.message(system)
+
+    # The latest turn always goes out; cut it down rather than drop it.
+    latest_tokens = counter.message(latest)
+    if used + latest_tokens > budget:
+        content = counter.truncate(latest.get("content") or "", max(budget - used - MESSAGE_OVERHEAD, 0))
+        latest = {**latest, "content": content}
+        truncated.append("latest")
+    used += counter.message(latest)
+    dropped_tokens = latest_tokens - counter.message(latest)
+
+    summary_messages = []
+    if summary:
+        message = {"role": "system", "content": summary}
+        tokens = counter.message(message)
+        if used + tokens > budget:
+            message = {**message, "content": counter.truncate(summary, max(budget - used - MESSAGE_OVERHEAD, 0))}
+            dropped_tokens += tokens - counter.message(message)
+            truncated.append("summary")
+        if message["content"]:
+            summary_messages.append(message)
+            used += counter.message(message)
+
+    # Newest history first; stop at the first message that doesn't fit so the
+    # kept history is a contiguous, most-recent suffix.
+    kept_from = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        tokens = counter.message(history[i])
+        if used + tokens > budget:
+            break
+        used += tokens
+        kept_from = i
+    kept = history[kept_from:]
+    dropped_messages = history[:kept_from]
+    dropped_tokens += sum(counter.message(m) for m in dropped_messages)
+
+    context_messages = []
+    if project_context:
+        context = {"role": "system", "content": project_context}
+        tokens = counter.message(context)
+        remaining = budget - used
+        if tokens <= remaining:
+            context_messages.append(context)
+            used += tokens
+        elif remaining - MESSAGE_OVERHEAD >= _MIN_CONTEXT_TOKENS:
+            context = {"role": "system",
+                       "content": counter.truncate(project_context, remaining - MESSAGE_OVERHEAD)}
+            context_messages.append(context)
+            used += counter.message(context)
+            dropped_tokens += tokens - counter.message(context)
+            truncated.append("project_context")
+        else:
+            dropped_tokens += tokens
+            truncated.append("project_context")
+
+    # Context sits right after the system prompt: both change rarely, which
+    # keeps the request prefix stable across turns.
+    messages = [system] + context_messages + summary_messages + kept + [latest]
+    stats = {
+        "budget": budget,
+        "packed_tokens": used,
+        "dropped_tokens": dropped_tokens,
+        "dropped_messages": len(dropped_messages),
+        "truncated": truncated,
+        "tokenizer": counter.tokenizer,
+    }
+    return messages, stats
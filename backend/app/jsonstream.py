@@ -0,0 +1,133 @@
+"""
+Incremental parsing of a JSON object that arrives in chunks (e.g. model output).
+
+`JSONStreamParser.feed(chunk)` returns the values completed by that chunk:
+each element of a top-level array as soon as it closes, and every other
+top-level value once it is complete. The document is scanned once; only the
+value currently being assembled is kept in memory.
+
+    parser = JSONStreamParser()
+    for chunk in ['{"plan": ["a", "b', '"], "summary": "s"}']:
+        for key, index, value in parser.feed(chunk):
+            ...  # ("plan", 0, "a"), ("plan", 1, "b"), ("summary", None, "s")
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+Event = Tuple[str, Optional[int], Any]
+
+_WHITESPACE = " \t\r\n"
+
+class _Frame:
+    __slots__ = ("array", "key", "index", "want_key")
+
+    def __init__(self, array: bool):
+        self.array = array
+        self.key: Optional[str] = None
+        self.index = 0
+        self.want_key = not array
+
+class JSONStreamParser:
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._token_start: Optional[int] = None  # current string or scalar
+        self._string_is_key = False
+        self._scalar = False
+        self._capture: Optional[Tuple[int, int, str, Optional[int]]] = None  # start, depth, key, index
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Event]:
+        events: List[Event] = []
+        self._text += chunk
+        text, i = self._text, self._pos
+        while i < len(text) and not self.done:
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._end_string(i + 1, events)
+                i += 1
+                continue
+            if self._scalar:
+                if c not in ",}]" and c not in _WHITESPACE:
+                    i += 1
+                    continue
+                self._scalar = False
+                self._end_value(i, events)  # then handle the delimiter below
+
+            if not self._stack and c != "{":
+                pass  # leading text or code fences before the document
+            elif c in _WHITESPACE or c == ":":
+                pass
+            elif c == '"':
+                top = self._stack[-1]
+                self._string_is_key = not top.array and top.want_key
+                if not self._string_is_key:
+                    self._begin_value(i)
+                self._token_start = i
+                self._in_string = True
+            elif c in "{[":
+                if self._stack:
+                    self._begin_value(i, array=c == "[")
+                self._stack.append(_Frame(array=c == "["))
+            elif c in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                else:
+                    self._end_value(i + 1, events)
+            elif c == ",":
+                top = self._stack[-1]
+                if top.array:
+                    top.index += 1
+                else:
+                    top.want_key = True
+            else:
+                self._begin_value(i)
+                self._token_start = i
+                self._scalar = True
+            i += 1
+
+        # Keep only what an unfinished value still needs.
+        keep = min(p for p in (i, self._token_start, self._capture and self._capture[0]) if p is not None)
+        self._text, self._pos = text[keep:], i - keep
+        if self._token_start is not None:
+            self._token_start -= keep
+        if self._capture:
+            start, depth, key, index = self._capture
+            self._capture = (start - keep, depth, key, index)
+        return events
+
+    def _begin_value(self, start: int, array: bool = False):
+        if self._capture:
+            return
+        depth = len(self._stack)
+        top = self._stack[-1]
+        if depth == 1 and not top.array and not array:  # top-level arrays emit per element
+            self._capture = (start, depth, top.key, None)
+        elif depth == 2 and top.array and not self._stack[0].array:
+            self._capture = (start, depth, self._stack[0].key, top.index)
+
+    def _end_string(self, end: int, events: List[Event]):
+        if self._string_is_key:
+            top = self._stack[-1]
+            top.key = json.loads(self._text[self._token_start:end])
+            top.want_key = False
+            self._token_start = None
+            return
+        self._end_value(end, events)
+
+    def _end_value(self, end: int, events: List[Event]):
+        self._token_start = None
+        if self._capture and len(self._stack) == self._capture[1]:
+            start, _, key, index = self._capture
+            self._capture = None
+            events.append((key, index, json.loads(self._text[start:end])))
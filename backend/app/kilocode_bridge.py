@@ -1,94 +1,355 @@
 """
-Kilocode Bridge — run the Node-based Kilocode agent as a subprocess.
+Kilocode Bridge — run the Node-based Kilocode agent in long-lived subprocesses.
 Allows the Python backend to call Kilocode's original JS/TS reasoning logic.
+
+A small pool of `node bridge.js --server` workers is kept warm; requests are
+sent as JSON lines on stdin and answered with tagged JSON lines on stdout, so
+Node startup and `dist/index.js` loading are paid once per worker instead of
+once per request.
 """
 
-import subprocess, json, tempfile, os, sys, asyncio
+import asyncio, itertools, json, logging, time
+from collections import deque
 from pathlib import Path
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, Optional, Set
+
+from .metrics import measure_stream, span, span_seconds, timed
+from .settings import settings
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 AGENT_DIR = BASE_DIR / "kilocode_core" / "agent"
 
-def run_kilocode_agent(mode: str, input_data: dict) -> dict:
-    """
-    Executes the Kilocode agent with JSON input.
-    Requires Node.js and built packages (tsc compiled JS).
+logger = logging.getLogger(__name__)
+
+# Agent results arrive as a single JSON line; allow large ones.
+_LINE_LIMIT = 16 * 1024 * 1024
+_PING_TIMEOUT = 5.0
+
+class BridgeError(RuntimeError):
+    """The agent failed, timed out, or its worker process died."""
+
+class BridgeWorker:
+    """One `node bridge.js --server` process speaking the JSON-lines protocol."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, script_path: Path):
+        self.script_path = script_path
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.requests = 0
+        self.broken = False
+        self._pending: Dict[str, asyncio.Queue] = {}
+        self._stderr = deque(maxlen=50)
+        self._tasks = []
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None and not self.broken
+
+    async def start(self):
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                "node",
+                str(self.script_path),
+                "--server",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=str(AGENT_DIR),
+                limit=_LINE_LIMIT,
+            )
+        except OSError as e:
+            self.broken = True
+            raise BridgeError(f"Failed to start Kilocode agent: {e}") from e
+        self._tasks = [
+            asyncio.create_task(self._read_stdout()),
+            asyncio.create_task(self._read_stderr()),
+        ]
+
+    async def _read_stdout(self):
+        try:
+            async for line in self.proc.stdout:
+                started = time.perf_counter()
+                try:
+                    msg = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # not protocol traffic
+                if not isinstance(msg, dict):
+                    continue
+                # Histogram only: this task outlives the request that spawned the worker.
+                span_seconds.observe(time.perf_counter() - started, span="bridge.parse")
+                queue = self._pending.get(str(msg.get("id")))
+                if queue is not None:
+                    queue.put_nowait(msg)
+        finally:
+            # Worker exited (or the pipe broke): fail everything still waiting.
+            self.broken = True
+            if len(self._tasks) > 1:
+                await asyncio.wait([self._tasks[1]], timeout=1)
+            error = {"type": "error", "error": f"Kilocode agent exited: {self.stderr_tail()}"}
+            for queue in self._pending.values():
+                queue.put_nowait(error)
+
+    async def _read_stderr(self):
+        async for line in self.proc.stderr:
+            self._stderr.append(line.decode("utf-8", errors="ignore").rstrip())
+
+    def stderr_tail(self) -> str:
+        return "\n".join(self._stderr)
+
+    async def request(self, payload: dict, timeout: float) -> AsyncGenerator[dict, None]:
+        """Send one request and yield its tagged responses until result/error/pong."""
+        if not self.alive:
+            raise BridgeError("Kilocode agent worker is not running")
+
+        req_id = str(next(self._ids))
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[req_id] = queue
+        if self.broken:  # died before we registered
+            self._pending.pop(req_id, None)
+            raise BridgeError(f"Kilocode agent exited: {self.stderr_tail()}")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            self.proc.stdin.write((json.dumps({**payload, "id": req_id}) + "\n").encode())
+            await self.proc.stdin.drain()
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                msg = await asyncio.wait_for(queue.get(), remaining)
+                yield msg
+                if msg.get("type") in ("result", "error", "pong"):
+                    return
+        except asyncio.TimeoutError:
+            # The agent may still be running; this worker can't be trusted anymore.
+            self.broken = True
+            raise BridgeError(f"Kilocode agent timed out after {timeout:.0f}s")
+        except (BrokenPipeError, ConnectionResetError) as e:
+            self.broken = True
+            raise BridgeError(f"Kilocode agent pipe closed: {e}") from e
+        finally:
+            self._pending.pop(req_id, None)
+
+    async def ping(self, timeout: float = _PING_TIMEOUT) -> bool:
+        ok = False
+        try:
+            async for msg in self.request({"type": "ping"}, timeout):
+                ok = msg.get("type") == "pong"
+        except BridgeError:
+            return False
+        return ok
+
+    async def stop(self):
+        if self.proc is not None and self.proc.returncode is None:
+            try:
+                self.proc.stdin.close()
+                await asyncio.wait_for(self.proc.wait(), 2)
+            except Exception:
+                try:
+                    self.proc.kill()
+                except ProcessLookupError:
+                    pass  # exited (and was reaped) since the wait timed out
+                await self.proc.wait()
+        for task in self._tasks:
+            task.cancel()
+
+class BridgePool:
+    """Fixed-size pool of bridge workers.
+
+    Each worker serves one request at a time. Idle workers sit in a FIFO queue,
+    so waiting requests are dispatched in arrival order. Workers are replaced
+    when they crash, fail a health check, time out, or reach `max_requests`.
     """
 
-    # Write input to a temporary JSON file
-    with tempfile.NamedTemporaryFile(mode="w+", suffix=".json", delete=False) as f:
-        json.dump({"mode": mode, "input": input_data}, f)
-        f.flush()
-        input_path = f.name
+    def __init__(self, size: int, max_requests: int, request_timeout: float,
+                 health_interval: float, script_path: Path = AGENT_DIR / "bridge.js"):
+        self.size = max(1, size)
+        self.max_requests = max_requests
+        self.request_timeout = request_timeout
+        self.health_interval = health_interval
+        self.script_path = script_path
+        self.restarts = 0
+        self._workers: Set[BridgeWorker] = set()  # idle and busy, so close() reaches them all
+        self._recycling: Set[asyncio.Task] = set()
+        self._idle: Optional[asyncio.Queue] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._start_lock: Optional[asyncio.Lock] = None
 
-    script_path = AGENT_DIR / "bridge.js"  # Node.js bridge script
+    @property
+    def started(self) -> bool:
+        return self._idle is not None
 
-    try:
-        # Run Node subprocess
-        cmd = ["node", str(script_path), input_path]
-        proc = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd=str(AGENT_DIR),
-            timeout=60,
-        )
-
-        if proc.returncode != 0:
-            raise RuntimeError(f"Kilocode agent failed: {proc.stderr}")
-
-        # Parse output JSON
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "restarts": self.restarts,
+        }
+
+    async def _spawn(self) -> BridgeWorker:
+        """A started worker, or a dead one holding the slot if it failed to start."""
+        worker = BridgeWorker(self.script_path)
+        self._workers.add(worker)
         try:
-            return json.loads(proc.stdout)
-        except json.JSONDecodeError:
-            return {"error": "Non-JSON response", "raw": proc.stdout}
+            with span("bridge.spawn"):
+                await worker.start()
+        except BridgeError as e:
+            logger.warning("%s", e)
+        return worker
 
-    except Exception as e:
-        return {"error": str(e)}
+    async def start(self):
+        """Spawn all workers (warm-up). Safe to call more than once."""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.started:
+                return
+            workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+            self._idle = asyncio.Queue()
+            for worker in workers:
+                self._idle.put_nowait(worker)
+            if self.health_interval > 0:
+                self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if not self.started:
+            return
+        if self._health_task:
+            self._health_task.cancel()
+        for task in list(self._recycling):
+            task.cancel()
+        if self._recycling:
+            await asyncio.wait(self._recycling)
+        # Busy workers too: their requests fail, their processes don't outlive us
+        workers, self._workers = list(self._workers), set()
+        await asyncio.gather(*(worker.stop() for worker in workers), return_exceptions=True)
+        self._idle = None
+
+    async def _replace(self, worker: BridgeWorker) -> BridgeWorker:
+        self._workers.discard(worker)
+        await worker.stop()
+        self.restarts += 1
+        return await self._spawn()
 
-    finally:
+    async def _recycle(self, worker: BridgeWorker):
         try:
-            os.remove(input_path)
-        except:
-            pass
+            replacement = await self._replace(worker)
+        except Exception:
+            logger.exception("Kilocode agent worker restart failed")
+            replacement = BridgeWorker(self.script_path)
+            replacement.broken = True  # keeps the slot; _acquire retries the spawn
+        if self._idle is None:  # closed meanwhile
+            self._workers.discard(replacement)
+            await replacement.stop()
+            return
+        self._idle.put_nowait(replacement)
 
-async def stream_kilocode_agent(mode: str, input_data: dict) -> AsyncGenerator[str, None]:
+    async def _acquire(self) -> BridgeWorker:
+        await self.start()
+        worker = await self._idle.get()
+        if not worker.alive:
+            worker = await self._replace(worker)
+        if not worker.alive:
+            self._idle.put_nowait(worker)
+            raise BridgeError(f"Kilocode agent unavailable: {worker.stderr_tail() or 'failed to start'}")
+        return worker
+
+    def _release(self, worker: BridgeWorker):
+        worker.requests += 1
+        if self._idle is None:
+            return  # closed while the request ran; close() stopped the worker
+        if not worker.alive or (self.max_requests and worker.requests >= self.max_requests):
+            # Restart off the request path; the slot returns to the queue when ready.
+            task = asyncio.create_task(self._recycle(worker))
+            self._recycling.add(task)
+            task.add_done_callback(self._recycling.discard)
+        else:
+            self._idle.put_nowait(worker)
+
+    async def _check(self, worker: BridgeWorker):
+        if worker.alive and await worker.ping():
+            if self._idle is not None:
+                self._idle.put_nowait(worker)
+            return
+        logger.warning("Kilocode agent worker unhealthy, restarting")
+        await self._recycle(worker)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            # Check only workers idle right now; busy ones are checked next round.
+            idle = []
+            while not self._idle.empty():
+                idle.append(self._idle.get_nowait())
+            # All at once, each back in the queue as soon as it answers, so a
+            # slow or hung worker doesn't hold the others from waiting requests
+            await asyncio.gather(*(self._check(worker) for worker in idle))
+
+    async def stream(self, mode: str, input_data: dict, stream: bool = True) -> AsyncGenerator[dict, None]:
+        """Run the agent on a pooled worker, yielding its tagged responses."""
+        worker = await self._acquire()
+        done = False
+        try:
+            payload = {"type": "run", "mode": mode, "input": input_data, "stream": stream}
+            async for msg in worker.request(payload, self.request_timeout):
+                done = msg.get("type") in ("result", "error")
+                yield msg
+        finally:
+            if not done:
+                # Caller went away mid-run; the agent is still busy, so don't reuse it.
+                worker.broken = True
+            self._release(worker)
+
+    async def run(self, mode: str, input_data: dict) -> dict:
+        """Run the agent to completion and return its result."""
+        last = {}
+        async for msg in self.stream(mode, input_data, stream=False):
+            last = msg
+        if last.get("type") == "error":
+            raise BridgeError(last.get("error") or "Kilocode agent failed")
+        if last.get("type") != "result":
+            raise BridgeError("Kilocode agent returned no result")
+        return last.get("result")
+
+bridge_pool = BridgePool(
+    size=settings.bridge_pool_size,
+    max_requests=settings.bridge_max_requests,
+    request_timeout=settings.bridge_request_timeout,
+    health_interval=settings.bridge_health_interval,
+    script_path=Path(settings.bridge_script) if settings.bridge_script else AGENT_DIR / "bridge.js",
+)
+
+@timed("bridge.run")
+async def run_kilocode_agent(mode: str, input_data: dict) -> dict:
     """
-    Asynchronously stream output from the Kilocode agent subprocess.
-    Yields each line as it becomes available (JSON or text tokens).
+    Executes the Kilocode agent with JSON input on a pooled worker.
+    Requires Node.js and built packages (tsc compiled JS).
     """
-    with tempfile.NamedTemporaryFile(mode="w+", suffix=".json", delete=False) as f:
-        json.dump({"mode": mode, "input": input_data}, f)
-        f.flush()
-        input_path = f.name
+    try:
+        result = await bridge_pool.run(mode, input_data)
+    except Exception as e:
+        return {"error": str(e)}
 
-    script_path = AGENT_DIR / "bridge.js"  # streaming-capable bridge
+    if not isinstance(result, dict):
+        return {"error": "Non-JSON response", "raw": result}
+    return result
 
+async def stream_kilocode_agent(mode: str, input_data: dict) -> AsyncGenerator[str, None]:
+    """
+    Asynchronously stream output from a pooled Kilocode agent worker.
+    Yields each delta as a JSON line ({"delta": ...}), then the final result.
+    """
     try:
-        process = await asyncio.create_subprocess_exec(
-            "node",
-            str(script_path),
-            input_path,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=str(AGENT_DIR),
-        )
-
-        async for line in process.stdout:
-            line_str = line.decode("utf-8", errors="ignore").strip()
-            if line_str:
-                yield line_str  # each line may be JSON or raw token
-
-        await process.wait()
-
-        # Check for errors
-        if process.returncode != 0:
-            stderr = await process.stderr.read()
-            yield f"Error: {stderr.decode('utf-8', errors='ignore')}"
-
-    finally:
-        try:
-            os.remove(input_path)
-        except:
-            pass
\ No newline at end of file
+        async for msg in measure_stream("bridge.stream", bridge_pool.stream(mode, input_data)):
+            kind = msg.get("type")
+            if kind == "delta":
+                yield json.dumps({"delta": msg.get("delta", "")})
+            elif kind == "result":
+                result = msg.get("result")
+                yield json.dumps(result) if isinstance(result, (dict, list)) else str(result)
+            elif kind == "error":
+                yield f"Error: {msg.get('error', '')}"
+    except BridgeError as e:
+        yield f"Error: {e}"
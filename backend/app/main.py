@@ -1,15 +1,31 @@
 import os
-from fastapi import FastAPI, HTTPException
+import json
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from .schemas import ChatRequest, ChatResponse
+from pydantic import ValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from .schemas import ChatBatchRequest, ChatMessage, ChatRequest, ChatResponse
 from .kilo_adapter import get_mode, build_system_prompt
 from .settings import settings
-from openai import OpenAI
+from .context import get_counter, pack_messages
+from .prompts import canonical_json
+from .cache import bypass, cache_key, response_cache
+from .singleflight import flights
+from .scheduler import Overloaded, scheduler
+from .metrics import REGISTRY, MetricsMiddleware, measure_stream, request_timings
+from .streaming import cancel_on_disconnect, iterate_in_thread
+from .sse import resume_response, sse_response
+from .sessions import maybe_compact, session_store, split_summary
+from .providers.openai import get_provider
+from . import openapi_snapshot, startup
 
-client = OpenAI(api_key=settings.openai_api_key)
+provider = get_provider()
 
 app = FastAPI(title="Kilocode Standalone Chat API")
+openapi_snapshot.install(app, settings.openapi_snapshot)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,35 +34,145 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Include new routers
 from .routes.plan import router as plan_router
 from .routes.execute import router as execute_router
+from .routes.sessions import router as sessions_router
+from .routes.health import router as health_router
 app.include_router(plan_router)
 app.include_router(execute_router)
+app.include_router(sessions_router)
+app.include_router(health_router)
+
+@app.on_event("startup")
+async def warm_up():
+    # Bridge workers, OpenAI client, OpenAPI schema: in the background, see app.startup
+    startup.start_warm_up(app)
+
+@app.on_event("shutdown")
+async def stop_bridge_pool():
+    from .kilocode_bridge import bridge_pool
+    await startup.wait_warm_up()
+    await bridge_pool.close()
+
+@app.on_event("shutdown")
+def stop_search_pool():
+    from .tools import search
+    search.shutdown()
 
 @app.get("/")
 def read_root():
     return {"message": "KiloCode Standalone Backend"}
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
-    from .kilocode_bridge import run_kilocode_agent
+class PromptCompiler:
+    """Compiled system prompts and context blocks, once per distinct mode/rules/context.
 
-    # Try Kilocode agent first (maximum fidelity)
-    agent_output = run_kilocode_agent(req.mode, {
-        "messages": [m.dict() for m in req.messages],
-        "project_context": req.project_context
-    })
+    /chat/batch shares one across its items, so a batch of per-file reviews
+    with the same rules and project context compiles them only once.
+    """
+
+    def __init__(self):
+        self._system: Dict[tuple, str] = {}
+        self._context: Dict[str, str] = {}
+
+    def system_prompt(self, mode_name: str, custom_rules: Optional[Dict[str, str]]) -> str:
+        key = (mode_name, canonical_json(custom_rules) if custom_rules else "")
+        prompt = self._system.get(key)
+        if prompt is None:
+            # Mode template + rules (stable across turns)
+            prompt = self._system[key] = build_system_prompt(mode_name, None, custom_rules)
+        return prompt
+
+    def project_context(self, context: Optional[Dict[str, Any]]) -> Optional[str]:
+        if not context:
+            return None
+        body = canonical_json(context)
+        block = self._context.get(body)
+        if block is None:
+            block = self._context[body] = f"# Context\n{body}"
+        return block
+
+def chat_messages(req: ChatRequest, mode, compiler: Optional[PromptCompiler] = None,
+                  related: Optional[str] = None) -> tuple:
+    """Build the OpenAI messages for a request within the token budget.
+
+    Returns (messages, packing stats). The request must contain a user message.
+    `related` is related_context()'s result, which the caller also keys the
+    response cache on.
+    """
+    compiler = compiler or PromptCompiler()
+    latest_message = [msg for msg in req.messages if msg.role == "user"][-1].content
+
+    # Compiled system prompt: mode template + rules (stable across turns)
+    system_prompt = compiler.system_prompt(mode.name, req.custom_rules)
+
+    # Get conversation history (all messages except the last user message); a
+    # session's summary is packed apart so it outlives the oldest turns
+    summary, conversation_history = split_summary([m.dict() for m in req.messages[:-1]])
+
+    # Project context as sent, then the code and outline related to this turn
+    context = [compiler.project_context(req.project_context), related]
+    return pack_messages(system_prompt, conversation_history,
+                         {"role": "user", "content": latest_message},
+                         "\n\n".join(c for c in context if c) or None, summary=summary)
+
+def related_context(req: ChatRequest) -> Optional[str]:
+    """The code most relevant to the latest user message, then the project
+    outline (packed last, so it is what gets truncated first), as one block.
+
+    Retrieval reads and scores project files: call it in the threadpool.
+    """
+    user_messages = [msg for msg in req.messages if msg.role == "user"]
+    if not user_messages:
+        return None
+    query = user_messages[-1].content
+    parts = [retrieved_code(req.project_context, query), project_outline(req.project_context, query)]
+    return "\n\n".join(p for p in parts if p) or None
+
+def _retrieval_path(project_context: Optional[Dict[str, Any]]) -> Optional[str]:
+    path = (project_context or {}).get("path")
+    return path if settings.retrieval_enabled and isinstance(path, str) else None
+
+def retrieved_code(project_context: Optional[Dict[str, Any]], query: str) -> Optional[str]:
+    """Chunks of the project at project_context["path"] relevant to `query`, as a context block."""
+    path = _retrieval_path(project_context)
+    if path is None:
+        return None
+    from .tools.fs import FileSystemTool
+    from .tools.retrieval import format_chunks
+
+    # Never waits for indexing: a new project gets chunks once its background build is done
+    return format_chunks(FileSystemTool().retrieve(query, path).get("chunks", []))
+
+def project_outline(project_context: Optional[Dict[str, Any]], query: str) -> Optional[str]:
+    """Symbol outline of the project at project_context["path"], ranked against `query`, as a context block."""
+    path = (project_context or {}).get("path")
+    if not isinstance(path, str):
+        return None
+    from .tools.fs import FileSystemTool
+    from .tools.outline import format_outline
+
+    # Cached per file: only files changed since the last turn are parsed again
+    return format_outline(FileSystemTool().outline(path, query).get("text"))
 
-    if "error" not in agent_output:
-        # Use the Kilocode agent's response
-        return ChatResponse(
-            content=agent_output.get("content", ""),
-            meta={"mode": req.mode, "source": "kilocode_agent"}
-        )
+def request_tokens(req: ChatRequest, prepared: Optional[tuple] = None) -> int:
+    """Estimated prompt + reply tokens of a chat request, for admission control.
 
-    # Fallback to OpenAI directly if bridge fails
+    `prepared` is chat_messages()'s result; without it the raw messages are counted.
+    """
+    if prepared is not None:
+        prompt_tokens = prepared[1]["packed_tokens"]
+    else:
+        prompt_tokens = sum(get_counter().count(m.content) for m in req.messages)
+    return prompt_tokens + settings.scheduler_output_tokens
+
+async def openai_chat(req: ChatRequest, prepared: Optional[tuple] = None) -> ChatResponse:
+    """Answer a chat request with OpenAI directly using the mode's prompt template.
+
+    `prepared` is chat_messages()'s result when the caller already built it.
+    """
     mode = get_mode(req.mode)
 
     # Extract the latest user message
@@ -54,101 +180,462 @@ async def chat(req: ChatRequest):
     if not user_messages:
         return ChatResponse(content="No user message found", meta={"error": "no_user_message"})
 
-    latest_message = user_messages[-1].content
+    if prepared is None:
+        related = await run_in_threadpool(related_context, req)
+        prepared = await run_in_threadpool(chat_messages, req, mode, None, related)
+    messages, context_stats = prepared
+
+    response_text = await provider.acomplete(messages, temperature=0.2)
+    return ChatResponse(content=response_text,
+                        meta={"mode": mode.name, "source": "openai_fallback", "context": context_stats})
+
+async def kilocode_chat(req: ChatRequest, prepared: Optional[tuple] = None) -> ChatResponse:
+    """Answer a chat request with the Kilocode agent; raises if the agent fails.
+
+    `prepared` is chat_messages()'s result: the agent gets the same packed
+    messages as the fallback, not the whole unbounded conversation.
+    """
+    from .kilocode_bridge import run_kilocode_agent, BridgeError
+
+    messages, context_stats = prepared or ([m.dict() for m in req.messages], None)
+    agent_output = await asyncio.wait_for(run_kilocode_agent(req.mode, {
+        "messages": messages,
+        "project_context": req.project_context
+    }), settings.chat_bridge_timeout)
+
+    if "error" in agent_output:
+        raise BridgeError(agent_output["error"])
+    meta = {"mode": req.mode, "source": "kilocode_agent"}
+    if context_stats is not None:
+        meta["context"] = context_stats
+    return ChatResponse(content=agent_output.get("content", ""), meta=meta)
+
+def chat_cache_key(req: ChatRequest, endpoint: str, related: Optional[str]) -> str:
+    """The response cache key of a chat request.
+
+    `related` (related_context()'s result) is part of the prompt, so the key
+    covers the retrieved code and outline as read now: editing one of those
+    files is a miss, not a stale answer.
+    """
+    return cache_key(
+        endpoint=endpoint,
+        model=settings.model,
+        mode=req.mode,
+        messages=[m.dict() for m in req.messages],
+        project_context=req.project_context,
+        custom_rules=req.custom_rules,
+        temperature=0.2,
+        related=related,
+    )
+
+async def cached_chat(req: ChatRequest, use_cache: bool = True, kind: Optional[str] = None,
+                      deadline: Optional[float] = None, compiler: Optional[PromptCompiler] = None) -> ChatResponse:
+    """Answer `req` from the response cache or a single-flight agent/OpenAI run.
+
+    Retrieval runs once, for both the cache key and the prompt; the prompt
+    itself is only built (with `compiler`, if given) for a run that is
+    actually computed, not for cache hits or callers joining a run. The
+    returned response may be shared with coalesced callers; copy before mutating.
+    """
+    related = await run_in_threadpool(related_context, req)
+    key = chat_cache_key(req, "chat", related)
+    if use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return ChatResponse(content=cached["content"], meta={**cached["meta"], "cache": "hit"})
+
+    async def compute() -> ChatResponse:
+        mode = get_mode(req.mode)
+        packed = None
+        if any(msg.role == "user" for msg in req.messages):
+            # Once, for both admission and the fallback; counting tokens, so off the loop
+            packed = await run_in_threadpool(chat_messages, req, mode, compiler, related)
+        async with scheduler.admit(kind or mode.name, request_tokens(req, packed), deadline):
+            response = await answer_chat(req, packed)
+        if "error" not in response.meta:
+            response_cache.set(key, response.dict())
+        return response
+
+    # Identical concurrent requests share one agent/OpenAI run
+    return await flights.do(key, compute)
+
+def session_turn(req: ChatRequest) -> Tuple[ChatRequest, Optional[List[Dict[str, str]]]]:
+    """Expand a session request into the whole conversation.
+
+    Returns the request to answer and the new messages to store once it is
+    answered (None without a session). Raises 404 for an unknown or expired
+    session.
+    """
+    if req.session_id is None:
+        return req, None
+    session = session_store.get(req.session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    # Stored messages were validated when they came in
+    history = [ChatMessage.construct(**m) for m in session.history()]
+    full = ChatRequest.construct(messages=history + req.messages, mode=req.mode,
+                                 project_context=req.project_context, custom_rules=req.custom_rules,
+                                 session_id=None)
+    return full, [m.dict() for m in req.messages]
+
+def record_turn(session_id: str, turn: List[Dict[str, str]], reply: str) -> Optional[Dict[str, Any]]:
+    """Store an answered turn and compact the session in the background if it grew too long."""
+    session = session_store.append(session_id, turn + [{"role": "assistant", "content": reply}])
+    if session is None:
+        return None  # deleted or expired while the turn ran
+    maybe_compact(session)
+    return {"id": session.id, "messages": session.end, "summarized": session.start}
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, request: Request):
+    full, turn = session_turn(req)
+    response = await cached_chat(full, use_cache=not bypass(request))
+    # A copy: coalesced callers share `response`, and each reports its own timings
+    meta = {**response.meta, "timings": request_timings()}
+    if turn is not None and "error" not in response.meta:
+        meta["session"] = record_turn(req.session_id, turn, response.content)
+    return ChatResponse(content=response.content, meta=meta)
+
+@app.post("/chat/batch")
+async def chat_batch(batch: ChatBatchRequest, request: Request):
+    """Answer many independent chat requests, streaming NDJSON results in completion order.
+
+    Each line is {"index", "status": "ok", "content", "meta"} or {"index",
+    "status": "error", "error", "code"}; a failed item never aborts the batch.
+    The last line is {"done": true, "total", "ok", "failed"}.
+    """
+    if len(batch.requests) > settings.chat_batch_max_items:
+        raise HTTPException(status_code=422,
+                            detail=f"Batch has {len(batch.requests)} items; the limit is {settings.chat_batch_max_items}")
+    limit = max(1, min(batch.concurrency or settings.chat_batch_concurrency, settings.chat_batch_concurrency))
+    gate = asyncio.Semaphore(limit)
+    compiler = PromptCompiler()
+    use_cache = not bypass(request)
+
+    async def answer(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        async with gate:
+            try:
+                item_req = ChatRequest.parse_obj(item)
+            except ValidationError as e:
+                return {"index": index, "status": "error", "error": e.errors(), "code": 422}
+            try:
+                req, turn = session_turn(item_req)
+                response = await cached_chat(req, use_cache, kind="batch",
+                                             deadline=settings.chat_batch_deadline, compiler=compiler)
+                meta = response.meta
+                if turn is not None and "error" not in meta:
+                    meta = {**meta, "session": record_turn(item_req.session_id, turn, response.content)}
+                return {"index": index, "status": "ok", "content": response.content, "meta": meta}
+            except Overloaded as e:
+                return {"index": index, "status": "error", "error": str(e), "code": 503,
+                        "retry_after": e.retry_after}
+            except HTTPException as e:
+                return {"index": index, "status": "error", "error": e.detail, "code": e.status_code}
+            except Exception as e:
+                return {"index": index, "status": "error", "error": provider.map_error(e), "code": 500}
+
+    async def results():
+        tasks = [asyncio.create_task(answer(i, item)) for i, item in enumerate(batch.requests)]
+        ok = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                ok += item["status"] == "ok"
+                yield json.dumps(item) + "\n"
+            yield json.dumps({"done": True, "total": len(tasks), "ok": ok, "failed": len(tasks) - ok}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(cancel_on_disconnect(request, results()), media_type="application/x-ndjson")
+
+# Agent runs that lost the race to the fallback, still finishing
+_detached_agents: Set[asyncio.Task] = set()
+
+def _detach(agent: asyncio.Task):
+    """Let a losing agent run finish and drop its result.
+
+    Cancelling it would abandon the request mid-protocol, and the pool
+    replaces a worker that stopped mid-request with a new Node process.
+    """
+    _detached_agents.add(agent)
+
+    def done(task: asyncio.Task):
+        _detached_agents.discard(task)
+        if not task.cancelled():
+            task.exception()  # nobody awaits it: mark a failure as retrieved
 
-    # Get system prompt from mode (loads Kilocode templates)
-    system_prompt = mode.system_prompt(req.project_context)
+    agent.add_done_callback(done)
 
-    # Get conversation history (all messages except the last user message)
-    conversation_history = [m.dict() for m in req.messages[:-1]]
+async def answer_chat(req: ChatRequest, prepared: Optional[tuple] = None) -> ChatResponse:
+    # Try Kilocode agent first (maximum fidelity). If it hasn't answered within
+    # the latency budget, race it against the OpenAI fallback; first success wins.
+    agent = asyncio.create_task(kilocode_chat(req, prepared))
+    done, _ = await asyncio.wait({agent}, timeout=settings.bridge_latency_budget)
+    if agent in done and not agent.exception():
+        return agent.result()
 
-    # Process with OpenAI directly using the prompt template
-    messages = [{"role": "system", "content": system_prompt}]
-    if conversation_history:
-        messages.extend(conversation_history)
-    messages.append({"role": "user", "content": latest_message})
+    has_user_message = any(msg.role == "user" for msg in req.messages)
+    if agent not in done and not has_user_message:
+        # Nothing to hand the fallback; give the agent its full stage timeout.
+        await asyncio.wait({agent})
+        if not agent.exception():
+            return agent.result()
 
-    try:
-        resp = client.chat.completions.create(
-            model=settings.model,
-            messages=messages,
-            temperature=0.2,
-        )
-        response_text = resp.choices[0].message.content or ""
-        return ChatResponse(content=response_text, meta={"mode": mode.name, "source": "openai_fallback"})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    fallback = asyncio.create_task(asyncio.wait_for(openai_chat(req, prepared), settings.openai_timeout))
+    pending = {fallback} if agent.done() else {agent, fallback}
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                if agent in pending:
+                    _detach(agent)
+                elif fallback in pending:
+                    fallback.cancel()
+                return task.result()
+            if task is fallback:
+                error = task.exception()
+
+    detail = str(error) or type(error).__name__
+    raise HTTPException(status_code=500, detail=detail)
 
 @app.post("/chat/stream")
-async def chat_stream(req: ChatRequest):
+async def chat_stream(req: ChatRequest, request: Request):
+    resumed = resume_response(request, error_message=provider.map_error)
+    if resumed is not None:
+        return resumed
+    session_id = req.session_id
+    req, turn = session_turn(req)
     mode = get_mode(req.mode)
 
     # Extract the latest user message
     user_messages = [msg for msg in req.messages if msg.role == "user"]
     if not user_messages:
-        async def error_generate():
-            yield "data: Error: No user message found\n\n"
-            yield "data: [DONE]\n\n"
+        async def no_user_message():
+            yield ("error", {"type": "error", "error": "No user message found"})
+
+        return sse_response(request, no_user_message())
 
-        return StreamingResponse(
-            error_generate(),
-            media_type="text/event-stream",
-            headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
-        )
+    related = await run_in_threadpool(related_context, req)
+    key = chat_cache_key(req, "chat/stream", related)
+    cached = None if bypass(request) else response_cache.get(key)
+    if cached is not None:
+        if turn is not None:
+            record_turn(session_id, turn, "".join(cached))
 
-    latest_message = user_messages[-1].content
+        async def replay():
+            # The whole recorded reply as one event: as fast as the network takes it
+            yield "".join(cached)
 
-    # Get system prompt from mode (loads Kilocode templates)
-    system_prompt = mode.system_prompt(req.project_context)
+        return sse_response(request, replay(), headers={"X-Cache": "HIT"})
 
-    # Get conversation history (all messages except the last user message)
-    conversation_history = [m.dict() for m in req.messages[:-1]]
+    messages, context_stats = await run_in_threadpool(chat_messages, req, mode, None, related)
 
-    # Build messages array
-    messages = [{"role": "system", "content": system_prompt}]
-    if conversation_history:
-        messages.extend(conversation_history)
-    messages.append({"role": "user", "content": latest_message})
+    # Admit before responding so a shed request gets a real 503. Joining an
+    # identical in-flight stream needs no slot of its own.
+    slot = None
+    if not flights.in_flight(key):
+        slot = await scheduler.acquire(mode.name, context_stats["packed_tokens"] + settings.scheduler_output_tokens)
+        if flights.in_flight(key):  # started by another request while we queued
+            slot.release()
+            slot = None
 
-    async def generate():
+    async def record():
         try:
-            # Use streaming response from OpenAI
-            response = client.chat.completions.create(
-                model=settings.model,
-                messages=messages,
-                temperature=0.2,
-                stream=True,
-            )
-
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    # Send each token as a Server-Sent Event
-                    yield f"data: {chunk.choices[0].delta.content}\n\n"
-
-            # Send end marker
-            yield "data: [DONE]\n\n"
-
-        except Exception as e:
-            yield f"data: Error: {str(e)}\n\n"
-
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-        }
-    )
+            tokens = []
+            upstream = provider.achat_completion_stream(messages, temperature=0.2)
+            async for token in measure_stream("provider.stream", upstream):
+                tokens.append(token)
+                yield token
+            # Only complete streams are cached (not errors or client disconnects)
+            response_cache.set(key, tokens)
+        finally:
+            if slot is not None:
+                slot.release()
+
+    # Identical concurrent streams share one upstream call (late joiners are replayed).
+    # Subscribe now, with no await since the check above, so `slot` goes to our own flight.
+    tokens = flights.stream(key, record)
+
+    async def relay():
+        reply = []
+        async for token in tokens:
+            reply.append(token)
+            yield token
+
+        # Only a complete reply becomes part of the session; the client can
+        # still fetch the end of it by resuming
+        if turn is not None:
+            record_turn(session_id, turn, "".join(reply))
+
+    # Token deltas coalesced into `delta` events, then `done` (or `error`).
+    # Generation continues if the connection drops; resume with Last-Event-ID.
+    return sse_response(request, relay(), error_message=provider.map_error, resumable=True)
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    # Shed fast so clients back off instead of piling onto a saturated upstream
+    return JSONResponse(status_code=503, content={"detail": str(exc)},
+                        headers={"Retry-After": str(int(exc.retry_after))})
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def _subsystem_gauges():
+    from . import resumable
+    from .kilocode_bridge import bridge_pool
+    from .tools.fs_index import index_cache
+    subsystems = {
+        "response_cache": response_cache.stats(),
+        "single_flight": flights.stats(),
+        "scheduler": scheduler.stats(),
+        "provider": provider.stats(),
+        "fs_index": index_cache.stats(),
+        "sessions": session_store.stats(),
+        "streams": resumable.stats(),
+        "bridge_pool": bridge_pool.stats(),
+    }
+    for subsystem, stats in subsystems.items():
+        samples = [({"stat": name}, value) for name, value in stats.items()
+                   if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        yield f"kilocode_{subsystem}", f"{subsystem} counters and gauges.", samples
+
+REGISTRY.register_collector(_subsystem_gauges)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**response_cache.stats(), "single_flight": flights.stats(), "provider": provider.stats(),
+            "scheduler": scheduler.stats()}
 
 @app.post("/tools/fs/index")
-async def fs_index(request: dict):
-    """Index files in a directory for project context."""
+async def fs_index(request: dict, http_request: Request):
+    """Index files in a directory for project context.
+
+    Pass `stream: true` (or Accept: application/x-ndjson) to stream entries as
+    NDJSON, or `page_size`/`cursor` to fetch the listing a page at a time.
+    """
     from .tools.fs import FileSystemTool
 
     path = request.get("path", ".")
     max_depth = request.get("max_depth", 2)
 
     fs_tool = FileSystemTool()
-    result = fs_tool.index(path, max_depth)
+    if request.get("stream") or "application/x-ndjson" in http_request.headers.get("accept", ""):
+        # One JSON entry per line, then {"done": true, "total_files", "total_dirs"}.
+        lines = iterate_in_thread(_ndjson_lines(fs_tool.iter_index(path, max_depth)))
+        return StreamingResponse(cancel_on_disconnect(http_request, lines),
+                                 media_type="application/x-ndjson")
+
+    # The first walk of a root can take a while; keep it off the event loop.
+    if "page_size" in request or request.get("cursor"):
+        try:
+            page_size = int(request.get("page_size") or 500)
+        except (TypeError, ValueError):
+            page_size = 0
+        if page_size < 1:
+            raise HTTPException(status_code=422, detail="page_size must be a positive integer")
+        return await run_in_threadpool(fs_tool.index_page, path, max_depth, page_size, request.get("cursor"))
+    return await run_in_threadpool(fs_tool.index, path, max_depth)
+
+def _ndjson_lines(items, batch: int = 256):
+    """Encode dicts as NDJSON, a few hundred lines per chunk."""
+    lines = []
+    for item in items:
+        lines.append(json.dumps(item))
+        if len(lines) >= batch:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+@app.post("/tools/fs/index/invalidate")
+async def fs_index_invalidate(request: dict):
+    """Drop the cached index for a path (or every path); optionally rebuild it now."""
+    from .tools.fs import FileSystemTool
+
+    path = request.get("path")
+    fs_tool = FileSystemTool()
+    if request.get("rebuild") and path:
+        return await run_in_threadpool(fs_tool.rebuild_index, path, request.get("max_depth", 2))
+    return fs_tool.invalidate_index(path)
+
+@app.post("/tools/fs/read")
+async def fs_read(request: dict):
+    """Read a line range from a file, or several ranges at once via `ranges`."""
+    from .tools.fs import FileSystemTool
+
+    fs_tool = FileSystemTool()
+    if "ranges" in request:
+        return await run_in_threadpool(fs_tool.read_file_snippets, request["ranges"])
+    return await run_in_threadpool(
+        fs_tool.read_file_snippet,
+        request.get("file_path", ""),
+        request.get("start_line", 1),
+        request.get("max_lines", 50),
+    )
+
+@app.post("/tools/fs/retrieve")
+async def fs_retrieve(request: dict):
+    """Code chunks most relevant to `query` (BM25), within `max_tokens`."""
+    from .tools.fs import FileSystemTool
+
+    fs_tool = FileSystemTool()
+    return await run_in_threadpool(
+        fs_tool.retrieve,
+        request.get("query", ""),
+        request.get("path", "."),
+        request.get("top_k"),
+        request.get("max_tokens"),
+        settings.retrieval_build_wait,
+    )
+
+@app.post("/tools/fs/outline")
+async def fs_outline(request: dict):
+    """Symbol outline of a project ranked against `query` within `max_tokens`,
+    or the symbols of a single file with `file_path`."""
+    from .tools.fs import FileSystemTool
+
+    fs_tool = FileSystemTool()
+    # A first outline of a large tree parses it on the process pool
+    return await run_in_threadpool(
+        fs_tool.outline,
+        request.get("path", "."),
+        request.get("query"),
+        request.get("max_tokens"),
+        request.get("file_path"),
+    )
+
+@app.post("/tools/fs/search")
+async def fs_search(request: dict, http_request: Request):
+    """Search file contents, streaming results as NDJSON.
+
+    With Accept: text/event-stream, results are `result` events and the
+    summary the `done` event.
+    """
+    from .tools.fs import FileSystemTool
+
+    fs_tool = FileSystemTool()
+    results = measure_stream("fs.search", fs_tool.search_stream(
+        request.get("query", ""),
+        request.get("path", "."),
+        file_extensions=request.get("file_extensions"),
+        regex=bool(request.get("regex", False)),
+        max_results=request.get("max_results", settings.fs_search_max_results),
+        time_limit=request.get("time_limit", settings.fs_search_time_limit),
+    ))
+
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        async def events():
+            async for item in results:
+                yield ("done" if item.get("done") else "error" if "error" in item else "result", item)
+        return sse_response(http_request, events())
+
+    async def ndjson():
+        async for item in cancel_on_disconnect(http_request, results):
+            yield json.dumps(item) + "\n"
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
-    return result
\ No newline at end of file
+startup.mark("imported")
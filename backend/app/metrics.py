@@ -0,0 +1,228 @@
+"""
+Lightweight instrumentation: timing spans, Prometheus metrics, per-request timings.
+
+`span(name)` (or `@timed(name)`) records a duration into the
+`kilocode_span_seconds` histogram and, if a request is being served, into
+that request's timing breakdown (see `request_timings()`; /chat returns it in
+`meta["timings"]`). `measure_stream(name, source)` wraps a token stream to
+record time to first token and tokens/sec. `/metrics` renders everything in
+the Prometheus text format, plus gauges from registered collectors.
+
+Recording is a perf_counter() pair, a bisect and a few dict updates, cheap
+enough to leave on in production.
+"""
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 500, 1000)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+# name, help, [(labels, value)]
+Collector = Callable[[], Iterable[Tuple[str, str, Iterable[Tuple[Dict[str, str], float]]]]]
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Any] = []
+        self.collectors: List[Collector] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Collector):
+        """Add a callback returning gauges sampled at scrape time."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                gauges = list(collector())
+            except Exception:
+                continue  # a broken collector must not break the scrape
+            for name, help, samples in gauges:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+span_seconds = REGISTRY.register(Histogram(
+    "kilocode_span_seconds", "Duration of instrumented operations.", ("span",)))
+time_to_first_token = REGISTRY.register(Histogram(
+    "kilocode_time_to_first_token_seconds", "Time from stream start to the first token.", ("stream",)))
+tokens_per_second = REGISTRY.register(Histogram(
+    "kilocode_stream_tokens_per_second", "Token rate after the first token.", ("stream",), RATE_BUCKETS))
+stream_tokens = REGISTRY.register(Counter(
+    "kilocode_stream_tokens_total", "Tokens (stream chunks) relayed.", ("stream",)))
+http_request_seconds = REGISTRY.register(Histogram(
+    "kilocode_http_request_seconds", "HTTP request duration, including streamed bodies.",
+    ("method", "path", "status")))
+
+# --- per-request timings ------------------------------------------------------
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("kilocode_timings", default=None)
+
+def request_timings() -> Dict[str, float]:
+    """Milliseconds spent per span in the current request so far."""
+    timings = _timings.get()
+    return {name: round(ms, 2) for name, ms in timings.items()} if timings else {}
+
+def record(name: str, seconds: float):
+    span_seconds.observe(seconds, span=name)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000
+
+@contextmanager
+def span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def timed(name: str):
+    """Decorator form of span() for sync and async functions."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+async def measure_stream(name: str, source: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """Relay `source`, recording time to first item, items/sec and total duration."""
+    start = time.perf_counter()
+    first = None
+    count = 0
+    try:
+        async for item in source:
+            if first is None:
+                first = time.perf_counter()
+                time_to_first_token.observe(first - start, stream=name)
+                record(f"{name}.first_token", first - start)
+            count += 1
+            yield item
+    finally:
+        end = time.perf_counter()
+        record(name, end - start)
+        if count:
+            stream_tokens.inc(count, stream=name)
+            if count > 1 and end > first:
+                tokens_per_second.observe((count - 1) / (end - first), stream=name)
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+class MetricsMiddleware:
+    """ASGI middleware: per-request timing context and the HTTP duration histogram."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        token = _timings.set({})
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template (/sessions/{session_id}), never the raw path, so
+            # ids in URLs don't create series; anything unrouted shares one label.
+            path = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_request_seconds.observe(time.perf_counter() - start,
+                                         method=scope["method"], path=path, status=str(status[0]))
+            _timings.reset(token)
@@ -3,9 +3,21 @@ from .coder import CoderMode
 from .debugger import DebuggerMode
 from .ask import AskMode
 
-MODE_MAP = {
-  "architect": ArchitectMode(),
-  "coder": CoderMode(),
-  "debugger": DebuggerMode(),
-  "ask": AskMode(),
-}
\ No newline at end of file
+MODE_CLASSES = {
+  "architect": ArchitectMode,
+  "coder": CoderMode,
+  "debugger": DebuggerMode,
+  "ask": AskMode,
+}
+
+# Instances are created on first use, not at import
+MODE_MAP = {}
+
+def get_mode(name: str):
+    """The shared instance of mode `name`, falling back to coder."""
+    if name not in MODE_CLASSES:
+        name = "coder"
+    mode = MODE_MAP.get(name)
+    if mode is None:
+        mode = MODE_MAP.setdefault(name, MODE_CLASSES[name]())
+    return mode
@@ -1,38 +1,24 @@
 from typing import List, Dict, Any
-import os
 from ..settings import settings
-from ..providers.openai import OpenAIProvider
+from ..prompts import load_rules
+from ..context import pack_messages
+from ..providers.openai import get_provider
 from ..tools.fs import FileSystemTool
+from ..tools.retrieval import format_chunks
 
 class Mode:
     name = "base"
 
     def __init__(self):
-        self.provider = OpenAIProvider()
         self.fs_tool = FileSystemTool()
 
-    def load_rules(self, custom_rules: Dict[str, str] = None) -> Dict[str, str]:
-        """Load rules from custom input or fallback to files."""
-        if custom_rules:
-            return custom_rules
-
-        # Fallback to static files
-        rules = {}
-        rules_dir = os.path.join(os.path.dirname(__file__), '..', 'rules')
-
-        # Load global rules
-        global_rules_path = os.path.join(rules_dir, 'global.md')
-        if os.path.exists(global_rules_path):
-            with open(global_rules_path, 'r') as f:
-                rules['global'] = f.read().strip()
-
-        # Load project rules
-        project_rules_path = os.path.join(rules_dir, 'project.md')
-        if os.path.exists(project_rules_path):
-            with open(project_rules_path, 'r') as f:
-                rules['project'] = f.read().strip()
+    @property
+    def provider(self):
+        return get_provider()
 
-        return rules
+    def load_rules(self, custom_rules: Dict[str, str] = None) -> Dict[str, str]:
+        """Load rules from custom input or fallback to files (cached, see app.prompts)."""
+        return load_rules(custom_rules)
 
     def system_prompt(self, project_context: Dict[str, Any] | None) -> str:
         return "You are a helpful software assistant."
@@ -64,8 +50,11 @@ class Mode:
 
         return "\n".join(prompt_parts)
 
-    def get_project_context(self, project_path: str = ".") -> Dict[str, Any]:
-        """Generate project context using filesystem tools"""
+    def get_project_context(self, project_path: str = ".", query: str = None) -> Dict[str, Any]:
+        """Generate project context using filesystem tools.
+
+        With a `query`, `relevant_code` holds the chunks retrieved for it.
+        """
         try:
             # Index the project directory
             index_result = self.fs_tool.index_directory(project_path, max_depth=2)
@@ -78,33 +67,34 @@ class Mode:
             for file_info in index_result.get("files", [])[:20]:  # Limit to 20 files
                 files_list.append(f"{file_info['path']} ({file_info['size']} bytes)")
 
-            return {
+            context = {
                 "path": project_path,
                 "files_index": files_list,
                 "total_files": index_result.get("total_files", 0),
                 "total_dirs": index_result.get("total_dirs", 0)
             }
+            if query:
+                context["relevant_code"] = self.fs_tool.retrieve(query, project_path).get("chunks", [])
+            return context
         except Exception as e:
             return {"error": f"Failed to generate project context: {str(e)}"}
 
     def process(self, message: str, project_context: dict = None, conversation_history: list = None, custom_rules: dict = None) -> str:
         try:
             system_prompt = self.build_system_prompt(project_context, custom_rules)
-            messages = [{"role": "system", "content": system_prompt}]
 
             # Generate project context if path provided
+            files_context = None
             if project_context and "path" in project_context:
-                fs_context = self.get_project_context(project_context["path"])
+                fs_context = self.get_project_context(project_context["path"], message)
                 if "error" not in fs_context:
-                    context_str = f"Project Files: {', '.join(fs_context.get('files_index', [])[:10])}"  # Limit to 10 files
-                    messages.append({"role": "system", "content": context_str})
-
-            # Add conversation history if available
-            if conversation_history:
-                messages.extend(conversation_history[-10:])  # Keep last 10 messages for context
+                    # Code relevant to the question; the file listing until the index is built
+                    files_context = (format_chunks(fs_context.get("relevant_code"))
+                                     or f"Project Files: {', '.join(fs_context.get('files_index', []))}")
 
-            # Add current user message
-            messages.append({"role": "user", "content": message})
+            # Keep as much recent history as the token budget allows
+            messages, _stats = pack_messages(system_prompt, conversation_history or [],
+                                             {"role": "user", "content": message}, files_context)
 
             raw_response = self.provider.chat_completion(
                 messages=messages,
@@ -113,4 +103,4 @@ class Mode:
             )
             return self.postprocess(raw_response)
         except Exception as e:
-            return f"Error: {str(e)}"
\ No newline at end of file
+            return f"Error: {self.provider.map_error(e)}"
\ No newline at end of file
@@ -1,4 +1,4 @@
-from ..kilo_adapter import load_prompt
+from ..prompts import load_prompt
 
 class DebuggerMode:
     name = "debugger"
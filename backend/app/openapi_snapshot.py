@@ -0,0 +1,80 @@
+"""
+OpenAPI schema snapshot, so /openapi.json doesn't generate the schema at runtime.
+
+FastAPI builds the schema on the first /openapi.json (or /docs) request by
+walking every route and model. With `openapi_snapshot` set, it is read from
+that file instead when the file was written by the same code (the snapshot
+records a hash of the app's sources), and written there after generating
+it otherwise. Build it into the image with
+
+    python -m app.openapi_snapshot /app/openapi.json
+
+`openapi_precompute` generates or loads it in the background at startup
+(see app.startup), so not even the first /docs visitor waits.
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parent
+
+def source_fingerprint() -> str:
+    digest = hashlib.sha256()
+    for path in sorted(APP_DIR.rglob("*.py")):
+        digest.update(str(path.relative_to(APP_DIR)).encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+def load(path: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """The schema stored at `path`, if it was made from sources with this fingerprint."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("fingerprint") != fingerprint:
+        return None
+    return snapshot.get("schema")
+
+def save(path: str, fingerprint: str, schema: Dict[str, Any]):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"fingerprint": fingerprint, "schema": schema}, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def install(app: FastAPI, path: Optional[str]):
+    """Serve `app`'s schema from the snapshot at `path`; None keeps FastAPI's behaviour."""
+    if not path:
+        return
+    generate = app.openapi
+
+    def openapi() -> Dict[str, Any]:
+        if app.openapi_schema is None:
+            fingerprint = source_fingerprint()
+            schema = load(path, fingerprint)
+            if schema is None:
+                schema = generate()
+                try:
+                    save(path, fingerprint, schema)
+                except OSError:
+                    logger.warning("openapi: could not write snapshot %s", path, exc_info=True)
+            app.openapi_schema = schema
+        return app.openapi_schema
+
+    app.openapi = openapi
+
+if __name__ == "__main__":
+    import sys
+
+    from .main import app
+
+    target = sys.argv[1] if len(sys.argv) > 1 else "openapi.json"
+    save(target, source_fingerprint(), app.openapi())
+    print(f"wrote {target}")
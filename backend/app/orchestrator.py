@@ -1,12 +1,196 @@
-from typing import List, Dict, Any
+import asyncio
+import json
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from .jsonstream import JSONStreamParser
 
 def normalize_plan(raw_json: str) -> list[str]:
     """Takes planner JSON string and returns a list of step strings."""
-    import json
     try:
         obj = json.loads(raw_json)
         if isinstance(obj, dict) and isinstance(obj.get("plan"), list):
             return [str(x) for x in obj["plan"]]
+        if isinstance(obj, dict) and isinstance(obj.get("steps"), list):
+            return [s["action"] for s in normalize_steps(obj["steps"], strict=False)]
     except Exception:
         pass
-    return []
\ No newline at end of file
+    return []
+
+def normalize_steps(raw: List[Any], strict: bool = True) -> List[Dict[str, Any]]:
+    """Turn planner steps into [{"id", "action", "depends_on"}] in a valid order.
+
+    Steps may be plain strings or dicts with `id`, `action` and `depends_on`;
+    missing ids become s1, s2, ... With `strict`, duplicate ids, unknown
+    dependencies and cycles raise ValueError. Otherwise (model output) unknown
+    dependencies are dropped and a cyclic graph degrades to running the steps
+    in the order given.
+    """
+    steps: List[Dict[str, Any]] = []
+    seen = set()
+    for i, item in enumerate(raw):
+        if isinstance(item, dict):
+            sid = str(item.get("id") or f"s{i + 1}")
+            action = str(item.get("action") or item.get("step") or "")
+            deps = [str(d) for d in item.get("depends_on") or []]
+        else:
+            sid, action, deps = f"s{i + 1}", str(item), []
+        if sid in seen:
+            if strict:
+                raise ValueError(f"Duplicate step id: {sid}")
+            sid = f"s{i + 1}"
+        seen.add(sid)
+        steps.append({"id": sid, "action": action, "depends_on": deps})
+
+    for step in steps:
+        unknown = [d for d in step["depends_on"] if d not in seen or d == step["id"]]
+        if unknown and strict:
+            raise ValueError(f"Step {step['id']} depends on unknown step(s): {', '.join(unknown)}")
+        step["depends_on"] = list(dict.fromkeys(d for d in step["depends_on"] if d not in unknown))
+
+    try:
+        return topological_order(steps)
+    except ValueError:
+        if strict or not steps:
+            raise
+        for prev, step in zip(steps, steps[1:]):
+            step["depends_on"] = [prev["id"]]
+        steps[0]["depends_on"] = []
+        return steps
+
+def plan_step_event(key: str, index: Optional[int], value: Any, graph: bool) -> Optional[Dict[str, Any]]:
+    """SSE event for one value completed by the planner's JSON, if it is a step or the summary.
+
+    Graph steps are tidied as they arrive (default id, list of deps); unknown
+    edges and cycles are only resolved in the final document.
+    """
+    if key == ("steps" if graph else "plan") and index is not None:
+        if graph:
+            item = value if isinstance(value, dict) else {"action": value}
+            value = {
+                "id": str(item.get("id") or f"s{index + 1}"),
+                "action": str(item.get("action") or item.get("step") or ""),
+                "depends_on": [str(d) for d in item.get("depends_on") or []],
+            }
+        else:
+            value = str(value)
+        return {"type": "step", "index": index, "step": value}
+    if key == "summary" and index is None:
+        return {"type": "summary", "summary": str(value)}
+    return None
+
+async def plan_events(chunks: AsyncIterator[str], graph: bool) -> AsyncIterator[Dict[str, Any]]:
+    """Relay plan steps (and the summary) from streamed planner JSON as each one closes."""
+    parser = JSONStreamParser()
+    async for chunk in chunks:
+        for key, index, value in parser.feed(chunk):
+            event = plan_step_event(key, index, value, graph)
+            if event is not None:
+                yield event
+
+def replay_plan_events(txt: str, graph: bool) -> Iterable[Dict[str, Any]]:
+    """The events plan_events would have produced for a complete document."""
+    for key, index, value in JSONStreamParser().feed(txt):
+        event = plan_step_event(key, index, value, graph)
+        if event is not None:
+            yield event
+
+def topological_order(steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Order steps so dependencies come first, keeping the given order among peers."""
+    by_id = {s["id"]: s for s in steps}
+    ordered: List[Dict[str, Any]] = []
+    state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+    def visit(sid: str, path: List[str]):
+        if state.get(sid) == 2:
+            return
+        if state.get(sid) == 1:
+            raise ValueError(f"Plan has a dependency cycle: {' -> '.join(path + [sid])}")
+        state[sid] = 1
+        for dep in by_id[sid]["depends_on"]:
+            visit(dep, path + [sid])
+        state[sid] = 2
+        ordered.append(by_id[sid])
+
+    for step in steps:
+        visit(step["id"], [])
+    return ordered
+
+StepRunner = Callable[[Dict[str, Any], Dict[str, str]], AsyncIterator[str]]
+
+async def run_plan_graph(steps: List[Dict[str, Any]], run_step: StepRunner,
+                         parallelism: int) -> AsyncIterator[Dict[str, Any]]:
+    """Execute a step DAG, yielding progress events tagged with the step id.
+
+    `run_step(step, dependency_outputs)` streams a step's output; at most
+    `parallelism` steps run at once, each as soon as its dependencies are done.
+    Events: {"step", "type": "start" | "delta" | "done" | "error" | "cancelled"}.
+    A failed step cancels the steps that (transitively) depend on it; independent
+    branches keep running. Closing the iterator cancels every running step.
+    """
+    by_id = {s["id"]: s for s in steps}
+    waiting = {s["id"]: set(s["depends_on"]) for s in steps}
+    dependents: Dict[str, List[str]] = {sid: [] for sid in by_id}
+    for s in steps:
+        for dep in s["depends_on"]:
+            dependents[dep].append(s["id"])
+
+    events: asyncio.Queue = asyncio.Queue()
+    outputs: Dict[str, str] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+    limit = asyncio.Semaphore(max(1, parallelism))
+
+    async def execute(step: Dict[str, Any]):
+        sid = step["id"]
+        async with limit:
+            events.put_nowait({"step": sid, "type": "start", "action": step["action"]})
+            parts: List[str] = []
+            try:
+                async for delta in run_step(step, {d: outputs[d] for d in step["depends_on"]}):
+                    parts.append(delta)
+                    events.put_nowait({"step": sid, "type": "delta", "delta": delta})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                events.put_nowait({"step": sid, "type": "error", "error": str(e)})
+                return
+            outputs[sid] = "".join(parts)
+            events.put_nowait({"step": sid, "type": "done"})
+
+    def launch_ready():
+        for sid, deps in waiting.items():
+            if not deps and sid not in tasks:
+                tasks[sid] = asyncio.create_task(execute(by_id[sid]))
+
+    def cancel_dependents(failed: str) -> List[Dict[str, Any]]:
+        cancelled, stack = [], list(dependents[failed])
+        while stack:
+            sid = stack.pop()
+            if sid in tasks or waiting.pop(sid, None) is None:
+                continue
+            cancelled.append({"step": sid, "type": "cancelled", "reason": f"dependency {failed} failed"})
+            stack.extend(dependents[sid])
+        return cancelled
+
+    remaining = len(steps)
+    launch_ready()
+    try:
+        while remaining:
+            event = await events.get()
+            yield event
+            sid, kind = event["step"], event["type"]
+            if kind not in ("done", "error"):
+                continue
+            remaining -= 1
+            waiting.pop(sid, None)
+            if kind == "done":
+                for dep in dependents[sid]:
+                    if dep in waiting:
+                        waiting[dep].discard(sid)
+            else:
+                for cancelled in cancel_dependents(sid):
+                    remaining -= 1
+                    yield cancelled
+            launch_ready()
+    finally:
+        for task in tasks.values():
+            task.cancel()
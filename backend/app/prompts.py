@@ -0,0 +1,117 @@
+"""
+Compiled system prompts.
+
+Mode templates (kilocode_core/prompts/<mode>.md) and rules (app/rules/*.md)
+are read once and re-read only when their mtime or size changes. Assembled
+prompts are memoized by (mode, template, rules hash, context hash). The
+project context is serialized as canonical JSON and placed last, so the
+template and rules form a byte-identical prefix across requests, which is
+what upstream prompt-prefix caching keys on.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .metrics import timed
+from .settings import settings
+
+KILOCODE_PROMPTS = Path(__file__).resolve().parents[1] / "kilocode_core" / "prompts"
+RULES_DIR = Path(__file__).resolve().parent / "rules"
+DEFAULT_PROMPT = "You are a helpful AI assistant."
+RULE_FILES = ("global", "project")
+_MAX_COMPILED = 256
+
+def canonical_json(value: Any) -> str:
+    """Deterministic JSON: sorted keys, no insignificant whitespace."""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+class _TextFiles:
+    """Small text files cached in memory, re-read when their (mtime, size) changes."""
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        # path -> (mtime_ns, size, text, hash, last_checked); text is None if missing
+        self._files: Dict[Path, Tuple[int, int, Optional[str], str, float]] = {}
+        self._lock = threading.Lock()
+
+    def read(self, path: Path) -> Tuple[Optional[str], str]:
+        """Return (text or None if missing, content hash)."""
+        now = time.monotonic()
+        cached = self._files.get(path)
+        if cached is not None and now - cached[4] < self.check_interval:
+            return cached[2], cached[3]
+        try:
+            st = os.stat(path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = (0, -1)
+        if cached is not None and cached[:2] == stamp:
+            text, digest = cached[2], cached[3]
+        elif stamp[1] < 0:
+            text, digest = None, ""
+        else:
+            try:
+                text = path.read_text()
+            except OSError:
+                text = None
+            digest = content_hash(text) if text is not None else ""
+        with self._lock:
+            self._files[path] = (stamp[0], stamp[1], text, digest, now)
+        return text, digest
+
+_files = _TextFiles(settings.prompt_check_interval)
+_compiled: "OrderedDict[Tuple[str, str, str, str], str]" = OrderedDict()
+_compiled_lock = threading.Lock()
+
+def load_prompt(mode: str) -> str:
+    text, _digest = _files.read(KILOCODE_PROMPTS / f"{mode}.md")
+    return text if text is not None else DEFAULT_PROMPT
+
+def load_rules(custom_rules: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Rules from custom input, or else from the rules files."""
+    if custom_rules:
+        return custom_rules
+    rules = {}
+    for name in RULE_FILES:
+        text, _digest = _files.read(RULES_DIR / f"{name}.md")
+        if text is not None:
+            rules[name] = text.strip()
+    return rules
+
+@timed("prompt.build")
+def build_system_prompt(mode: str, project_context: Optional[Dict[str, Any]] = None,
+                        custom_rules: Optional[Dict[str, str]] = None) -> str:
+    """Mode template, then rules, then the project context (the part that varies most)."""
+    template, template_hash = _files.read(KILOCODE_PROMPTS / f"{mode}.md")
+    rules = load_rules(custom_rules)
+    rules_json = canonical_json(rules)
+    context_json = canonical_json(project_context) if project_context else ""
+    key = (mode, template_hash, content_hash(rules_json), content_hash(context_json))
+    with _compiled_lock:
+        prompt = _compiled.get(key)
+        if prompt is not None:
+            _compiled.move_to_end(key)
+            return prompt
+
+    parts = [template if template is not None else DEFAULT_PROMPT]
+    if "global" in rules:
+        parts.append(f"\n## Global Rules\n{rules['global']}")
+    if "project" in rules:
+        parts.append(f"\n## Project Rules\n{rules['project']}")
+    if context_json:
+        parts.append(f"\n# Context\n{context_json}")
+    prompt = "\n".join(parts)
+
+    with _compiled_lock:
+        _compiled[key] = prompt
+        while len(_compiled) > _MAX_COMPILED:
+            _compiled.popitem(last=False)
+    return prompt
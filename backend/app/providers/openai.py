@@ -1,39 +1,300 @@
-import openai
-from typing import List, Dict, Any, Iterator, Optional
+"""
+OpenAI provider shared by every endpoint.
+
+One pooled HTTP client per process (sync and async), with keep-alive and
+connection limits from settings. Calls are retried on 429/5xx and connection
+errors with jittered exponential backoff, honouring Retry-After. Optionally,
+a call that hasn't produced its first token (or, for non-streaming calls,
+its response) within the configured latency percentile is hedged: a second
+identical call is started and whichever answers first is used.
+
+The `openai` package (slow to import) and the clients are only loaded on
+first use, or by `warm()` in the background after startup, so a cold start
+doesn't wait for them.
+
+Point `openai_base_url` at a local mock server to test all of this offline.
+"""
+import asyncio
+import email.utils
+import math
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterator, AsyncIterator, List, Optional, Tuple
+
+import httpx
+
+from ..metrics import timed
 from ..settings import settings
 
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, if it said."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return _seconds(float(headers["retry-after-ms"]) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return _seconds(float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)  # HTTP-date form
+    except (TypeError, ValueError, IndexError):
+        return None  # malformed: fall back to backoff
+    return max(0.0, parsed.timestamp() - time.time())
+
+def _seconds(value: float) -> Optional[float]:
+    return max(0.0, value) if math.isfinite(value) else None
+
+def is_retryable(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.InternalServerError,
+                          openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """Retry-After if given, else full-jitter exponential backoff; capped at openai_backoff_max."""
+    delay = _retry_after(error)
+    if delay is None:
+        delay = random.uniform(0, settings.openai_backoff_base * (2 ** attempt))
+    return min(delay, settings.openai_backoff_max)
+
+class LatencyTracker:
+    """Recent latency samples, for picking the hedge delay."""
+
+    def __init__(self, size: int = 256):
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < settings.openai_hedge_min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
 class OpenAIProvider:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=settings.openai_api_key)
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
+        self.first_token_latency = LatencyTracker()
+        self.completion_latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self.hedges_won = 0
 
-    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
-        """Non-streaming chat completion"""
+    # --- clients -------------------------------------------------------------
+
+    def _build(self, name: str):
+        import openai
+
+        limits = httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive,
+            keepalive_expiry=settings.openai_keepalive_expiry,
+        )
+        timeout = settings.openai_timeout
+        options = dict(api_key=settings.openai_api_key, base_url=settings.openai_base_url,
+                       max_retries=0)  # retries are ours, see _aretry
+        with self._client_lock:
+            if name == "client" and self._client is None:
+                self._client = openai.OpenAI(
+                    http_client=openai.DefaultHttpxClient(limits=limits, timeout=timeout), **options)
+            elif name == "async_client" and self._async_client is None:
+                self._async_client = openai.AsyncOpenAI(
+                    http_client=openai.DefaultAsyncHttpxClient(limits=limits, timeout=timeout), **options)
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._build("client")
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._build("async_client")
+        return self._async_client
+
+    @property
+    def warm(self) -> bool:
+        return self._async_client is not None
+
+    def warm_up(self):
+        """Load the openai package and build the async client (blocking; run it in a thread)."""
+        self.async_client
+
+    # --- retries and hedging -------------------------------------------------
+
+    def _retry(self, call: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                if attempt >= settings.openai_max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                time.sleep(backoff_delay(attempt, e))
+                attempt += 1
+
+    async def _aretry(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except Exception as e:
+                if attempt >= settings.openai_max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, e))
+                attempt += 1
+
+    async def _hedged(self, call: Callable[[], Awaitable[Any]], latency: LatencyTracker,
+                      discard: Optional[Callable[[Any], Awaitable[None]]] = None) -> Any:
+        """Run `call`; if it is slower than the hedge percentile, race a duplicate."""
+        started = time.monotonic()
+        delay = None
+        if settings.openai_hedge_percentile > 0:
+            delay = latency.percentile(settings.openai_hedge_percentile)
+            if delay is not None:
+                delay = max(delay, settings.openai_hedge_min_delay)
+
+        primary = asyncio.ensure_future(call())
+        tasks = [primary]
         try:
-            response = self.client.chat.completions.create(
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future(call()))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is not primary:
+                        self.hedges_won += 1
+                    latency.add(time.monotonic() - started)
+                    for other in pending:
+                        other.cancel()
+                    if discard is not None:
+                        for other in done - {task}:
+                            if other.exception() is None:
+                                await discard(other.result())
+                    return task.result()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # --- completions ---------------------------------------------------------
+
+    @timed("provider.complete")
+    def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """Non-streaming chat completion; raises on failure (see map_error)"""
+        response = self._retry(lambda: self.client.chat.completions.create(
+            model=settings.model,
+            messages=messages,
+            **kwargs
+        ))
+        return (response.choices[0].message.content or "").strip()
+
+    @timed("provider.complete")
+    async def acomplete(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """Async non-streaming chat completion with retries and optional hedging."""
+        async def call():
+            return await self._aretry(lambda: self.async_client.chat.completions.create(
                 model=settings.model,
                 messages=messages,
                 **kwargs
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            return f"Error: {str(e)}"
+            ))
+        response = await self._hedged(call, self.completion_latency)
+        return response.choices[0].message.content or ""
 
     def chat_completion_stream(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
-        """Streaming chat completion that yields tokens"""
+        """Streaming chat completion that yields tokens; raises on failure"""
+        response = self._retry(lambda: self.client.chat.completions.create(
+            model=settings.model,
+            messages=messages,
+            stream=True,
+            **kwargs
+        ))
         try:
-            response = self.client.chat.completions.create(
-                model=settings.model,
-                messages=messages,
-                stream=True,
-                **kwargs
-            )
-
             for chunk in response:
-                if chunk.choices[0].delta.content:
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
+        finally:
+            response.close()
+
+    async def _open_stream(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> Tuple[Any, Any, Optional[str]]:
+        """Start a stream and wait for its first token: (response, chunk iterator, first token)."""
+        response = await self._aretry(lambda: self.async_client.chat.completions.create(
+            model=settings.model,
+            messages=messages,
+            stream=True,
+            **kwargs
+        ))
+        chunks = response.__aiter__()
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    return response, chunks, chunk.choices[0].delta.content
+        except BaseException:
+            await response.close()
+            raise
+        return response, chunks, None
+
+    async def achat_completion_stream(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        """Async streaming chat completion that yields tokens.
 
-        except Exception as e:
-            yield f"Error: {str(e)}"
+        Chunks are read from the connection only as the caller consumes them.
+        Closing the generator early (e.g. on client disconnect) closes the
+        upstream HTTP response, which stops generation. Errors are raised.
+        """
+        async def discard(opened):
+            await opened[0].close()
+
+        response, chunks, first = await self._hedged(
+            lambda: self._open_stream(messages, kwargs), self.first_token_latency, discard)
+        try:
+            if first is not None:
+                yield first
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await response.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "first_token_p95": self.first_token_latency.percentile(0.95),
+            "warm": self.warm,
+        }
 
     def map_error(self, error: Exception) -> str:
         """Map OpenAI errors to user-friendly messages"""
@@ -48,4 +309,13 @@ class OpenAIProvider:
         elif "model_not_found" in error_str:
             return f"Model '{settings.model}' not found. Please check your model configuration."
         else:
-            return f"AI service error: {str(error)}"
\ No newline at end of file
+            return f"AI service error: {str(error)}"
+
+_provider: Optional[OpenAIProvider] = None
+
+def get_provider() -> OpenAIProvider:
+    """The process-wide provider (and its connection pools)."""
+    global _provider
+    if _provider is None:
+        _provider = OpenAIProvider()
+    return _provider
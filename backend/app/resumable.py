@@ -0,0 +1,136 @@
+"""
+Resumable SSE streams: generation outlives the connection that started it.
+
+A stream's source is read by a background task into a bounded ring buffer,
+and each item gets a sequence number; events carry `id: <stream>.<seq>`. A
+client whose connection drops re-sends the same request with `Last-Event-ID`
+and gets the items after that id, then the live tail, while the model or
+agent kept running in the meantime.
+
+A stream nobody reads for `stream_idle_timeout` is cancelled, which closes
+its source and aborts the upstream call. A finished stream stays resumable
+for `stream_grace_period`. Streams live in the worker's memory, so a resume
+must reach the same worker.
+"""
+import asyncio
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from .settings import settings
+
+class StreamGone(Exception):
+    """The requested position has been dropped from the ring buffer."""
+
+class ResumableStream:
+    def __init__(self, source: AsyncIterator[Any], max_items: int):
+        self.id = uuid.uuid4().hex
+        self._items: Deque[Tuple[int, Any]] = deque(maxlen=max_items)
+        self._next_seq = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.readers = 0
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(source))
+        # Also covers a response that never starts reading
+        self._idle_timer: Optional[asyncio.TimerHandle] = asyncio.get_running_loop().call_later(
+            settings.stream_idle_timeout, self._check_idle)
+
+    async def _pump(self, source: AsyncIterator[Any]):
+        try:
+            async for item in source:
+                self._items.append((self._next_seq, item))
+                self._next_seq += 1
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = StreamGone("Stream cancelled")
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            asyncio.get_running_loop().call_later(settings.stream_grace_period, _streams.pop, self.id, None)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _check_idle(self):
+        self._idle_timer = None
+        if self.readers == 0 and not self.done:
+            self._task.cancel()
+
+    def available(self, after: int) -> bool:
+        """Whether a reader can resume after sequence number `after`."""
+        first = self._items[0][0] if self._items else self._next_seq
+        return after + 1 >= first
+
+    async def subscribe(self, after: int = -1) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield (event id, item) for items after `after`, then the live tail.
+
+        Raises the source's error at the end, or StreamGone if this reader
+        fell behind the ring buffer.
+        """
+        self.readers += 1
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        wanted = after + 1
+        try:
+            while True:
+                if not self.available(wanted - 1):
+                    raise StreamGone("Stream position no longer buffered")
+                first = self._items[0][0] if self._items else self._next_seq
+                while wanted < self._next_seq:
+                    seq, item = self._items[wanted - first]
+                    wanted += 1
+                    yield f"{self.id}.{seq}", item
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.readers -= 1
+            if self.readers == 0 and not self.done:
+                self._idle_timer = asyncio.get_running_loop().call_later(
+                    settings.stream_idle_timeout, self._check_idle)
+
+_streams: Dict[str, ResumableStream] = {}
+
+def start(source: AsyncIterator[Any]) -> ResumableStream:
+    stream = ResumableStream(source, settings.stream_buffer_events)
+    _streams[stream.id] = stream
+    return stream
+
+def resume(request: Request) -> Optional[AsyncIterator[Tuple[str, Any]]]:
+    """The rest of the stream named by the request's Last-Event-ID.
+
+    None when there is no such header (the caller starts a new stream). 410
+    when the stream is gone (expired, or started on another worker) or has
+    dropped that position: re-running the request would repeat what the
+    client already has, so it is up to the client to start over.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if not last_event_id:
+        return None
+    stream_id, _, seq = last_event_id.partition(".")
+    stream = _streams.get(stream_id)
+    if stream is None or not seq.isdigit():
+        raise HTTPException(status_code=410, detail="Stream no longer available")
+    if not stream.available(int(seq)):
+        raise HTTPException(status_code=410, detail="Stream position no longer buffered")
+    return stream.subscribe(int(seq))
+
+def stats() -> Dict[str, Any]:
+    return {
+        "streams": len(_streams),
+        "live": sum(not s.done for s in _streams.values()),
+        "unread": sum(s.readers == 0 and not s.done for s in _streams.values()),
+    }
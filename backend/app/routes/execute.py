@@ -1,31 +1,120 @@
 import json
-from fastapi import APIRouter, Request
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from typing import List, Literal, Dict, Any
+from typing import List, Literal, Dict, Any, Optional, Union
 
-from ..kilocode_bridge import stream_kilocode_agent  # from earlier bridge step
+from ..kilocode_bridge import BridgeError, bridge_pool, stream_kilocode_agent  # from earlier bridge step
+from ..cache import cache_key
+from ..singleflight import flights
+from ..scheduler import scheduler
+from ..context import get_counter
+from ..metrics import measure_stream
+from ..orchestrator import normalize_steps, run_plan_graph
+from ..sse import resume_response, sse_response
+from ..settings import settings
 
 router = APIRouter(prefix="/execute", tags=["executor"])
 
+class PlanStep(BaseModel):
+    id: Optional[str] = None
+    action: str
+    depends_on: List[str] = []
+
 class ExecRequest(BaseModel):
     mode: Literal["coder","architect","debugger","ask"] = "coder"
-    plan: List[str]
+    # Plain strings run as one agent session; step objects run as a dependency graph
+    plan: List[Union[PlanStep, str]]
     context: Dict[str, Any] | None = None
+    parallelism: Optional[int] = None  # capped at settings.execute_parallelism
+
+def parallelism_limit(requested: Optional[int]) -> int:
+    limit = settings.execute_parallelism or settings.bridge_pool_size
+    return max(1, min(requested or limit, limit))
+
+async def stream_step(mode: str, step: Dict[str, Any], plan: List[Dict[str, Any]],
+                      context: Dict[str, Any], dependencies: Dict[str, str]):
+    """Run one plan step on its own agent worker, yielding text deltas; raise on failure."""
+    cap = settings.execute_dependency_chars
+    payload = {
+        "plan": [step["action"]],
+        "step": step,
+        "full_plan": [s["action"] for s in plan],
+        "dependencies": {sid: out[-cap:] for sid, out in dependencies.items()},
+        "context": context,
+    }
+    async for msg in measure_stream("bridge.stream", bridge_pool.stream(mode, payload)):
+        kind = msg.get("type")
+        if kind == "delta":
+            yield msg.get("delta", "")
+        elif kind == "result":
+            result = msg.get("result")
+            if isinstance(result, dict) and result.get("error"):
+                raise BridgeError(str(result["error"]))
+        elif kind == "error":
+            raise BridgeError(msg.get("error") or "Kilocode agent failed")
 
 @router.post("")
-async def execute_plan(req: ExecRequest):
-    """Streams live logs/tokens from the Kilocode agent applying the plan."""
-    async def gen():
+async def execute_plan(req: ExecRequest, request: Request):
+    """Streams live logs/tokens from the Kilocode agent applying the plan.
+
+    Text plans stream `delta` events. A plan of step objects ({id, action,
+    depends_on}) is scheduled as a DAG: independent steps run concurrently
+    and each `step` event is a JSON object tagged with its `step` id (see
+    orchestrator.run_plan_graph). The stream ends with `done`.
+    """
+    resumed = resume_response(request)
+    if resumed is not None:
+        return resumed
+    graph = any(isinstance(s, PlanStep) for s in req.plan)
+    steps = None
+    if graph:
+        try:
+            steps = normalize_steps([s.dict() if isinstance(s, PlanStep) else s for s in req.plan])
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        payload = {"plan": steps, "context": req.context or {}}
+    else:
         payload = {"plan": req.plan, "context": req.context or {}}
-        async for chunk in stream_kilocode_agent(req.mode, payload):
+    parallelism = parallelism_limit(req.parallelism)
+    key = cache_key(endpoint="execute", mode=req.mode, parallelism=parallelism if graph else None, **payload)
+
+    # Bulk work: admitted at low priority, before responding so shedding is a 503
+    slot = None
+    if not flights.in_flight(key):
+        tokens = get_counter().count(json.dumps(payload)) + settings.scheduler_output_tokens
+        slot = await scheduler.acquire("execute", tokens)
+        if flights.in_flight(key):
+            slot.release()
+            slot = None
+
+    async def run():
+        try:
+            if graph:
+                run_step = lambda step, deps: stream_step(req.mode, step, steps, payload["context"], deps)
+                async for event in run_plan_graph(steps, run_step, parallelism):
+                    yield json.dumps(event)
+            else:
+                async for chunk in stream_kilocode_agent(req.mode, payload):
+                    yield chunk
+        finally:
+            if slot is not None:
+                slot.release()
+
+    # The same plan submitted concurrently runs once; every client gets the full stream
+    chunks = flights.stream(key, run)
+
+    async def events():
+        async for chunk in chunks:
+            if graph:
+                yield "step", chunk
+                continue
             # Expect JSON lines {"delta": "..."} or raw text
             try:
                 data = json.loads(chunk)
                 token = data.get("delta") or data.get("content") or chunk
             except Exception:
                 token = chunk
-            yield f"data: {token}\n\n"
-        yield "data: [DONE]\n\n"
+            yield token
 
-    return StreamingResponse(gen(), media_type="text/event-stream")
\ No newline at end of file
+    # The agent keeps working if the connection drops; resume with Last-Event-ID
+    return sse_response(request, events(), resumable=True)
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+from ..startup import readiness
+
+router = APIRouter(tags=["health"])
+
+@router.get("/healthz")
+async def healthz():
+    """Liveness: the process is serving. Does no work, so it is safe to poll often."""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+async def readyz(request: Request):
+    """Readiness: 200 once the background warm-up is done, 503 before; warm state either way."""
+    state = readiness(request.app)
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
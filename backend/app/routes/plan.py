@@ -1,10 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import List, Literal, Dict, Any
+import json
 from ..settings import settings
-from openai import OpenAI
+from ..cache import bypass, cache_key, response_cache
+from ..singleflight import flights
+from ..scheduler import scheduler
+from ..context import get_counter
+from ..providers.openai import get_provider
+from ..orchestrator import normalize_steps, plan_events, replay_plan_events
+from ..metrics import measure_stream
+from ..sse import resume_response, sse_response
 
-client = OpenAI(api_key=settings.openai_api_key)
 router = APIRouter(prefix="/plan", tags=["planner"])
 
 class Msg(BaseModel):
@@ -13,26 +21,152 @@ class Msg(BaseModel):
 
 class PlanRequest(BaseModel):
     messages: List[Msg]
+    graph: bool = False  # also return `steps` with dependency edges for /execute
+
+PLAN_PROMPT = (
+    "You are a senior software planner.\n"
+    "Return a concise plan as JSON with keys: plan (array of steps), summary (string).\n"
+    "Each plan step should be an imperative action.\n"
+)
+
+GRAPH_PLAN_PROMPT = (
+    "You are a senior software planner.\n"
+    "Return a concise plan as JSON with keys: steps (array), summary (string).\n"
+    "Each step is an object {\"id\": \"s1\", \"action\": \"...\", \"depends_on\": [\"...\"]}: "
+    "action is an imperative action and depends_on lists the ids of steps that must finish first.\n"
+    "Only add a dependency when a step needs another step's result, so independent steps "
+    "(e.g. writing tests and updating docs) can run in parallel.\n"
+)
+
+def graph_plan(txt: str) -> str:
+    """Normalize a dependency-graph plan and add the flat `plan` list older clients read."""
+    try:
+        obj = json.loads(txt)
+    except ValueError:
+        return txt
+    if not isinstance(obj, dict) or not isinstance(obj.get("steps"), list):
+        return txt
+    steps = normalize_steps(obj["steps"], strict=False)
+    return json.dumps({**obj, "steps": steps, "plan": [s["action"] for s in steps]})
+
+def plan_inputs(req: PlanRequest):
+    """System prompt, model messages and cache key shared by /plan and /plan/stream."""
+    system = GRAPH_PLAN_PROMPT if req.graph else PLAN_PROMPT
+    messages = [{"role":"system","content":system}] + [m.dict() for m in req.messages]
+    key = cache_key(
+        endpoint="plan",
+        model=settings.model,
+        system=system,
+        messages=[m.dict() for m in req.messages],
+        temperature=0.2,
+        response_format="json_object",
+    )
+    tokens = get_counter().count(system + "".join(m.content for m in req.messages))
+    return messages, key, tokens + settings.scheduler_output_tokens
+
+def finish_plan(txt: str, graph: bool) -> str:
+    txt = txt or "{}"
+    return graph_plan(txt) if graph else txt
 
 @router.post("")
-async def make_plan(req: PlanRequest):
+async def make_plan(req: PlanRequest, request: Request):
     """Use a planning prompt to return a structured plan.
     The response is JSON with a `plan` array of steps and a `summary` string.
+    With `graph`, it also has `steps`: [{id, action, depends_on}] for /execute.
     """
-    system = (
-        "You are a senior software planner.\n"
-        "Return a concise plan as JSON with keys: plan (array of steps), summary (string).\n"
-        "Each plan step should be an imperative action.\n"
-    )
+    messages, key, tokens = plan_inputs(req)
+    if not bypass(request):
+        cached = response_cache.get(key)
+        if cached is not None:
+            return Response(cached, media_type="application/json")
+
+    async def compute() -> str:
+        async with scheduler.admit("plan", tokens):
+            return await plan_completion()
+
+    async def plan_completion() -> str:
+        try:
+            txt = await get_provider().acomplete(
+                messages,
+                temperature=0.2,
+                response_format={"type":"json_object"},
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        txt = finish_plan(txt, req.graph)
+        response_cache.set(key, txt)
+        return txt
+
+    # Duplicate concurrent plans (retries, the dual panel) share one model call
+    return Response(await flights.do(key, compute), media_type="application/json")
+
+def done_event(txt: str) -> Dict[str, Any]:
     try:
-        resp = client.chat.completions.create(
-            model=settings.model,
-            messages=[{"role":"system","content":system}] + [m.dict() for m in req.messages],
-            temperature=0.2,
-            response_format={"type":"json_object"},
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-    txt = resp.choices[0].message.content or "{}"
-    return txt
\ No newline at end of file
+        obj = json.loads(txt)
+    except ValueError:
+        obj = None
+    if not isinstance(obj, dict):
+        return {"type": "error", "error": "Planner returned invalid JSON"}
+    return {**obj, "type": "done"}
+
+@router.post("/stream")
+async def stream_plan(req: PlanRequest, request: Request):
+    """Stream the plan as SSE events while the model is still writing it.
+
+    Each step is sent as soon as its JSON value closes (a `step` event,
+    {"type": "step", "index", "step"}), then `summary`, then `done` with
+    {"type": "done", ...the document /plan would return}; a failure is an
+    `error` event followed by `done`. Shares /plan's cache. A dropped
+    connection can resume by re-sending the request with Last-Event-ID.
+    """
+    resumed = resume_response(request, error_message=get_provider().map_error)
+    if resumed is not None:
+        return resumed
+    messages, key, tokens = plan_inputs(req)
+
+    cached = None if bypass(request) else response_cache.get(key)
+    if cached is not None:
+        async def replay():
+            for event in [*replay_plan_events(cached, req.graph), done_event(cached)]:
+                yield event["type"], event
+        return sse_response(request, replay(), headers={"X-Cache": "HIT"})
+
+    # Not shared with /plan's single flight: that one yields a document, this one events
+    flight_key = f"stream:{key}"
+    slot = None
+    if not flights.in_flight(flight_key):
+        slot = await scheduler.acquire("plan", tokens)
+        if flights.in_flight(flight_key):
+            slot.release()
+            slot = None
+
+    async def record():
+        parts = []
+
+        async def chunks():
+            upstream = get_provider().achat_completion_stream(
+                messages, temperature=0.2, response_format={"type":"json_object"})
+            async for chunk in measure_stream("provider.stream", upstream):
+                parts.append(chunk)
+                yield chunk
+
+        try:
+            async for event in plan_events(chunks(), req.graph):
+                yield event
+            txt = finish_plan("".join(parts), req.graph)
+            done = done_event(txt)
+            if done["type"] == "done":
+                response_cache.set(key, txt)
+            yield done
+        finally:
+            if slot is not None:
+                slot.release()
+
+    events = flights.stream(flight_key, record)
+
+    async def named():
+        async for event in events:
+            yield event["type"], event
+
+    return sse_response(request, named(), error_message=get_provider().map_error, resumable=True)
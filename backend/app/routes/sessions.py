@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException
+
+from ..schemas import SessionCreate
+from ..sessions import session_store
+
+router = APIRouter(prefix="/sessions", tags=["sessions"])
+
+@router.post("")
+def create_session(req: SessionCreate):
+    """Start a server-side conversation, optionally seeded with earlier messages.
+
+    Pass the returned `session_id` to /chat or /chat/stream with only the new
+    message; an expired session answers 404 and can be recreated from the
+    client's copy of the conversation.
+    """
+    session = session_store.create([m.dict() for m in req.messages])
+    return {"session_id": session.id, "messages": session.end}
+
+@router.get("/{session_id}")
+def get_session(session_id: str):
+    """The stored conversation: `summary` stands for the first `summarized` messages."""
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return session.to_dict()
+
+@router.delete("/{session_id}")
+def delete_session(session_id: str):
+    return {"deleted": session_store.delete(session_id)}
@@ -0,0 +1,189 @@
+"""
+Admission control for LLM calls.
+
+Every model/agent call takes a slot from the scheduler first. A slot needs
+free concurrency (`scheduler_max_in_flight` per worker process), one request
+from the requests/min bucket and the estimated prompt + reply tokens from the
+tokens/min bucket. Waiting requests are served strictly by priority (lower
+number first, FIFO within a level; see `scheduler_priorities`), each level's
+queue is bounded, and a request that can't be admitted before its deadline is
+shed with `Overloaded`, which the app turns into a 503 with Retry-After.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .metrics import timed
+from .settings import settings
+
+class Overloaded(Exception):
+    """Raised when a request is shed; `retry_after` is a hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Continuous-refill bucket holding up to one minute's worth of `per_minute`."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (amounts above capacity are clamped)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self._refill()
+            self.level -= min(amount, self.capacity)
+
+class Slot:
+    """An admitted request; release() it when the call finishes (idempotent)."""
+
+    def __init__(self, scheduler: "Scheduler"):
+        self._scheduler = scheduler
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler._release()
+
+class Scheduler:
+    def __init__(self, rpm: int, tpm: int, max_in_flight: int, queue_size: int,
+                 deadline: float, priorities: Dict[str, int], enabled: bool = True):
+        self.enabled = enabled
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.deadline = deadline
+        self.priorities = priorities
+        self.in_flight = 0
+        # (priority, seq, tokens, future); cancelled entries are skipped lazily
+        self._heap: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._queued: Dict[int, int] = {}
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.admitted = 0
+        self.shed = 0
+
+    def priority(self, kind: str) -> int:
+        return self.priorities.get(kind, max(self.priorities.values(), default=0))
+
+    def _wait_time(self, tokens: int) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _retry_after(self, tokens: int) -> float:
+        backlog = len(self._heap) + 1
+        return max(1.0, math.ceil(max(self.requests.wait_time(backlog), self.tokens.wait_time(tokens))))
+
+    def _shed(self, reason: str, tokens: int) -> Overloaded:
+        self.shed += 1
+        return Overloaded(reason, self._retry_after(tokens))
+
+    def _admit(self, tokens: int):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        self.admitted += 1
+
+    @timed("scheduler.queue")
+    async def acquire(self, kind: str, tokens: int, deadline: Optional[float] = None) -> Slot:
+        """Wait for a slot for a `kind` request of about `tokens` tokens, or raise Overloaded."""
+        priority = self.priority(kind)
+        if not self.enabled:
+            self.in_flight += 1
+            return Slot(self)
+        if not self._heap and self.in_flight < self.max_in_flight and self._wait_time(tokens) == 0:
+            self._admit(tokens)
+            return Slot(self)
+        if self._queued.get(priority, 0) >= self.queue_size:
+            raise self._shed(f"queue full for {kind} requests", tokens)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), tokens, future))
+        self._queued[priority] = self._queued.get(priority, 0) + 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.deadline if deadline is None else deadline)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                raise self._shed(f"not admitted within deadline ({kind})", tokens)
+        except asyncio.CancelledError:
+            if not future.cancel():  # admitted just as the caller went away
+                self._release()
+            raise
+        finally:
+            self._queued[priority] -= 1
+        return Slot(self)
+
+    @asynccontextmanager
+    async def admit(self, kind: str, tokens: int, deadline: Optional[float] = None) -> AsyncIterator[Slot]:
+        slot = await self.acquire(kind, tokens, deadline)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._heap and self.in_flight < self.max_in_flight:
+            _priority, _seq, tokens, future = self._heap[0]
+            if future.done():  # timed out or cancelled while queued
+                heapq.heappop(self._heap)
+                continue
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                # Head of line waits for the buckets; lower priorities wait behind it.
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._heap)
+            self._admit(tokens)
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": sum(1 for entry in self._heap if not entry[3].done()),
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+scheduler = Scheduler(
+    rpm=settings.scheduler_rpm,
+    tpm=settings.scheduler_tpm,
+    max_in_flight=settings.scheduler_max_in_flight,
+    queue_size=settings.scheduler_queue_size,
+    deadline=settings.scheduler_deadline,
+    priorities=settings.scheduler_priorities,
+    enabled=settings.scheduler_enabled,
+)
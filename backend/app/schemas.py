@@ -12,7 +12,17 @@ class ChatRequest(BaseModel):
     mode: ModeName = "coder"
     project_context: Optional[Dict[str, Any]] = None  # files, paths, metadata
     custom_rules: Optional[Dict[str, str]] = None  # global and project rules
+    # With a session, `messages` is only the new turn; the server holds the history
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     content: str
-    meta: Dict[str, Any] = Field(default_factory=dict)
\ No newline at end of file
+    meta: Dict[str, Any] = Field(default_factory=dict)
+
+class ChatBatchRequest(BaseModel):
+    # ChatRequest objects, validated one by one so a malformed item fails alone
+    requests: List[Dict[str, Any]]
+    concurrency: Optional[int] = None  # capped at settings.chat_batch_concurrency
+
+class SessionCreate(BaseModel):
+    messages: List[ChatMessage] = []  # e.g. a client's history when its session expired
@@ -0,0 +1,318 @@
+"""
+Server-side chat sessions: the client sends a session id and only the new turn.
+
+A session holds the recent messages of a conversation plus a running summary
+of the older ones. Once the unsummarized messages outgrow
+`session_compact_tokens`, all but the last `session_keep_messages` are folded
+into the summary by a background model call, so the prompt built from a
+session stays bounded however long it runs.
+
+Sessions live in an in-memory LRU with an idle TTL and, when `session_db` is
+set, in a SQLite file that every uvicorn worker on the host shares; the
+memory copy is brought up to date from it on each lookup. A turn is stored
+only after it has been answered, so a failed request can simply be retried.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .context import get_counter, token_budget
+from .scheduler import scheduler
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a conversation between a user and a coding assistant.\n"
+    "Merge the summary so far (if any) with the new messages into one updated summary. Keep "
+    "decisions, requirements, file and symbol names, code facts and open questions; drop "
+    "pleasantries and superseded details. Write terse notes, not prose.\n"
+)
+
+class Session:
+    """A conversation: `summary` covers messages before `start`, `messages` the rest."""
+
+    __slots__ = ("id", "messages", "summary", "start", "touched")
+
+    def __init__(self, session_id: str, messages: Optional[List[Dict[str, str]]] = None,
+                 summary: str = "", start: int = 0, touched: Optional[float] = None):
+        self.id = session_id
+        self.messages = messages or []
+        self.summary = summary
+        self.start = start
+        self.touched = time.time() if touched is None else touched
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.messages)
+
+    def copy(self) -> "Session":
+        return Session(self.id, list(self.messages), self.summary, self.start, self.touched)
+
+    def history(self) -> List[Dict[str, str]]:
+        """Messages to send before a new turn: the summary, then the recent messages."""
+        if not self.summary:
+            return list(self.messages)
+        return [{"role": "system", "content": f"{SUMMARY_HEADER}\n{self.summary}"}] + self.messages
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"session_id": self.id, "summary": self.summary, "summarized": self.start,
+                "messages": self.messages}
+
+def split_summary(history: List[Dict[str, Any]]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """Separate the summary message Session.history() starts with: (summary or None, the rest)."""
+    first = history[0] if history else {}
+    if first.get("role") == "system" and (first.get("content") or "").startswith(SUMMARY_HEADER):
+        return first["content"], history[1:]
+    return None, history
+
+class SessionStore:
+    """LRU + idle TTL memory tier over an optional SQLite tier."""
+
+    def __init__(self, max_sessions: int, ttl: float, db_path: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.db_path = db_path
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        self.compactions = 0
+
+    def _get_db(self) -> Optional[sqlite3.Connection]:
+        if self.db_path is None or self._db is not None:
+            return self._db
+        try:
+            db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS sessions "
+                       "(id TEXT PRIMARY KEY, summary TEXT NOT NULL, start INTEGER NOT NULL, touched REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS session_messages (session_id TEXT NOT NULL, "
+                       "seq INTEGER NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL, "
+                       "PRIMARY KEY (session_id, seq))")
+        except sqlite3.Error:
+            logger.exception("sessions: disabling disk tier at %s", self.db_path)
+            self.db_path = None
+            return None
+        self._db = db
+        return db
+
+    def _remember(self, session: Session):
+        with self._lock:
+            self._sessions[session.id] = session
+            self._sessions.move_to_end(session.id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _forget(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def create(self, messages: Optional[List[Dict[str, str]]] = None) -> Session:
+        session = Session(uuid.uuid4().hex)
+        db = self._get_db()
+        if db is not None:
+            with self._db_lock:
+                db.execute("INSERT INTO sessions (id, summary, start, touched) VALUES (?, '', 0, ?)",
+                           (session.id, session.touched))
+        self._remember(session)
+        if messages:
+            return self.append(session.id, messages)
+        return session.copy()
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """A snapshot of the session, or None if it is unknown or expired."""
+        db = self._get_db()
+        if db is not None:
+            return self._sync(db, session_id)
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if session.touched + self.ttl <= now:
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session.copy()
+
+    def _sync(self, db: sqlite3.Connection, session_id: str) -> Optional[Session]:
+        # Other workers may have added turns or compacted since this copy was loaded
+        with self._lock:
+            cached = self._sessions.get(session_id)
+            cached = cached.copy() if cached is not None else None
+        try:
+            with self._db_lock:
+                row = db.execute("SELECT summary, start, touched FROM sessions WHERE id = ?",
+                                 (session_id,)).fetchone()
+                if row is None or row[2] + self.ttl <= time.time():
+                    session = None
+                else:
+                    summary, start, touched = row
+                    if cached is None or cached.start != start:
+                        cached = Session(session_id, [], summary, start, touched)
+                    rows = db.execute("SELECT role, content FROM session_messages "
+                                      "WHERE session_id = ? AND seq >= ? ORDER BY seq",
+                                      (session_id, cached.end)).fetchall()
+                    cached.messages.extend({"role": role, "content": content} for role, content in rows)
+                    cached.summary, cached.touched = summary, touched
+                    session = cached
+        except sqlite3.Error:
+            logger.warning("sessions: disk read failed", exc_info=True)
+            return cached
+        if session is None:
+            self._forget(session_id)
+            return None
+        self._remember(session.copy())
+        return session
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]) -> Optional[Session]:
+        """Add messages at the end of a session; None if it no longer exists."""
+        now = time.time()
+        db = self._get_db()
+        if db is None:
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return None
+                session.messages.extend(messages)
+                session.touched = now
+                self._sessions.move_to_end(session_id)
+                return session.copy()
+
+        try:
+            with self._db_lock:
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    row = db.execute("SELECT start FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                    if row is None:
+                        db.execute("ROLLBACK")
+                        return None
+                    last = db.execute("SELECT MAX(seq) FROM session_messages WHERE session_id = ?",
+                                      (session_id,)).fetchone()[0]
+                    seq = row[0] if last is None else last + 1
+                    db.executemany("INSERT INTO session_messages (session_id, seq, role, content) "
+                                   "VALUES (?, ?, ?, ?)",
+                                   [(session_id, seq + i, m["role"], m["content"]) for i, m in enumerate(messages)])
+                    db.execute("UPDATE sessions SET touched = ? WHERE id = ?", (now, session_id))
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._sweep(db)
+        except sqlite3.Error:
+            logger.warning("sessions: disk write failed", exc_info=True)
+            return None
+        return self._sync(db, session_id)
+
+    def _sweep(self, db: sqlite3.Connection):
+        cutoff = time.time() - self.ttl
+        db.execute("DELETE FROM session_messages WHERE session_id IN "
+                   "(SELECT id FROM sessions WHERE touched <= ?)", (cutoff,))
+        db.execute("DELETE FROM sessions WHERE touched <= ?", (cutoff,))
+
+    def compact(self, session_id: str, summary: str, start: int, upto: int) -> bool:
+        """Replace messages [start, upto) with `summary`, unless the session moved on meanwhile."""
+        db = self._get_db()
+        if db is None:
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is None or session.start != start:
+                    return False
+                del session.messages[:upto - start]
+                session.summary, session.start = summary, upto
+                self.compactions += 1
+                return True
+
+        try:
+            with self._db_lock:
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    updated = db.execute("UPDATE sessions SET summary = ?, start = ? WHERE id = ? AND start = ?",
+                                         (summary, upto, session_id, start)).rowcount
+                    if updated:
+                        db.execute("DELETE FROM session_messages WHERE session_id = ? AND seq < ?",
+                                   (session_id, upto))
+                    db.execute("COMMIT")
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error:
+            logger.warning("sessions: disk write failed", exc_info=True)
+            return False
+        if updated:
+            self._forget(session_id)  # reloaded from the new start on next use
+            with self._lock:
+                self.compactions += 1
+        return bool(updated)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            deleted = self._sessions.pop(session_id, None) is not None
+        db = self._get_db()
+        if db is not None:
+            with self._db_lock:
+                db.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+                deleted = db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0 or deleted
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "compactions": self.compactions,
+                "compacting": len(_compacting),
+                "disk": self.db_path is not None,
+            }
+
+session_store = SessionStore(
+    max_sessions=settings.session_max_sessions,
+    ttl=settings.session_ttl,
+    db_path=settings.session_db,
+)
+
+# Background compactions in progress, by session id (also keeps the tasks referenced)
+_compacting: Dict[str, asyncio.Task] = {}
+
+def maybe_compact(session: Session):
+    """Start a background compaction if the session's recent messages are over budget."""
+    keep = settings.session_keep_messages
+    if session.id in _compacting or len(session.messages) <= keep:
+        return
+    counter = get_counter()
+    if sum(counter.message(m) for m in session.messages) <= settings.session_compact_tokens:
+        return
+    task = asyncio.create_task(_compact(session, len(session.messages) - keep))
+    _compacting[session.id] = task
+    task.add_done_callback(lambda _task: _compacting.pop(session.id, None))
+
+async def _compact(session: Session, count: int):
+    from .providers.openai import get_provider
+
+    counter = get_counter()
+    transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in session.messages[:count])
+    if session.summary:
+        transcript = f"Summary so far:\n{session.summary}\n\nNew messages:\n{transcript}"
+    limit = token_budget(counter.model) - counter.count(SUMMARY_PROMPT) - settings.session_summary_tokens
+    if counter.count(transcript) > limit:
+        transcript = counter.truncate(transcript, max(limit, 0))
+    messages = [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": transcript}]
+    tokens = counter.count(SUMMARY_PROMPT) + counter.count(transcript) + settings.session_summary_tokens
+    try:
+        async with scheduler.admit("compact", tokens):
+            summary = await get_provider().acomplete(messages, temperature=0.2,
+                                                     max_tokens=settings.session_summary_tokens)
+    except Exception:
+        logger.warning("sessions: compaction of %s failed", session.id, exc_info=True)
+        return
+    if summary and summary.strip():
+        session_store.compact(session.id, summary.strip(), session.start, session.start + count)
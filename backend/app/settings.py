@@ -1,3 +1,4 @@
+from typing import Dict, Optional
 from pydantic import BaseSettings
 
 class Settings(BaseSettings):
@@ -10,6 +11,123 @@ class Settings(BaseSettings):
     model: str = "gpt-4o-mini"
     allow_execute: bool = False  # set True only when sandboxed
 
+    # OpenAI provider (one pooled client per process)
+    openai_base_url: Optional[str] = None  # e.g. a local mock server
+    openai_max_connections: int = 100
+    openai_max_keepalive: int = 20
+    openai_keepalive_expiry: float = 30.0
+    openai_max_retries: int = 3  # on 429/5xx/connection errors
+    openai_backoff_base: float = 0.5  # seconds; doubled per attempt, full jitter
+    openai_backoff_max: float = 20.0  # cap, also applied to Retry-After
+    openai_hedge_percentile: float = 0.0  # e.g. 0.95 hedges calls slower than p95; 0 = off
+    openai_hedge_min_samples: int = 20  # latency samples needed before hedging
+    openai_hedge_min_delay: float = 0.5
+
+    # Prompt templates and rules files are re-checked for changes at most this often (seconds)
+    prompt_check_interval: float = 1.0
+
+    # Admission control for model/agent calls (per worker process)
+    scheduler_enabled: bool = True
+    scheduler_rpm: int = 500  # requests/min; 0 = unlimited
+    scheduler_tpm: int = 200000  # prompt + reply tokens/min; 0 = unlimited
+    scheduler_max_in_flight: int = 32
+    scheduler_queue_size: int = 64  # waiting requests per priority level
+    scheduler_deadline: float = 10.0  # seconds to wait for admission before a 503
+    scheduler_output_tokens: int = 512  # reply tokens assumed when estimating a request
+    scheduler_priorities: Dict[str, int] = {  # lower is served first
+        "ask": 0, "coder": 0, "debugger": 1, "architect": 1, "plan": 1, "execute": 2, "batch": 2,
+        "compact": 2,  # background summaries of long sessions
+    }
+
+    # /chat/batch
+    chat_batch_max_items: int = 500
+    chat_batch_concurrency: int = 8  # items answered at once per batch (upper bound for requests)
+    chat_batch_deadline: float = 120.0  # admission wait per item; batches are patient
+
+    # Server-Sent Events framing (/chat/stream, /plan/stream, /execute)
+    sse_coalesce_window: float = 0.03  # seconds; deltas in a burst are written together
+    sse_coalesce_bytes: int = 8192  # write sooner once this much is pending
+    sse_heartbeat_interval: float = 15.0  # keep-alive comment after this much silence; 0 = off
+    sse_compression: bool = False  # gzip streams for clients that accept it
+
+    # Resumable streams: reconnect with Last-Event-ID while generation continues
+    stream_resume_enabled: bool = True
+    stream_buffer_events: int = 4096  # items kept per stream for resuming
+    stream_grace_period: float = 60.0  # finished streams stay resumable this long
+    stream_idle_timeout: float = 30.0  # cancel generation nobody has read for this long
+
+    # Server-side chat sessions (session_id + only the new turn)
+    session_max_sessions: int = 1000  # kept in memory; the least recently used are dropped
+    session_ttl: float = 24 * 3600.0  # idle seconds before a session expires
+    session_db: Optional[str] = None  # SQLite file shared by workers; None = memory only
+    session_compact_tokens: int = 6000  # summarize older messages beyond this
+    session_keep_messages: int = 8  # most recent messages are never summarized
+    session_summary_tokens: int = 600  # longest summary
+
+    # Context packing: prompt token budget per request (0 = the model's whole window)
+    context_max_tokens: int = 16000
+    context_reserve_tokens: int = 2048  # left free for the reply
+
+    # Response cache for /plan and /chat
+    response_cache_enabled: bool = True
+    response_cache_max_entries: int = 512
+    response_cache_ttl: float = 600.0  # seconds
+    response_cache_db: Optional[str] = None  # SQLite file shared by workers; None = memory only
+
+    # Kilocode bridge worker pool (long-lived `node bridge.js --server` processes)
+    bridge_pool_size: int = 2
+    bridge_max_requests: int = 200  # recycle a worker after this many requests
+    bridge_request_timeout: float = 60.0
+    bridge_health_interval: float = 30.0  # seconds between pings of idle workers
+    bridge_warmup: bool = True  # spawn workers in the background at app startup
+    bridge_script: Optional[str] = None  # alternative bridge.js (e.g. bench/fake_agent/bridge.js)
+
+    # /execute of a step graph: independent steps run concurrently on pooled workers
+    execute_parallelism: int = 0  # max steps at once; 0 = bridge_pool_size
+    execute_dependency_chars: int = 4000  # output of each dependency passed to a step
+
+    # /chat stage budgets (seconds)
+    bridge_latency_budget: float = 3.0  # start the OpenAI fallback in parallel after this
+    chat_bridge_timeout: float = 60.0
+    openai_timeout: float = 60.0
+
+    # FileSystemTool limits
+    fs_max_file_size: int = 32 * 1024 * 1024  # largest file read_file_snippet will open
+    fs_line_index_max_bytes: int = 64 * 1024 * 1024  # cached line-offset tables
+
+    # FileSystemTool directory index cache
+    fs_index_max_bytes: int = 256 * 1024 * 1024  # evict least recently used roots beyond this
+    fs_index_poll_interval: float = 2.0  # mtime polling when inotify is unavailable
+    fs_index_watch: bool = True  # use inotify on Linux
+    fs_index_max_roots: int = 32  # retrieval, outline and trigram indexes kept, least recently used evicted
+
+    # Optional trigram index for search_files; set a directory to enable it
+    fs_trigram_index_dir: Optional[str] = None
+    fs_trigram_max_file_size: int = 1024 * 1024  # larger text files are always scanned
+    fs_trigram_merge_threshold: int = 256  # changed files held in memory before a merge
+
+    # Parallel search (/tools/fs/search)
+    fs_search_workers: int = 0  # process pool size; 0 = one per CPU
+    fs_search_max_results: int = 200
+    fs_search_time_limit: float = 10.0
+
+    # Relevant code chunks for chat context (in-process BM25 over the project path)
+    retrieval_enabled: bool = True
+    retrieval_top_k: int = 8
+    retrieval_max_tokens: int = 2000  # context budget for retrieved chunks
+    retrieval_chunk_lines: int = 60  # longest chunk; bigger definitions are split
+    retrieval_max_file_size: int = 512 * 1024
+    retrieval_build_wait: float = 5.0  # how long /tools/fs/retrieve waits for a first build
+
+    # Symbol outlines (classes, functions, signatures) as compact project context
+    outline_max_tokens: int = 1500  # context budget for the ranked outline
+    outline_max_file_size: int = 512 * 1024
+
+    # Cold start (see app.startup)
+    provider_warmup: bool = True  # load the OpenAI client in the background at app startup
+    openapi_snapshot: Optional[str] = None  # JSON file /openapi.json is served from (and saved to)
+    openapi_precompute: bool = False  # build or load the schema in the background at startup
+
     class Config:
         env_file = ".env"
 
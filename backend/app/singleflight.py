@@ -0,0 +1,128 @@
+"""
+Single-flight coalescing of identical concurrent requests.
+
+`SingleFlight.do(key, fn)` runs `fn()` once per key at a time; concurrent
+callers with the same key await the same result. `SingleFlight.stream(key,
+factory)` does the same for async streams: one upstream iteration feeds a
+buffer that every subscriber reads from the start, so late joiners get the
+full stream replayed before the live tail.
+
+The shared work is cancelled only when every caller has gone away.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class _Broadcast:
+    """Buffers one async stream and replays it to any number of subscribers."""
+
+    def __init__(self, source: AsyncIterator[Any], on_finish: Callable[["_Broadcast"], None]):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._on_finish = on_finish
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[Any]):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_finish(self)
+            self._notify()
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        self.subscribers += 1
+        i = 0
+        try:
+            while True:
+                if i < len(self.items):
+                    yield self.items[i]
+                    i += 1
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Last subscriber left: stop the upstream and let the next request start fresh.
+                self._on_finish(self)
+                self._task.cancel()
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return fn()'s result, sharing one execution among concurrent callers of `key`."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t: self._forget(self._calls, key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # Shielded: one caller being cancelled must not cancel the others' result.
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(self._calls, key, call)
+                call.task.cancel()
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Subscribe to the in-flight stream for `key`, starting `factory()` if there is none."""
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast(factory(), lambda b: self._forget(self._streams, key, b))
+            self._streams[key] = broadcast
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return broadcast.subscribe()
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls or key in self._streams
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, entry: Any):
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
+
+flights = SingleFlight()
@@ -0,0 +1,212 @@
+"""
+Server-Sent Events framing shared by the streaming endpoints.
+
+`sse_response` turns an async iterator into a text/event-stream response:
+
+- str items are text deltas. Deltas arriving in a burst are merged into one
+  `delta` event, and frames pending within `sse_coalesce_window` go out in
+  one write (sooner once `sse_coalesce_bytes` pile up) instead of a write per
+  token. An item that arrives after a quiet spell - the first one included -
+  is written at once, so time to first token doesn't change.
+- (event, payload) tuples are named events; non-str payloads are sent as JSON.
+- Multi-line data becomes several `data:` lines, which clients join back
+  with "\\n", so a token containing a blank line can't end an event early.
+- A `: keep-alive` comment is written after `sse_heartbeat_interval` of
+  silence so proxies don't drop an idle stream.
+- The stream ends with `event: done` (data `[DONE]`) unless the source sent
+  its own `done` event; a failure is reported as `event: error` first.
+
+With `sse_compression` on and a client that accepts gzip, the stream is
+gzipped with a sync flush per write, so every write decodes on arrival.
+"""
+import asyncio
+import json
+import math
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+from fastapi.responses import StreamingResponse
+from starlette.requests import Request
+
+from .resumable import resume as resume_stream, start as start_resumable
+from .settings import settings
+from .streaming import cancel_on_disconnect
+
+Item = Union[str, Tuple[str, Any]]
+
+def format_event(data: str, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    lines = [f"event: {event}"] if event else []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.extend(f"data: {line}" for line in data.replace("\r\n", "\n").replace("\r", "\n").split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+def encode_item(item: Item, event_id: Optional[str] = None) -> str:
+    if isinstance(item, str):
+        return format_event(item, "delta", event_id)
+    event, payload = item
+    return format_event(payload if isinstance(payload, str) else json.dumps(payload), event, event_id)
+
+async def encode_events(source: AsyncIterator[Item],
+                        error_message: Callable[[Exception], str] = str,
+                        window: Optional[float] = None,
+                        max_bytes: Optional[int] = None,
+                        heartbeat: Optional[float] = None,
+                        with_ids: bool = False) -> AsyncIterator[str]:
+    """Encode `source` as SSE text, coalescing writes (see the module docstring).
+
+    With `with_ids`, the source yields (event id, item) pairs and events carry
+    `id:` (a merged delta has the id of its last part).
+    """
+    window = settings.sse_coalesce_window if window is None else window
+    max_bytes = settings.sse_coalesce_bytes if max_bytes is None else max_bytes
+    heartbeat = settings.sse_heartbeat_interval if heartbeat is None else heartbeat
+    loop = asyncio.get_running_loop()
+
+    frames: List[str] = []  # encoded, not yet written
+    deltas: List[str] = []  # text deltas to merge into the next delta event
+    delta_id: Optional[str] = None
+    pending_bytes = 0
+    last_write = -math.inf  # so the first item is written at once
+    last_sent = loop.time()  # any write, heartbeats included
+    deadline: Optional[float] = None  # when pending frames must be written
+    done_sent = False
+    error: Optional[Exception] = None
+
+    def close_delta():
+        if deltas:
+            frames.append(format_event("".join(deltas), "delta", delta_id))
+            deltas.clear()
+
+    def take() -> str:
+        nonlocal pending_bytes, deadline
+        close_delta()
+        out = "".join(frames)
+        frames.clear()
+        pending_bytes, deadline = 0, None
+        return out
+
+    items = source.__aiter__()
+    nxt: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if nxt is None:
+                nxt = asyncio.ensure_future(items.__anext__())
+            if deadline is not None:
+                timeout = max(0.0, deadline - loop.time())
+            else:
+                timeout = max(0.0, last_sent + heartbeat - loop.time()) if heartbeat else None
+            done, _ = await asyncio.wait({nxt}, timeout=timeout)
+            if not done:
+                if deadline is not None:
+                    yield take()
+                    last_write = loop.time()
+                else:
+                    yield ": keep-alive\n\n"
+                last_sent = loop.time()
+                continue
+
+            task, nxt = nxt, None
+            try:
+                item = task.result()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                error = e
+                break
+            event_id = None
+            if with_ids:
+                event_id, item = item
+            if isinstance(item, str):
+                if not item:
+                    continue
+                deltas.append(item)
+                delta_id = event_id
+                pending_bytes += len(item)
+            else:
+                close_delta()
+                frame = encode_item(item, event_id)
+                frames.append(frame)
+                pending_bytes += len(frame)
+                done_sent = done_sent or item[0] == "done"
+
+            now = loop.time()
+            if now - last_write >= window or pending_bytes >= max_bytes:
+                yield take()
+                last_write = last_sent = now
+            elif deadline is None:
+                deadline = now + window
+
+        close_delta()
+        if error is not None:
+            frames.append(encode_item(("error", {"type": "error", "error": error_message(error)})))
+        if not done_sent:
+            frames.append(format_event("[DONE]", "done"))
+        tail = take()
+        if tail:
+            yield tail
+    finally:
+        if nxt is not None:
+            nxt.cancel()
+            await asyncio.wait({nxt})
+        aclose = getattr(items, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+async def _gzip(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+        async for chunk in chunks:
+            yield compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    finally:
+        await chunks.aclose()
+
+def sse_response(request: Request, source: AsyncIterator[Item],
+                 headers: Optional[Dict[str, str]] = None,
+                 error_message: Callable[[Exception], str] = str,
+                 resumable: bool = False) -> StreamingResponse:
+    """Stream `source` as SSE.
+
+    A `resumable` stream keeps generating when the client goes away and can
+    be picked up again with Last-Event-ID (see app.resumable); otherwise a
+    disconnect closes the source.
+    """
+    if resumable and settings.stream_resume_enabled:
+        stream = start_resumable(source)
+        return _encoded_response(request, cancel_on_disconnect(request, stream.subscribe()),
+                                 headers, error_message, with_ids=True)
+    return _encoded_response(request, cancel_on_disconnect(request, source), headers, error_message)
+
+def resume_response(request: Request, headers: Optional[Dict[str, str]] = None,
+                    error_message: Callable[[Exception], str] = str) -> Optional[StreamingResponse]:
+    """The rest of a resumable stream when the request carries its Last-Event-ID, else None."""
+    if not settings.stream_resume_enabled:
+        return None
+    rest = resume_stream(request)
+    if rest is None:
+        return None
+    return _encoded_response(request, cancel_on_disconnect(request, rest),
+                             {**(headers or {}), "X-Resumed": "1"}, error_message, with_ids=True)
+
+def _encoded_response(request: Request, source: AsyncIterator[Any], headers: Optional[Dict[str, str]],
+                      error_message: Callable[[Exception], str], with_ids: bool = False) -> StreamingResponse:
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",  # nginx and friends: don't buffer the stream
+        **(headers or {}),
+    }
+    body = encode_events(source, error_message, with_ids=with_ids)
+    if settings.sse_compression and accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        return StreamingResponse(_gzip(body), media_type="text/event-stream", headers=headers)
+    return StreamingResponse(body, media_type="text/event-stream", headers=headers)
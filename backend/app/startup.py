@@ -0,0 +1,101 @@
+"""
+Startup timing, background warm-up and readiness.
+
+Nothing slow runs before the server accepts connections. The bridge workers,
+the OpenAI client and (with `openapi_precompute`) the OpenAPI schema are
+warmed by a background task once the app has started, and a request that
+needs one of them first still creates it on demand. /healthz answers as soon
+as the process serves; /readyz also reports whether the warm-up is done.
+
+`kilocode_startup_seconds{phase}` measures each phase from process start:
+`imported` (the app module loaded), `serving` (startup handlers done, the
+socket is about to open) and `warm`.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
+
+from .metrics import REGISTRY
+from .settings import settings
+
+logger = logging.getLogger(__name__)
+
+def _process_start() -> float:
+    """Wall-clock time this process started (from /proc), else now."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22 is the start time in clock ticks after boot; the command name may contain spaces
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+PROCESS_START = _process_start()
+
+# Seconds from process start to each phase, once reached
+phases: Dict[str, float] = {}
+warm_errors: Dict[str, str] = {}
+_warm_task: Optional[asyncio.Task] = None
+
+def mark(phase: str):
+    phases.setdefault(phase, round(time.time() - PROCESS_START, 4))
+
+async def _warm_up(app: FastAPI):
+    from .kilocode_bridge import bridge_pool
+    from .providers.openai import get_provider
+
+    steps = {}
+    if settings.bridge_warmup:
+        steps["bridge_pool"] = bridge_pool.start()
+    if settings.provider_warmup:
+        steps["provider"] = run_in_threadpool(get_provider().warm_up)
+    if settings.openapi_precompute:
+        steps["openapi"] = run_in_threadpool(app.openapi)
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for name, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.warning("startup: warming %s failed: %s", name, result)
+            warm_errors[name] = str(result)
+    mark("warm")
+
+def start_warm_up(app: FastAPI):
+    """Start the warm-up in the background; call from a startup handler."""
+    global _warm_task
+    _warm_task = asyncio.create_task(_warm_up(app))
+    mark("serving")
+
+async def wait_warm_up():
+    """Let a running warm-up finish (on shutdown, before closing what it starts)."""
+    if _warm_task is not None and not _warm_task.done():
+        await asyncio.wait({_warm_task})
+
+def readiness(app: FastAPI) -> Dict[str, Any]:
+    from .cache import response_cache
+    from .kilocode_bridge import bridge_pool
+    from .providers.openai import get_provider
+    from .tools.fs_index import index_cache
+
+    cache = response_cache.stats()
+    return {
+        "ready": "warm" in phases,
+        "startup_seconds": dict(phases),
+        "errors": dict(warm_errors),
+        "bridge_pool": bridge_pool.stats(),
+        "provider": {"warm": get_provider().warm},
+        "openapi": {"cached": app.openapi_schema is not None},
+        "response_cache": {"entries": cache["entries"], "disk": cache["disk"]},
+        "fs_index": {"roots": index_cache.stats()["roots"]},
+    }
+
+def _startup_gauges():
+    yield ("kilocode_startup_seconds", "Seconds from process start to each startup phase.",
+           [({"phase": phase}, seconds) for phase, seconds in phases.items()])
+
+REGISTRY.register_collector(_startup_gauges)
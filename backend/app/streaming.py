@@ -0,0 +1,64 @@
+"""
+Helpers for relaying async token streams to HTTP clients.
+"""
+import asyncio
+from typing import AsyncIterator, Iterator, TypeVar
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+_DONE = object()
+
+async def _wait_for_disconnect(request: Request, poll_interval: float):
+    while not await request.is_disconnected():
+        await asyncio.sleep(poll_interval)
+
+async def cancel_on_disconnect(request: Request, source: AsyncIterator[T],
+                               poll_interval: float = 0.25) -> AsyncIterator[T]:
+    """Relay items from `source` until it ends or the client disconnects.
+
+    The next item is only requested from `source` after the previous one has
+    been handed to the response, so a slow client slows the upstream read
+    instead of growing a buffer. On disconnect the pending read is cancelled
+    and `source` is closed, which aborts the upstream request.
+    """
+    watcher = asyncio.create_task(_wait_for_disconnect(request, poll_interval))
+    nxt = None
+    try:
+        while True:
+            nxt = asyncio.ensure_future(source.__anext__())
+            await asyncio.wait({nxt, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not nxt.done():
+                return
+            try:
+                item = nxt.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        watcher.cancel()
+        # Also when we are cancelled mid-read: the source can't be closed while it runs
+        if nxt is not None and not nxt.done():
+            nxt.cancel()
+            await asyncio.wait({nxt})
+        await source.aclose()
+
+async def iterate_in_thread(source: Iterator[T]) -> AsyncIterator[T]:
+    """Iterate a blocking iterator in the threadpool, closing it when abandoned.
+
+    Unlike starlette's iterate_in_threadpool, a generator left behind by a
+    disconnect is closed right away rather than holding its state (e.g. a
+    partial directory walk) until garbage collection.
+    """
+    try:
+        while True:
+            item = await run_in_threadpool(next, source, _DONE)
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        close = getattr(source, "close", None)
+        if close is not None:
+            await run_in_threadpool(close)
@@ -1,191 +1,393 @@
+import base64
+import json
 import os
-import mimetypes
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional
 from pathlib import Path
 
+from starlette.concurrency import run_in_threadpool
+
+from ..context import get_counter
+from ..metrics import timed
+from ..settings import settings
+from . import search
+from .lines import SnippetReader, LineIndexCache
+from .fs_index import UNLIMITED_DEPTH, index_cache, is_text_file, path_within
+from .trigram import get_trigram_index, required_literals
+from .retrieval import get_chunk_index, read_span
+from .outline import get_outline_index, outline_file, rank, render, supported
+
+line_index_cache = LineIndexCache(settings.fs_line_index_max_bytes)
+
 class FileSystemTool:
     """Safe, read-only filesystem operations for AI assistance"""
 
     def __init__(self, allowed_paths: Optional[List[str]] = None):
         # Default to current working directory if no paths specified
         self.allowed_paths = allowed_paths or [os.getcwd()]
-        self.max_file_size = 1024 * 1024  # 1MB limit
+        self.max_file_size = settings.fs_max_file_size  # snippet reads are mmap-backed
         self.max_snippet_length = 2000  # Max characters per snippet
 
     def _is_path_allowed(self, path: str) -> bool:
         """Check if a path is within allowed directories"""
-        try:
-            real_path = os.path.realpath(path)
-            return any(os.path.commonpath([real_path, allowed]) == allowed
-                      for allowed in self.allowed_paths)
-        except (ValueError, OSError):
-            return False
+        return path_within(path, self.allowed_paths)
 
     def _is_text_file(self, file_path: str) -> bool:
         """Check if file is likely text-based"""
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if mime_type and mime_type.startswith('text/'):
-            return True
-
-        # Check for common text file extensions
-        text_extensions = {'.txt', '.md', '.py', '.js', '.ts', '.html', '.css',
-                          '.json', '.xml', '.yaml', '.yml', '.ini', '.cfg',
-                          '.sh', '.bash', '.sql', '.csv'}
-        return Path(file_path).suffix.lower() in text_extensions
+        return is_text_file(file_path)
 
+    @timed("fs.index_directory")
     def index_directory(self, path: str = ".", max_depth: int = 3) -> Dict[str, Any]:
-        """Index directory structure and provide file information"""
+        """Index directory structure and provide file information.
+
+        Served from a shared per-root cache that is built once and kept
+        current by a file watcher; the result must be treated as read-only.
+        """
         if not self._is_path_allowed(path):
             return {"error": f"Access denied: {path}"}
 
         try:
-            result = {
-                "path": path,
-                "files": [],
-                "directories": [],
-                "total_files": 0,
-                "total_dirs": 0
-            }
-
-            for root, dirs, files in os.walk(path):
-                # Calculate depth
-                depth = len(Path(root).relative_to(path).parts) if root != path else 0
-                if depth > max_depth:
-                    continue
-
-                # Add directories
-                for d in dirs:
-                    if depth < max_depth:
-                        result["directories"].append(os.path.join(root, d))
-                        result["total_dirs"] += 1
-
-                # Add files with metadata
-                for f in files:
-                    file_path = os.path.join(root, f)
-                    if self._is_path_allowed(file_path):
-                        file_info = {
-                            "path": file_path,
-                            "name": f,
-                            "size": os.path.getsize(file_path),
-                            "is_text": self._is_text_file(file_path)
-                        }
-                        result["files"].append(file_info)
-                        result["total_files"] += 1
+            return index_cache.get(path, max_depth).snapshot(path, self.allowed_paths)
+        except Exception as e:
+            return {"error": f"Failed to index directory: {str(e)}"}
 
-            return result
+    def invalidate_index(self, path: Optional[str] = None) -> Dict[str, Any]:
+        """Drop cached indexes for a path (or all of them)"""
+        if path is not None and not self._is_path_allowed(path):
+            return {"error": f"Access denied: {path}"}
+        return {"invalidated": index_cache.invalidate(path)}
 
+    @timed("fs.rebuild_index")
+    def rebuild_index(self, path: str = ".", max_depth: int = 3) -> Dict[str, Any]:
+        """Re-walk a path from scratch and replace its cached index"""
+        if not self._is_path_allowed(path):
+            return {"error": f"Access denied: {path}"}
+        try:
+            index = index_cache.rebuild(path, max_depth)
+            return {"path": path, "dirs": len(index.dirs), "bytes": index.nbytes}
         except Exception as e:
             return {"error": f"Failed to index directory: {str(e)}"}
 
-    def read_file_snippet(self, file_path: str, start_line: int = 1,
-                         max_lines: int = 50) -> Dict[str, Any]:
-        """Read a snippet from a text file"""
+    def _check_readable(self, file_path: str, source: bool = False) -> Optional[Dict[str, Any]]:
+        """Return an error dict if a file may not be read as a snippet
+
+        With `source`, any file the outliner parses counts as text (.tsx, .pyi, ...).
+        """
         if not self._is_path_allowed(file_path):
             return {"error": f"Access denied: {file_path}"}
 
         if not os.path.exists(file_path):
             return {"error": f"File not found: {file_path}"}
 
-        if not self._is_text_file(file_path):
+        if not (source and supported(file_path)) and not self._is_text_file(file_path):
             return {"error": f"Not a text file: {file_path}"}
 
-        try:
-            file_size = os.path.getsize(file_path)
-            if file_size > self.max_file_size:
-                return {"error": f"File too large: {file_size} bytes (max: {self.max_file_size})"}
-
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-
-            total_lines = len(lines)
-            end_line = min(start_line + max_lines - 1, total_lines)
+        file_size = os.path.getsize(file_path)
+        if file_size > self.max_file_size:
+            return {"error": f"File too large: {file_size} bytes (max: {self.max_file_size})"}
+        return None
 
-            snippet_lines = lines[start_line-1:end_line]  # 0-indexed
-            content = ''.join(snippet_lines)
-
-            # Truncate if too long
-            if len(content) > self.max_snippet_length:
-                content = content[:self.max_snippet_length] + "..."
+    def _snippet(self, reader: SnippetReader, file_path: str, start_line: int,
+                 max_lines: int) -> Dict[str, Any]:
+        end_line, content, truncated = reader.read(start_line, max_lines, self.max_snippet_length)
+        return {
+            "file_path": file_path,
+            "start_line": start_line,
+            "end_line": end_line,
+            "total_lines": reader.total_lines,
+            "content": content,
+            "truncated": truncated
+        }
+
+    @timed("fs.read_file_snippet")
+    def read_file_snippet(self, file_path: str, start_line: int = 1,
+                         max_lines: int = 50) -> Dict[str, Any]:
+        """Read a snippet from a text file"""
+        try:
+            error = self._check_readable(file_path)
+            if error:
+                return error
 
-            return {
-                "file_path": file_path,
-                "start_line": start_line,
-                "end_line": end_line,
-                "total_lines": total_lines,
-                "content": content,
-                "truncated": len(''.join(snippet_lines)) > self.max_snippet_length
-            }
+            # Seeks straight to the range via the file's cached line-offset table
+            with SnippetReader(file_path, line_index_cache) as reader:
+                return self._snippet(reader, file_path, start_line, max_lines)
 
         except Exception as e:
             return {"error": f"Failed to read file: {str(e)}"}
 
+    @timed("fs.read_file_snippets")
+    def read_file_snippets(self, ranges: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Read several snippets (from one or more files) in a single call.
+
+        Each range is {"file_path", "start_line"?, "max_lines"?}; results keep
+        the request order, and a failing range yields its own error entry.
+        """
+        snippets: List[Optional[Dict[str, Any]]] = [None] * len(ranges)
+        by_file: Dict[str, List[int]] = {}
+        for i, r in enumerate(ranges):
+            by_file.setdefault(r.get("file_path", ""), []).append(i)
+
+        for file_path, indexes in by_file.items():
+            try:
+                error = self._check_readable(file_path)
+                if error:
+                    for i in indexes:
+                        snippets[i] = error
+                    continue
+                with SnippetReader(file_path, line_index_cache) as reader:
+                    for i in indexes:
+                        snippets[i] = self._snippet(reader, file_path,
+                                                    int(ranges[i].get("start_line", 1)),
+                                                    int(ranges[i].get("max_lines", 50)))
+            except Exception as e:
+                for i in indexes:
+                    if snippets[i] is None:
+                        snippets[i] = {"error": f"Failed to read file: {str(e)}"}
+
+        return {"snippets": snippets}
+
+    @timed("fs.search_file_list")
+    def search_file_list(self, query: str, path: str = ".",
+                         file_extensions: Optional[List[str]] = None,
+                         regex: bool = False) -> List[str]:
+        """Text files worth opening for a query, in walk order.
+
+        Listed from the cached directory index and narrowed by the trigram
+        index when it is enabled.
+        """
+        dir_index = index_cache.get(path, UNLIMITED_DEPTH)
+        text_files = {rel: is_link for rel, _size, _mtime, is_link, is_text in dir_index.file_list()
+                      if is_text}
+
+        rels = text_files
+        trigram_index = get_trigram_index(path)
+        if trigram_index is not None:
+            candidates = trigram_index.candidates(dir_index, required_literals(query, regex))
+            if candidates is not None:
+                # Segment order drifts from the walk as files change; results follow the walk
+                candidates = set(candidates)
+                rels = [rel for rel in text_files if rel in candidates]
+
+        files = []
+        for rel in rels:
+            is_link = text_files.get(rel)
+            if is_link is None:
+                continue  # not a text file, or gone since the trigram index saw it
+            file_path = os.path.join(path, rel)
+
+            # Check extension filter
+            if file_extensions:
+                if Path(file_path).suffix.lower() not in file_extensions:
+                    continue
+
+            # The walk doesn't follow directory symlinks, so only symlinked files can escape
+            if is_link and not self._is_path_allowed(file_path):
+                continue
+            files.append(file_path)
+        return files
+
+    @timed("fs.search_files")
     def search_files(self, query: str, path: str = ".",
-                    file_extensions: Optional[List[str]] = None) -> Dict[str, Any]:
-        """Search for text in files"""
+                    file_extensions: Optional[List[str]] = None,
+                    regex: bool = False, max_results: Optional[int] = None,
+                    time_limit: Optional[float] = None) -> Dict[str, Any]:
+        """Search for text in files (case-insensitive literal, or regex)"""
         if not self._is_path_allowed(path):
             return {"error": f"Access denied: {path}"}
 
         try:
-            results = []
-            query_lower = query.lower()
+            files = self.search_file_list(query, path, file_extensions, regex)
+            run = search.SearchRun(max_results, time_limit)
+            results = search.search(files, query, regex, run, settings.fs_search_workers)
+            result = {"query": query, "results": results}
+            if run.truncated:
+                result["truncated"] = True
+            return result
+
+        except Exception as e:
+            return {"error": f"Search failed: {str(e)}"}
 
-            for root, dirs, files in os.walk(path):
-                for file in files:
-                    file_path = os.path.join(root, file)
+    async def search_stream(self, query: str, path: str = ".",
+                            file_extensions: Optional[List[str]] = None,
+                            regex: bool = False, max_results: Optional[int] = None,
+                            time_limit: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yield search results as they are found, then a {"done": true, ...} summary"""
+        if not self._is_path_allowed(path):
+            yield {"error": f"Access denied: {path}"}
+            return
 
-                    # Check extension filter
-                    if file_extensions:
-                        if Path(file_path).suffix.lower() not in file_extensions:
-                            continue
+        try:
+            run = search.SearchRun(max_results, time_limit)
+            files = await run_in_threadpool(self.search_file_list, query, path, file_extensions, regex)
+            async for result in search.astream(files, query, regex, run, settings.fs_search_workers):
+                yield result
+            yield {"done": True, "query": query, **run.summary(len(files))}
 
-                    if not self._is_path_allowed(file_path) or not self._is_text_file(file_path):
-                        continue
+        except Exception as e:
+            yield {"error": f"Search failed: {str(e)}"}
 
-                    try:
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            content = f.read()
-                            if query_lower in content.lower():
-                                # Find line numbers
-                                lines = content.split('\n')
-                                matching_lines = []
-                                for i, line in enumerate(lines, 1):
-                                    if query_lower in line.lower():
-                                        matching_lines.append({
-                                            "line": i,
-                                            "content": line.strip()
-                                        })
-                                        if len(matching_lines) >= 5:  # Limit matches per file
-                                            break
-
-                                results.append({
-                                    "file_path": file_path,
-                                    "matches": matching_lines
-                                })
-
-                    except Exception:
-                        continue  # Skip files that can't be read
-
-            return {"query": query, "results": results}
+    @timed("fs.retrieve")
+    def retrieve(self, query: str, path: str = ".", top_k: Optional[int] = None,
+                 max_tokens: Optional[int] = None, wait: float = 0.0) -> Dict[str, Any]:
+        """Code chunks most relevant to `query` (BM25), best first, within a token budget.
 
+        The index is built and refreshed in the background; `wait` is how long
+        to wait for that before answering from what is indexed so far.
+        """
+        if not self._is_path_allowed(path):
+            return {"error": f"Access denied: {path}"}
+        chunk_index = get_chunk_index(path)
+        if chunk_index is None:
+            return {"query": query, "chunks": [], "disabled": True}
+
+        counter = get_counter()
+        budget = settings.retrieval_max_tokens if max_tokens is None else max_tokens
+        chunks = []
+        for score, rel, start, end, file_path in self._ranked_chunks(chunk_index, query, path, top_k, wait):
+            content = read_span(chunk_index.root, rel, start, end)
+            if not content:
+                continue
+            tokens = counter.count(content)
+            if tokens > budget:
+                continue  # a smaller, lower-ranked chunk may still fit
+            budget -= tokens
+            chunks.append({"path": file_path, "start_line": start + 1, "end_line": end,
+                           "score": round(score, 3), "tokens": tokens, "content": content})
+        return {"query": query, "chunks": chunks, "indexing": not chunk_index.built}
+
+    def _ranked_chunks(self, chunk_index, query: str, path: str, top_k: Optional[int], wait: float = 0.0):
+        chunk_index.refresh_async(path)
+        if wait:
+            chunk_index.wait(wait)
+        for score, rel, start, end in chunk_index.search(query, top_k or settings.retrieval_top_k):
+            file_path = os.path.join(path, rel)
+            if not self._is_path_allowed(file_path):
+                continue  # symlinked file outside the allowed roots
+            yield score, rel, start, end, file_path
+
+    @timed("fs.outline")
+    def outline(self, path: str = ".", query: Optional[str] = None, max_tokens: Optional[int] = None,
+                file_path: Optional[str] = None) -> Dict[str, Any]:
+        """Symbol outline of a project, or of one file in it with `file_path`.
+
+        For a project, files are ranked against `query` and the outline is
+        rendered as text within `max_tokens`; `files` lists the symbols of
+        the files that made it in.
+        """
+        if file_path is not None:
+            error = self._check_readable(file_path, source=True)
+            if error:
+                return error
+            outline_index = get_outline_index(path)
+            rel = os.path.relpath(os.path.realpath(file_path), outline_index.root)
+            if rel.startswith(os.pardir):
+                symbols = outline_file(file_path)  # outside the project: not cached
+            else:
+                st = os.stat(file_path)
+                symbols = outline_index.file(rel, (st.st_size, st.st_mtime_ns))
+            if symbols is None:
+                return {"error": f"Failed to read file: {file_path}"}
+            return {"file_path": file_path, "symbols": symbols}
+
+        if not self._is_path_allowed(path):
+            return {"error": f"Access denied: {path}"}
+        try:
+            outline_index = get_outline_index(path)
+            outlines = outline_index.sync(index_cache.get(path, UNLIMITED_DEPTH))
         except Exception as e:
-            return {"error": f"Search failed: {str(e)}"}
+            return {"error": f"Failed to outline directory: {str(e)}"}
 
+        budget = settings.outline_max_tokens if max_tokens is None else max_tokens
+        order = [rel for rel in rank(outlines, query)
+                 if self._is_path_allowed(os.path.join(path, rel))]  # symlinks out of the allowed roots
+        text, included, truncated = render(outlines, order, budget, get_counter())
+        return {
+            "path": path,
+            "text": text,
+            "files": [{"path": os.path.join(path, rel), "symbols": outlines[rel]} for rel in included],
+            "total_files": len(order),
+            "total_symbols": sum(len(outlines[rel]) for rel in order),
+            "truncated": truncated,
+        }
+
+    @timed("fs.index")
     def index(self, path: str = ".", max_depth: int = 2) -> Dict[str, Any]:
         """Simple index method for API compatibility"""
         result = self.index_directory(path, max_depth)
         if "error" in result:
             return result
 
-        # Transform to match API expectations
+        # Snapshot entries already carry the API fields (path, size, type)
         return {
-            "files": [
-                {
-                    "path": f["path"],
-                    "size": f["size"],
-                    "type": "file" if f.get("is_text", True) else "file"
-                }
-                for f in result["files"]
-            ],
+            "files": result["files"],
             "total_files": result["total_files"],
             "total_dirs": result["total_dirs"]
-        }
\ No newline at end of file
+        }
+
+    def iter_index(self, path: str = ".", max_depth: int = 2) -> Iterator[Dict[str, Any]]:
+        """Yield index entries as the walk produces them, then a totals record.
+
+        Entries come from the cached index when there is one; otherwise the
+        index is built while streaming, so the first entries don't wait for
+        the whole walk.
+        """
+        if not self._is_path_allowed(path):
+            yield {"error": f"Access denied: {path}"}
+            return
+
+        total_files = total_dirs = 0
+        try:
+            for rel, files, subdirs in index_cache.iter_dirs(path, max_depth):
+                base = os.path.join(path, rel) if rel else path
+                total_dirs += len(subdirs)
+                for name, (size, _mtime, is_link, _is_text) in files:
+                    file_path = os.path.join(base, name)
+                    if is_link and not self._is_path_allowed(file_path):
+                        continue
+                    total_files += 1
+                    yield {"path": file_path, "size": size, "type": "file"}
+        except Exception as e:
+            yield {"error": f"Failed to index directory: {str(e)}"}
+            return
+        yield {"done": True, "total_files": total_files, "total_dirs": total_dirs}
+
+    @timed("fs.index_page")
+    def index_page(self, path: str = ".", max_depth: int = 2, page_size: int = 500,
+                   cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Return one page of index() entries plus an opaque `next_cursor` (None on the last page)"""
+        if not self._is_path_allowed(path):
+            return {"error": f"Access denied: {path}"}
+
+        try:
+            directory_index = index_cache.get(path, max_depth)
+            result = directory_index.snapshot(path, self.allowed_paths)
+        except Exception as e:
+            return {"error": f"Failed to index directory: {str(e)}"}
+
+        files = result["files"]
+        start = 0
+        if cursor:
+            try:
+                position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+                start, last_path, version = position["o"], position["p"], position["v"]
+            except (ValueError, KeyError, TypeError):
+                return {"error": "Invalid cursor"}
+            if version != directory_index.version:
+                # The tree changed since the previous page: resume after the
+                # last path that was sent, wherever it is now.
+                for i, f in enumerate(files):
+                    if f["path"] == last_path:
+                        start = i + 1
+                        break
+        page = files[start:start + max(1, page_size)]
+        end = start + len(page)
+
+        next_cursor = None
+        if end < len(files):
+            token = {"o": end, "p": page[-1]["path"], "v": directory_index.version}
+            next_cursor = base64.urlsafe_b64encode(json.dumps(token).encode()).decode("ascii")
+        return {
+            "files": [{"path": f["path"], "size": f["size"], "type": f["type"]} for f in page],
+            "total_files": result["total_files"],
+            "total_dirs": result["total_dirs"],
+            "next_cursor": next_cursor,
+        }
@@ -0,0 +1,542 @@
+"""
+Cached directory indexes for FileSystemTool.
+
+Each (root, max_depth) pair is walked once, pruning at `max_depth`, and then
+kept current in place: on Linux an inotify thread applies per-entry updates as
+files change; elsewhere (or when inotify watches run out) directory mtimes are
+polled on access. Reads are served from memory. Indexes are evicted LRU once
+their estimated size exceeds the configured memory budget.
+"""
+import ctypes
+import ctypes.util
+import logging
+import mimetypes
+import os
+import select
+import stat
+import struct
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.py', '.js', '.ts', '.html', '.css',
+                   '.json', '.xml', '.yaml', '.yml', '.ini', '.cfg',
+                   '.sh', '.bash', '.sql', '.csv'}
+
+@lru_cache(maxsize=4096)
+def _is_text_suffix(suffix: str) -> bool:
+    mime_type, _ = mimetypes.guess_type("f" + suffix)
+    if mime_type and mime_type.startswith('text/'):
+        return True
+    return suffix in TEXT_EXTENSIONS
+
+def is_text_file(file_path: str) -> bool:
+    """Check if file is likely text-based (by extension)"""
+    return _is_text_suffix(os.path.splitext(file_path)[1].lower())
+
+def path_within(path: str, allowed_paths: List[str]) -> bool:
+    """Check if a path resolves to somewhere inside one of `allowed_paths`"""
+    try:
+        real_path = os.path.realpath(path)
+        return any(os.path.commonpath([real_path, allowed]) == allowed
+                   for allowed in allowed_paths)
+    except (ValueError, OSError):
+        return False
+
+# Depth used for whole-tree indexes (search), matching an unbounded os.walk.
+UNLIMITED_DEPTH = 1 << 30
+
+# Rough per-object costs used for the memory budget (CPython, 64-bit).
+_DIR_COST = 400
+_ENTRY_COST = 180
+_SNAPSHOT_ENTRY_COST = 450
+
+class _Dir:
+    """One indexed directory: its files and the subdirectories listed in it."""
+    __slots__ = ("mtime_ns", "files", "subdirs", "cost")
+
+    def __init__(self):
+        self.mtime_ns = 0
+        self.files: Dict[str, Tuple[int, int, bool, bool]] = {}  # name -> (size, mtime_ns, is_link, is_text)
+        self.subdirs: Dict[str, bool] = {}  # name -> is_link (symlinked dirs are listed, not entered)
+        self.cost = _DIR_COST
+
+class DirectoryIndex:
+    """In-memory index of one root, down to `max_depth` (same semantics as os.walk)."""
+
+    def __init__(self, root: str, max_depth: int, watcher: Optional["InotifyWatcher"] = None):
+        self.root = root
+        self.max_depth = max_depth
+        self.dirs: Dict[str, _Dir] = {}
+        self.version = 0
+        self.nbytes = 0
+        self.stale = False
+        self.polling = watcher is None
+        self.last_poll = time.monotonic()
+        self._watcher = watcher
+        self._lock = threading.RLock()
+        self._snapshots: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+        self._snapshot_version = -1
+
+    # --- building -----------------------------------------------------------
+
+    def abspath(self, rel: str) -> str:
+        return os.path.join(self.root, rel) if rel else self.root
+
+    @staticmethod
+    def depth(rel: str) -> int:
+        return rel.count(os.sep) + 1 if rel else 0
+
+    def _scan_one(self, rel: str) -> _Dir:
+        d = _Dir()
+        full = self.abspath(rel)
+        list_subdirs = self.depth(rel) < self.max_depth
+        try:
+            d.mtime_ns = os.stat(full).st_mtime_ns
+            with os.scandir(full) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if list_subdirs:
+                                d.subdirs[entry.name] = entry.is_symlink()
+                                d.cost += _ENTRY_COST + len(entry.name)
+                        else:
+                            st = entry.stat()
+                            d.files[entry.name] = (st.st_size, st.st_mtime_ns, entry.is_symlink(),
+                                                   is_text_file(entry.name))
+                            d.cost += _ENTRY_COST + len(entry.name)
+                    except OSError:
+                        continue  # vanished or broken symlink
+        except OSError:
+            pass  # unreadable directories are indexed as empty, like os.walk
+        return d
+
+    def _set_dir(self, rel: str, d: _Dir):
+        old = self.dirs.get(rel)
+        if old is not None:
+            self.nbytes -= old.cost
+        self.dirs[rel] = d
+        self.nbytes += d.cost
+        if old is None and self._watcher is not None and not self.polling:
+            if not self._watcher.add(self, rel):
+                # Out of inotify watches (or dir already gone): poll this root instead.
+                self.polling = True
+
+    def _scan_tree(self, rel: str):
+        stack = [rel]
+        while stack:
+            rel = stack.pop()
+            d = self._scan_one(rel)
+            self._set_dir(rel, d)
+            stack.extend(os.path.join(rel, name) if rel else name
+                         for name, is_link in d.subdirs.items() if not is_link)
+
+    def _drop_tree(self, rel: str):
+        prefix = rel + os.sep
+        for key in [k for k in self.dirs if k == rel or k.startswith(prefix)]:
+            self.nbytes -= self.dirs.pop(key).cost
+
+    def build(self) -> "DirectoryIndex":
+        with self._lock:
+            self.dirs.clear()
+            self.nbytes = 0
+            self._scan_tree("")
+            self.stale = False
+            self.version += 1
+        return self
+
+    def build_iter(self) -> Iterator[Tuple[str, List[Tuple[str, tuple]], List[str]]]:
+        """Build like build(), yielding (rel, files, subdirs) as each directory is scanned."""
+        with self._lock:
+            self.dirs.clear()
+            self.nbytes = 0
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            with self._lock:
+                d = self._scan_one(rel)
+                self._set_dir(rel, d)
+                files, subdirs = list(d.files.items()), list(d.subdirs)
+            # Scan in walk() order so the stream matches a cached index.
+            stack.extend(reversed([self._child(rel, name)
+                                   for name, is_link in d.subdirs.items() if not is_link]))
+            yield rel, files, subdirs
+        with self._lock:
+            self.stale = False
+            self.version += 1
+
+    @property
+    def exists(self) -> bool:
+        return os.path.isdir(self.root)
+
+    # --- incremental updates ----------------------------------------------
+
+    def _child(self, rel: str, name: str) -> str:
+        return os.path.join(rel, name) if rel else name
+
+    def refresh_dir(self, rel: str):
+        """Rescan one directory, keeping unchanged subtrees."""
+        with self._lock:
+            old = self.dirs.get(rel)
+            if old is None:
+                return
+            new = self._scan_one(rel)
+            self._set_dir(rel, new)
+            for name, is_link in old.subdirs.items():
+                if not is_link and new.subdirs.get(name) is not False:
+                    self._drop_tree(self._child(rel, name))  # removed, or now a symlink
+            for name, is_link in new.subdirs.items():
+                if not is_link and self._child(rel, name) not in self.dirs:
+                    self._scan_tree(self._child(rel, name))
+            self.version += 1
+
+    def refresh_entries(self, rel: str, names):
+        """Re-stat the named entries of one directory (inotify path)."""
+        with self._lock:
+            d = self.dirs.get(rel)
+            if d is None:
+                return
+            list_subdirs = self.depth(rel) < self.max_depth
+            for name in names:
+                full = os.path.join(self.abspath(rel), name)
+                child = self._child(rel, name)
+                try:
+                    st = os.stat(full)
+                    is_link = os.path.islink(full)
+                except OSError:
+                    st = None
+                if st is None or not stat.S_ISDIR(st.st_mode):
+                    if name in d.subdirs:
+                        del d.subdirs[name]
+                        d.cost -= _ENTRY_COST + len(name)
+                        self.nbytes -= _ENTRY_COST + len(name)
+                        self._drop_tree(child)
+                if st is None or stat.S_ISDIR(st.st_mode):
+                    if d.files.pop(name, None) is not None:
+                        d.cost -= _ENTRY_COST + len(name)
+                        self.nbytes -= _ENTRY_COST + len(name)
+                if st is None:
+                    continue
+                if stat.S_ISDIR(st.st_mode):
+                    if list_subdirs and name not in d.subdirs:
+                        d.subdirs[name] = is_link
+                        d.cost += _ENTRY_COST + len(name)
+                        self.nbytes += _ENTRY_COST + len(name)
+                        if not is_link:
+                            self._scan_tree(child)
+                else:
+                    if name not in d.files:
+                        d.cost += _ENTRY_COST + len(name)
+                        self.nbytes += _ENTRY_COST + len(name)
+                    d.files[name] = (st.st_size, st.st_mtime_ns, is_link, is_text_file(name))
+            self.version += 1
+
+    def poll(self):
+        """Rescan directories whose mtime changed since they were indexed."""
+        with self._lock:
+            self.last_poll = time.monotonic()
+            for rel in list(self.dirs):
+                d = self.dirs.get(rel)
+                if d is None:
+                    continue  # dropped by an earlier refresh in this pass
+                try:
+                    mtime_ns = os.stat(self.abspath(rel)).st_mtime_ns
+                except OSError:
+                    continue  # its parent's rescan drops it
+                if mtime_ns != d.mtime_ns:
+                    self.refresh_dir(rel)
+
+    # --- reads --------------------------------------------------------------
+
+    def walk(self) -> Iterator[Tuple[str, _Dir]]:
+        """Yield (rel, dir) in os.walk top-down order."""
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            d = self.dirs.get(rel)
+            if d is None:
+                continue
+            yield rel, d
+            stack.extend(reversed([self._child(rel, name)
+                                   for name, is_link in d.subdirs.items() if not is_link]))
+
+    def file_list(self) -> List[Tuple[str, int, int, bool, bool]]:
+        """Return (rel_path, size, mtime_ns, is_link, is_text) for every indexed file, in walk order."""
+        with self._lock:
+            return [(self._child(rel, name), size, mtime_ns, is_link, is_text)
+                    for rel, d in self.walk()
+                    for name, (size, mtime_ns, is_link, is_text) in d.files.items()]
+
+    def entries(self) -> List[Tuple[str, List[Tuple[str, tuple]], List[str]]]:
+        """Copy (rel, files, subdirs) for every directory in walk order; same shape as build_iter()."""
+        with self._lock:
+            return [(rel, list(d.files.items()), list(d.subdirs)) for rel, d in self.walk()]
+
+    def snapshot(self, display_root: str, allowed_paths: List[str]) -> Dict[str, Any]:
+        """Return the index_directory() result for this root. Treat it as read-only."""
+        key = (display_root, tuple(allowed_paths))
+        with self._lock:
+            if self._snapshot_version != self.version:
+                self.nbytes -= sum(len(s["files"]) for s in self._snapshots.values()) * _SNAPSHOT_ENTRY_COST
+                self._snapshots.clear()
+                self._snapshot_version = self.version
+            result = self._snapshots.get(key)
+            if result is not None:
+                return result
+
+            files, directories = [], []
+            for rel, d in self.walk():
+                base = os.path.join(display_root, rel) if rel else display_root
+                for name in d.subdirs:
+                    directories.append(os.path.join(base, name))
+                for name, (size, _mtime, is_link, is_text) in d.files.items():
+                    file_path = os.path.join(base, name)
+                    if is_link and not path_within(file_path, allowed_paths):
+                        continue
+                    files.append({"path": file_path, "name": name, "size": size,
+                                  "is_text": is_text, "type": "file"})
+
+            result = {
+                "path": display_root,
+                "files": files,
+                "directories": directories,
+                "total_files": len(files),
+                "total_dirs": len(directories),
+            }
+            self._snapshots[key] = result
+            self.nbytes += len(files) * _SNAPSHOT_ENTRY_COST
+            return result
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.remove_index(self)
+
+# inotify(7) constants
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x01000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_CREATE | _IN_DELETE | _IN_ONLYDIR)
+_EVENT = struct.Struct("iIII")
+
+class InotifyWatcher:
+    """Background thread turning inotify events into DirectoryIndex updates (Linux)."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, Dict[Tuple[int, str], Tuple[DirectoryIndex, str]]] = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="fs-index-inotify", daemon=True).start()
+
+    @classmethod
+    def create(cls) -> Optional["InotifyWatcher"]:
+        try:
+            return cls()
+        except (OSError, AttributeError, TypeError):
+            return None  # not Linux, or no libc inotify
+
+    def add(self, index: DirectoryIndex, rel: str) -> bool:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(index.abspath(rel)), _WATCH_MASK)
+        if wd < 0:
+            return False
+        with self._lock:
+            # Several indexes (e.g. different depths) can share one kernel watch.
+            self._watches.setdefault(wd, {})[(id(index), rel)] = (index, rel)
+        return True
+
+    def remove_index(self, index: DirectoryIndex):
+        with self._lock:
+            for wd, targets in list(self._watches.items()):
+                for key in [k for k in targets if k[0] == id(index)]:
+                    del targets[key]
+                if not targets:
+                    del self._watches[wd]
+                    self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _read_events(self) -> Dict[Tuple[DirectoryIndex, str], set]:
+        changes: Dict[Tuple[DirectoryIndex, str], set] = {}
+        while True:
+            try:
+                buf = os.read(self._fd, 256 * 1024)
+            except BlockingIOError:
+                return changes
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, length = _EVENT.unpack_from(buf, offset)
+                name = buf[offset + _EVENT.size:offset + _EVENT.size + length].split(b"\0", 1)[0]
+                offset += _EVENT.size + length
+                with self._lock:
+                    if mask & _IN_Q_OVERFLOW:
+                        # Events were lost; rebuild every watched index on next access.
+                        for targets in self._watches.values():
+                            for index, _rel in targets.values():
+                                index.stale = True
+                        continue
+                    if mask & _IN_IGNORED:
+                        self._watches.pop(wd, None)
+                        continue
+                    targets = list(self._watches.get(wd, {}).values())
+                if name:
+                    for index, rel in targets:
+                        changes.setdefault((index, rel), set()).add(os.fsdecode(name))
+
+    def _run(self):
+        while True:
+            try:
+                select.select([self._fd], [], [])
+                time.sleep(0.05)  # let bursts (checkouts, builds) coalesce
+                for (index, rel), names in self._read_events().items():
+                    index.refresh_entries(rel, names)
+            except Exception:
+                logger.exception("fs index watcher failed")
+                time.sleep(1)
+
+class IndexCache:
+    """Per-root DirectoryIndex registry with LRU eviction under a memory budget."""
+
+    def __init__(self, max_bytes: int, poll_interval: float, use_inotify: bool = True):
+        self.max_bytes = max_bytes
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self._indexes: "OrderedDict[Tuple[str, int], DirectoryIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._watcher: Optional[InotifyWatcher] = None
+        self._watcher_checked = False
+
+    def _get_watcher(self) -> Optional[InotifyWatcher]:
+        with self._lock:  # a concurrent first build must not see "checked" before the watcher exists
+            if self.use_inotify and not self._watcher_checked:
+                self._watcher = InotifyWatcher.create()
+                self._watcher_checked = True
+            return self._watcher
+
+    def get(self, path: str, max_depth: int) -> DirectoryIndex:
+        """Return the index for `path`, building it on first use."""
+        key = (os.path.realpath(path), max_depth)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+
+        if index is not None and not index.stale:
+            if index.polling and time.monotonic() - index.last_poll >= self.poll_interval:
+                index.poll()
+            return index
+
+        if index is not None:
+            return index.build()
+
+        return self._register(key, DirectoryIndex(key[0], max_depth, self._get_watcher()).build())
+
+    def iter_dirs(self, path: str, max_depth: int) -> Iterator[Tuple[str, List[Tuple[str, tuple]], List[str]]]:
+        """Yield (rel, files, subdirs) per directory: copied from the cached index,
+        or as a new index is built (it is cached once the walk completes)."""
+        key = (os.path.realpath(path), max_depth)
+        with self._lock:
+            cached = key in self._indexes
+        if cached:
+            yield from self.get(path, max_depth).entries()
+            return
+
+        index = DirectoryIndex(key[0], max_depth, self._get_watcher())
+        complete = False
+        try:
+            yield from index.build_iter()
+            complete = True
+        finally:
+            if not complete:
+                index.close()  # consumer went away mid-walk; don't cache a partial index
+        self._register(key, index)
+
+    def _register(self, key: Tuple[str, int], index: DirectoryIndex) -> DirectoryIndex:
+        if not index.exists:
+            index.close()
+            return index  # nothing to watch; don't cache a missing root
+        with self._lock:
+            existing = self._indexes.get(key)
+            if existing is not None:  # another request built it concurrently
+                index.close()
+                return existing
+            self._indexes[key] = index
+            self._evict()
+        return index
+
+    def _evict(self):
+        total = sum(i.nbytes for i in self._indexes.values())
+        while total > self.max_bytes and len(self._indexes) > 1:
+            _key, victim = self._indexes.popitem(last=False)
+            total -= victim.nbytes
+            victim.close()
+
+    def invalidate(self, path: Optional[str] = None) -> int:
+        """Drop cached indexes for `path` (every depth), or all of them. Returns the count."""
+        root = os.path.realpath(path) if path is not None else None
+        with self._lock:
+            keys = [k for k in self._indexes if root is None or k[0] == root]
+            for key in keys:
+                self._indexes.pop(key).close()
+        return len(keys)
+
+    def rebuild(self, path: str, max_depth: int) -> DirectoryIndex:
+        self.invalidate(path)
+        return self.get(path, max_depth)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "roots": len(self._indexes),
+                "bytes": sum(i.nbytes for i in self._indexes.values()),
+                "max_bytes": self.max_bytes,
+                "inotify": self._watcher is not None,
+            }
+
+class RootCache:
+    """Per-root derived indexes (retrieval, outline, trigram), least recently used evicted beyond `max_roots`.
+
+    An evicted index is only dropped: a request still holding it finishes with it.
+    """
+
+    def __init__(self, max_roots: int):
+        self.max_roots = max_roots
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, factory):
+        """The object for `path`'s real root, created with factory(root) on first use."""
+        root = os.path.realpath(path)
+        with self._lock:
+            item = self._items.get(root)
+            if item is None:
+                item = self._items[root] = factory(root)
+                while len(self._items) > max(self.max_roots, 1):
+                    self._items.popitem(last=False)
+            else:
+                self._items.move_to_end(root)
+            return item
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+index_cache = IndexCache(
+    max_bytes=settings.fs_index_max_bytes,
+    poll_interval=settings.fs_index_poll_interval,
+    use_inotify=settings.fs_index_watch,
+)
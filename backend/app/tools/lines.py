@@ -0,0 +1,110 @@
+"""
+Line-offset tables for FileSystemTool.read_file_snippet.
+
+The byte offset of every line start is computed once per file version, keyed
+on (inode, mtime, size), and cached under a memory budget. Snippet reads then
+map the file and slice exactly the requested line range.
+"""
+import array
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+Stamp = Tuple[int, int, int]
+
+def file_stamp(st: os.stat_result) -> Stamp:
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _line_starts(buf) -> array.array:
+    """Offsets where each line begins, plus a final entry for end of file."""
+    starts = array.array("Q", [0])
+    find = buf.find
+    pos = find(b"\n")
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = find(b"\n", pos + 1)
+    size = len(buf)
+    if starts[-1] != size:
+        starts.append(size)  # last line has no trailing newline
+    return starts
+
+class LineIndexCache:
+    """LRU of line-start tables, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._tables: "OrderedDict[str, Tuple[Stamp, array.array]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, real_path: str, stamp: Stamp, buf) -> array.array:
+        with self._lock:
+            cached = self._tables.get(real_path)
+            if cached is not None and cached[0] == stamp:
+                self._tables.move_to_end(real_path)
+                return cached[1]
+
+        starts = _line_starts(buf)
+        nbytes = starts.itemsize * len(starts)
+        with self._lock:
+            old = self._tables.pop(real_path, None)
+            if old is not None:
+                self._bytes -= old[1].itemsize * len(old[1])
+            self._tables[real_path] = (stamp, starts)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and len(self._tables) > 1:
+                _path, (_stamp, victim) = self._tables.popitem(last=False)
+                self._bytes -= victim.itemsize * len(victim)
+        return starts
+
+def _normalize_newlines(text: str) -> str:
+    # Same line endings text-mode reading would produce.
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+class SnippetReader:
+    """Reads line ranges from one open file via mmap and the cached line table."""
+
+    def __init__(self, file_path: str, cache: LineIndexCache):
+        self._f = open(file_path, "rb")
+        st = os.fstat(self._f.fileno())
+        self.size = st.st_size
+        self._buf = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self._starts = cache.get(os.path.realpath(file_path), file_stamp(st), self._buf)
+
+    @property
+    def total_lines(self) -> int:
+        return len(self._starts) - 1
+
+    def read(self, start_line: int, max_lines: int, max_chars: int) -> Tuple[int, str, bool]:
+        """Return (end_line, content, truncated) for 1-based `start_line`."""
+        total = self.total_lines
+        end_line = min(start_line + max_lines - 1, total)
+        first = start_line - 1
+        if first < 0:
+            first = max(total + first, 0)  # same as slicing lines[start_line - 1:]
+        if first >= end_line:
+            return end_line, "", False
+
+        begin, end = self._starts[first], self._starts[end_line]
+        # A UTF-8 char is at most 4 bytes: beyond this many bytes the text is
+        # certainly longer than max_chars, so don't decode the rest.
+        limit = 4 * (max_chars + 1)
+        raw = self._buf[begin:min(end, begin + limit)]
+        content = _normalize_newlines(raw.decode("utf-8", errors="ignore"))
+        truncated = len(content) > max_chars or end - begin > limit
+        if truncated:
+            content = content[:max_chars] + "..."
+        return end_line, content, truncated
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,283 @@
+"""
+Symbol outlines of source files: a compact description of a codebase.
+
+Each Python file is parsed with `ast` into its classes, functions and methods
+with their signatures; JS/TS files get a line-based scan for functions,
+classes and their methods, arrow-function constants, interfaces and types.
+Outlines are cached per file by (size, mtime) and follow the shared
+DirectoryIndex, so only changed files are parsed again. A first build of a
+large tree is spread over the search process pool.
+
+`render` ranks files against a query and writes as much of the outline as
+fits a token budget, one line per symbol:
+
+    app/tools/fs.py
+      class FileSystemTool
+        def read_file_snippet(self, file_path: str, start_line: int = 1) -> Dict[str, Any]
+"""
+import ast
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..settings import settings
+from .fs_index import DirectoryIndex, RootCache
+
+Symbol = Dict[str, Any]  # {"kind", "name", "signature", "line", "depth"}
+
+_SHARD_FILES = 64
+_INLINE_FILES = 128  # below this many files to parse, the pool costs more than it saves
+_MAX_SIGNATURE = 160
+
+_PYTHON = frozenset({".py", ".pyi"})
+_SCRIPT = frozenset({".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".mts", ".cts"})
+
+def _clip(signature: str) -> str:
+    signature = " ".join(signature.split())
+    return signature if len(signature) <= _MAX_SIGNATURE else signature[:_MAX_SIGNATURE - 3] + "..."
+
+def outline_python(text: str) -> List[Symbol]:
+    """Classes, functions and methods (nested classes included) of a Python module."""
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return []
+    symbols: List[Symbol] = []
+
+    def visit(body, depth: int, in_class: bool):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+                returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+                symbols.append({
+                    "kind": "method" if in_class else "function",
+                    "name": node.name,
+                    "signature": _clip(f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"),
+                    "line": node.lineno,
+                    "depth": depth,
+                })
+            elif isinstance(node, ast.ClassDef):
+                bases = [ast.unparse(b) for b in node.bases] + [ast.unparse(k) for k in node.keywords]
+                symbols.append({
+                    "kind": "class",
+                    "name": node.name,
+                    "signature": _clip(f"class {node.name}({', '.join(bases)})" if bases else f"class {node.name}"),
+                    "line": node.lineno,
+                    "depth": depth,
+                })
+                visit(node.body, depth + 1, True)
+
+    visit(tree.body, 0, False)
+    return symbols
+
+_JS_PREFIX = r"(?:export\s+)?(?:default\s+)?(?:declare\s+)?"
+_JS_PATTERNS = [
+    ("function", re.compile(_JS_PREFIX + r"(?:async\s+)?function\s*\*?\s*(?P<name>[\w$]+)")),
+    ("class", re.compile(_JS_PREFIX + r"(?:abstract\s+)?class\s+(?P<name>[\w$]+)")),
+    ("interface", re.compile(_JS_PREFIX + r"interface\s+(?P<name>[\w$]+)")),
+    ("type", re.compile(_JS_PREFIX + r"type\s+(?P<name>[\w$]+)\s*(?:<[^=]*>)?\s*=")),
+    ("enum", re.compile(_JS_PREFIX + r"(?:const\s+)?enum\s+(?P<name>[\w$]+)")),
+    ("function", re.compile(
+        _JS_PREFIX + r"(?:const|let|var)\s+(?P<name>[\w$]+)\s*(?::[^=]+)?=\s*(?:async\s+)?"
+        r"(?:function\b|(?:<[^>]*>)?\([^)]*\)\s*(?::[^=]+)?=>|[\w$]+\s*=>)")),
+    ("const", re.compile(r"export\s+(?:const|let|var)\s+(?P<name>[\w$]+)")),
+]
+_JS_METHOD = re.compile(
+    r"(?:(?:public|private|protected|static|readonly|override|abstract|async|get|set)\s+)*"
+    r"\*?(?P<name>#?[\w$]+)\s*(?:<[^>]*>)?\(")
+_JS_NOT_METHODS = frozenset({"if", "for", "while", "switch", "catch", "return", "function", "super", "with"})
+_JS_STRINGS = re.compile(r"'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"|`(?:\\.|[^`\\])*`|//.*$")
+
+def _js_signature(line: str) -> str:
+    """A declaration line up to its body (braces inside parameter lists are kept)."""
+    parens = 0
+    end = len(line)
+    for i, c in enumerate(line):
+        if c == "(":
+            parens += 1
+        elif c == ")":
+            parens -= 1
+        elif parens <= 0 and (c == "{" or line.startswith("=>", i)):
+            end = i + 2 if c == "=" else i
+            break
+    return _clip(line[:end].strip().rstrip("=").strip())
+
+def outline_script(text: str) -> List[Symbol]:
+    """Top-level declarations and class members of a JS/TS module.
+
+    A line scan with brace counting, not a parser: declarations are only
+    looked for at the top level and directly inside class bodies.
+    """
+    symbols: List[Symbol] = []
+    depth = 0
+    class_depth: Optional[int] = None  # brace depth of the current class body
+    in_comment = False
+    for number, raw in enumerate(text.splitlines(), 1):
+        line = raw.strip()
+        if in_comment:
+            if "*/" not in line:
+                continue
+            in_comment = False
+            line = line.split("*/", 1)[1].strip()
+        if line.startswith("/*"):
+            in_comment = "*/" not in line
+            continue
+        if not line or line.startswith("//"):
+            continue
+
+        header = False
+        if depth == 0:
+            for kind, pattern in _JS_PATTERNS:
+                m = pattern.match(line)
+                if m:
+                    symbols.append({"kind": kind, "name": m.group("name"), "signature": _js_signature(line),
+                                    "line": number, "depth": 0})
+                    if kind == "class":
+                        class_depth, header = 1, True
+                    break
+        elif depth == class_depth:
+            m = _JS_METHOD.match(line)
+            if m and m.group("name") not in _JS_NOT_METHODS and not line.endswith(";"):
+                symbols.append({"kind": "method", "name": m.group("name"), "signature": _js_signature(line),
+                                "line": number, "depth": 1})
+
+        code = _JS_STRINGS.sub("", line)
+        depth = max(0, depth + code.count("{") - code.count("}"))
+        if depth == 0 and not header:  # the header's brace may be on the next line
+            class_depth = None
+    return symbols
+
+def outline_file(file_path: str) -> Optional[List[Symbol]]:
+    """Symbols of one file, [] for unsupported types, None if it can't be read."""
+    suffix = os.path.splitext(file_path)[1].lower()
+    if suffix not in _PYTHON and suffix not in _SCRIPT:
+        return []
+    try:
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+    except OSError:
+        return None
+    return outline_python(text) if suffix in _PYTHON else outline_script(text)
+
+def _outline_shard(root: str, rels: List[str]) -> List[Tuple[str, Optional[List[Symbol]]]]:
+    return [(rel, outline_file(os.path.join(root, rel))) for rel in rels]
+
+def supported(rel: str) -> bool:
+    suffix = os.path.splitext(rel)[1].lower()
+    return suffix in _PYTHON or suffix in _SCRIPT
+
+class OutlineIndex:
+    """Cached outlines of one root's source files."""
+
+    def __init__(self, root: str, max_file_size: int):
+        self.root = root
+        self.max_file_size = max_file_size
+        self._files: Dict[str, Tuple[Tuple[int, int], List[Symbol]]] = {}  # rel -> ((size, mtime), symbols)
+        self._lock = threading.Lock()
+        self._synced = None
+
+    def sync(self, dir_index: DirectoryIndex) -> Dict[str, List[Symbol]]:
+        """Parse new and changed files, drop deleted ones; returns rel -> symbols."""
+        with self._lock:  # concurrent callers wait for one build instead of parsing twice
+            stamp = (dir_index, dir_index.version)  # not id(): a new index can reuse a freed one's id
+            if stamp != self._synced:
+                # By suffix alone: mimetypes doesn't call .tsx, .cjs or .pyi text
+                current = {rel: (size, mtime_ns)
+                           for rel, size, mtime_ns, _is_link, _is_text in dir_index.file_list()
+                           if size <= self.max_file_size and supported(rel)}
+                for rel in [rel for rel, (signature, _) in self._files.items() if current.get(rel) != signature]:
+                    del self._files[rel]
+                missing = [rel for rel in current if rel not in self._files]
+                for rel, symbols in self._parse(missing):
+                    if symbols is not None:
+                        self._files[rel] = (current[rel], symbols)
+                self._synced = stamp
+            return {rel: symbols for rel, (_signature, symbols) in self._files.items()}
+
+    def _parse(self, rels: List[str]):
+        if len(rels) < _INLINE_FILES:
+            return _outline_shard(self.root, rels)
+        from .search import _get_executor
+
+        shards = [rels[i:i + _SHARD_FILES] for i in range(0, len(rels), _SHARD_FILES)]
+        executor = _get_executor(settings.fs_search_workers)
+        return [item for shard in executor.map(_outline_shard, [self.root] * len(shards), shards)
+                for item in shard]
+
+    def file(self, rel: str, signature: Tuple[int, int]) -> Optional[List[Symbol]]:
+        """One file's outline, parsed now if it isn't cached for this (size, mtime)."""
+        with self._lock:
+            cached = self._files.get(rel)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+        symbols = outline_file(os.path.join(self.root, rel))
+        if symbols is not None and supported(rel):
+            with self._lock:
+                self._files[rel] = (signature, symbols)
+        return symbols
+
+def format_symbol(symbol: Symbol) -> str:
+    return "  " * (symbol["depth"] + 1) + symbol["signature"]
+
+def rank(outlines: Dict[str, List[Symbol]], query: Optional[str] = None) -> List[str]:
+    """Files with symbols, most useful first.
+
+    Files whose path or symbol names share terms with `query` come first;
+    otherwise shallower files (entry points, packages' public modules) and
+    files defining more symbols lead.
+    """
+    from .retrieval import tokenize
+
+    terms = set(tokenize(query)) if query else set()
+
+    def score(rel: str) -> Tuple[int, int, int]:
+        symbols = outlines[rel]
+        overlap = 0
+        if terms:
+            names = set(tokenize(rel + " " + " ".join(s["name"] for s in symbols)))
+            overlap = len(terms & names)
+        return (-overlap, rel.count("/"), -min(len(symbols), 20))
+
+    return sorted((rel for rel, symbols in outlines.items() if symbols), key=lambda rel: (score(rel), rel))
+
+def render(outlines: Dict[str, List[Symbol]], order: List[str], max_tokens: int,
+           counter) -> Tuple[str, List[str], bool]:
+    """Outline text of files in `order` within `max_tokens`: (text, files included, truncated).
+
+    A file that doesn't fit whole is cut after its last fitting symbol and
+    ends the outline.
+    """
+    lines: List[str] = []
+    included: List[str] = []
+    budget = max_tokens
+    for rel in order:
+        header = counter.count(rel) + 1
+        if header >= budget:
+            return "\n".join(lines), included, True
+        block = [rel]
+        budget -= header
+        for symbol in outlines[rel]:
+            line = format_symbol(symbol)
+            cost = counter.count(line) + 1
+            if cost > budget:
+                if len(block) > 1:
+                    lines.extend(block)
+                    included.append(rel)
+                return "\n".join(lines), included, True
+            budget -= cost
+            block.append(line)
+        lines.extend(block)
+        included.append(rel)
+    return "\n".join(lines), included, False
+
+def format_outline(text: Optional[str]) -> Optional[str]:
+    """Render an outline as a context block for the model."""
+    if not text:
+        return None
+    return f"# Project outline\n{text}"
+
+_indexes = RootCache(settings.fs_index_max_roots)
+
+def get_outline_index(path: str) -> OutlineIndex:
+    return _indexes.get(path, lambda root: OutlineIndex(root, max_file_size=settings.outline_max_file_size))
@@ -0,0 +1,261 @@
+"""
+In-process BM25 retrieval of code chunks for chat context.
+
+Text files under a root are split into chunks at language-aware boundaries
+(top-level definitions, markdown headings; fixed windows otherwise) and kept
+in an in-memory inverted index. The index follows the shared DirectoryIndex:
+only files whose (size, mtime) changed are re-chunked, and deleted files are
+dropped. Builds and refreshes run in a background thread, so a query never
+waits for a walk; until the first build finishes it simply finds nothing.
+
+Chunk text is not stored: results carry line ranges and are read back from
+disk, so the index holds term frequencies only.
+"""
+import heapq
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..settings import settings
+from .fs_index import UNLIMITED_DEPTH, DirectoryIndex, RootCache, index_cache
+
+logger = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+_REFRESH_INTERVAL = 1.0  # seconds between checks of the directory index version
+
+# A line matching the pattern (at column 0) starts a new chunk.
+_BOUNDARIES = {
+    ".py": re.compile(r"(?:async\s+def|def|class)\s|@"),
+    ".js": re.compile(r"(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function|class|const|let|var)\b"),
+    ".md": re.compile(r"#{1,6}\s"),
+    ".go": re.compile(r"(?:func|type)\s"),
+    ".rs": re.compile(r"(?:pub(?:\([^)]*\))?\s+)?(?:fn|struct|enum|impl|trait|mod)\b"),
+    ".java": re.compile(r"(?:public|private|protected|class|interface|enum)\b"),
+}
+_BOUNDARIES[".ts"] = re.compile(
+    r"(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function|class|const|let|var|interface|type|enum)\b")
+for _suffix, _base in ((".jsx", ".js"), (".mjs", ".js"), (".cjs", ".js"), (".tsx", ".ts"),
+                       (".markdown", ".md"), (".kt", ".java")):
+    _BOUNDARIES[_suffix] = _BOUNDARIES[_base]
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|[0-9]+")
+_SUBWORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from if in is it of on or the to this that with "
+    "what how why where does do can should would which".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms: whole identifiers plus their camelCase/snake_case parts."""
+    terms = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        if len(lower) > 1 and lower not in _STOPWORDS:
+            terms.append(lower)
+        parts = _SUBWORD.findall(word)
+        if len(parts) > 1:
+            terms.extend(p.lower() for p in parts if len(p) > 1 and p.lower() not in _STOPWORDS)
+    return terms
+
+def chunk_spans(lines: List[str], suffix: str, max_lines: int) -> List[Tuple[int, int]]:
+    """[start, end) line ranges of a file's chunks.
+
+    Boundaries are top-level definitions for known languages (a decorator
+    stays with its definition); long sections are split into windows of
+    `max_lines`, and short neighbours are merged.
+    """
+    pattern = _BOUNDARIES.get(suffix)
+    starts = [0]
+    if pattern is not None:
+        previous = ""
+        for i, line in enumerate(lines):
+            if i and pattern.match(line) and not previous.startswith("@"):
+                starts.append(i)
+            if line.strip():
+                previous = line
+    starts.append(len(lines))
+
+    spans: List[Tuple[int, int]] = []
+    min_lines = max(1, max_lines // 6)
+    for start, end in zip(starts, starts[1:]):
+        for window in range(start, end, max_lines):
+            span = (window, min(end, window + max_lines))
+            if spans and span[1] - spans[-1][0] <= max_lines and (
+                    spans[-1][1] - spans[-1][0] < min_lines or span[1] - span[0] < min_lines):
+                spans[-1] = (spans[-1][0], span[1])
+            else:
+                spans.append(span)
+    return spans
+
+class _Chunk:
+    __slots__ = ("rel", "start", "end", "length")
+
+    def __init__(self, rel: str, start: int, end: int, length: int):
+        self.rel, self.start, self.end, self.length = rel, start, end, length
+
+class ChunkIndex:
+    """BM25 index over the chunks of one root's text files."""
+
+    def __init__(self, root: str, max_file_size: int, chunk_lines: int):
+        self.root = root
+        self.max_file_size = max_file_size
+        self.chunk_lines = chunk_lines
+        self._files: Dict[str, Tuple[Tuple[int, int], List[int]]] = {}  # rel -> ((size, mtime), chunk ids)
+        self._chunks: Dict[int, _Chunk] = {}
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)  # term -> {chunk id: tf}
+        self._total_length = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._synced = None
+        self._checked = 0.0
+        self._idle = threading.Event()
+        self._idle.set()
+        self.built = False
+
+    def _chunk_file(self, rel: str) -> Optional[List[Tuple[int, int, Counter]]]:
+        try:
+            with open(os.path.join(self.root, rel), "r", encoding="utf-8", errors="ignore") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return None
+        path_terms = tokenize(rel)  # file and directory names say a lot about code
+        suffix = os.path.splitext(rel)[1].lower()
+        chunks = []
+        for start, end in chunk_spans(lines, suffix, self.chunk_lines):
+            terms = Counter(tokenize("\n".join(lines[start:end])))
+            if terms:
+                terms.update(path_terms)
+                chunks.append((start, end, terms))
+        return chunks
+
+    def _add(self, rel: str, signature: Tuple[int, int], chunks: List[Tuple[int, int, Counter]]):
+        ids = []
+        for start, end, terms in chunks:
+            chunk_id = self._next_id
+            self._next_id += 1
+            length = sum(terms.values())
+            self._chunks[chunk_id] = _Chunk(rel, start, end, length)
+            self._total_length += length
+            for term, tf in terms.items():
+                self._postings[term][chunk_id] = tf
+            ids.append(chunk_id)
+        self._files[rel] = (signature, ids)
+
+    def sync(self, dir_index: DirectoryIndex):
+        """Re-chunk changed files and drop deleted ones (runs in the refresh thread)."""
+        stamp = (dir_index, dir_index.version)  # not id(): a new index can reuse a freed one's id
+        if stamp == self._synced:
+            return
+        # Source files the chunker knows count even when mimetypes doesn't call them text (.go, .tsx, ...)
+        current = {rel: (size, mtime_ns) for rel, size, mtime_ns, _is_link, is_text in dir_index.file_list()
+                   if (is_text or os.path.splitext(rel)[1].lower() in _BOUNDARIES) and size <= self.max_file_size}
+        with self._lock:
+            stale = [rel for rel, (signature, _ids) in self._files.items() if current.get(rel) != signature]
+            if stale:
+                self._remove_many(stale)
+        for rel, signature in current.items():
+            if rel in self._files:
+                continue
+            chunks = self._chunk_file(rel)  # file IO and tokenizing outside the lock
+            if chunks is not None:
+                with self._lock:
+                    self._add(rel, signature, chunks)
+        self._synced = stamp
+        self.built = True
+
+    def _remove_many(self, rels: List[str]):
+        # Postings don't record which terms a chunk had, so sweep them all once per batch.
+        dead = set()
+        for rel in rels:
+            _signature, ids = self._files.pop(rel)
+            dead.update(ids)
+        for chunk_id in dead:
+            self._total_length -= self._chunks.pop(chunk_id).length
+        for term in list(self._postings):
+            posting = self._postings[term]
+            if dead.isdisjoint(posting):
+                continue
+            for chunk_id in dead.intersection(posting):
+                del posting[chunk_id]
+            if not posting:
+                del self._postings[term]
+
+    def _refresh(self, path: str):
+        try:
+            self.sync(index_cache.get(path, UNLIMITED_DEPTH))
+        except Exception:
+            logger.exception("Retrieval index refresh failed for %s", self.root)
+        finally:
+            self._idle.set()
+
+    def refresh_async(self, path: str):
+        """Start a background refresh unless one is running or the last check was recent."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._idle.is_set() or (self.built and now - self._checked < _REFRESH_INTERVAL):
+                return
+            self._checked = now
+            self._idle.clear()
+        threading.Thread(target=self._refresh, args=(path,), name="fs-retrieval-index", daemon=True).start()
+
+    def wait(self, timeout: float) -> bool:
+        return self._idle.wait(timeout)
+
+    def search(self, query: str, k: int) -> List[Tuple[float, str, int, int]]:
+        """Top `k` chunks for `query` as (score, rel, start, end), best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._chunks)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[int, float] = defaultdict(float)
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, tf in posting.items():
+                    length = self._chunks[chunk_id].length
+                    scores[chunk_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(score, self._chunks[c].rel, self._chunks[c].start, self._chunks[c].end) for c, score in top]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"files": len(self._files), "chunks": len(self._chunks), "terms": len(self._postings),
+                    "built": self.built}
+
+def read_span(root: str, rel: str, start: int, end: int) -> Optional[str]:
+    try:
+        with open(os.path.join(root, rel), "r", encoding="utf-8", errors="ignore") as f:
+            return "\n".join(f.read().splitlines()[start:end])
+    except OSError:
+        return None
+
+def format_chunks(chunks: List[Dict[str, Any]]) -> Optional[str]:
+    """Render retrieved chunks as a context block for the model."""
+    if not chunks:
+        return None
+    parts = ["# Relevant code"]
+    for c in chunks:
+        parts.append(f"## {c['path']}:{c['start_line']}-{c['end_line']}\n```\n{c['content']}\n```")
+    return "\n\n".join(parts)
+
+_indexes = RootCache(settings.fs_index_max_roots)
+
+def get_chunk_index(path: str) -> Optional[ChunkIndex]:
+    """The retrieval index for a root, or None when retrieval is off."""
+    if not settings.retrieval_enabled:
+        return None
+    return _indexes.get(path, lambda root: ChunkIndex(
+        root,
+        max_file_size=settings.retrieval_max_file_size,
+        chunk_lines=settings.retrieval_chunk_lines,
+    ))
@@ -0,0 +1,259 @@
+"""
+Parallel search engine behind FileSystemTool.search_files and /tools/fs/search.
+
+The candidate file list is split into shards that run on a process pool.
+Each file is memory-mapped and matched as bytes with an ASCII case-folding
+regex, so it is never decoded or lowercased as a whole; line numbers and line
+text are only computed around hits. Results come back shard by shard, so
+callers can stream them and stop early on a result or time limit.
+"""
+import asyncio
+import mmap
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+MAX_MATCHES_PER_FILE = 5
+_SHARD_FILES = 64
+_SHARD_BYTES = 8 * 1024 * 1024
+_INLINE_FILES = 128  # below this, searching in-process beats pool overhead
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        methods = multiprocessing.get_all_start_methods()
+        # Don't fork a process that runs watcher threads and an event loop.
+        ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        _executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=ctx)
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+@lru_cache(maxsize=64)
+def _compile(query: str, regex: bool):
+    """Compile a query for bytes matching, or for str matching if it isn't ASCII.
+
+    Whole files are matched at once, so MULTILINE keeps ^ and $ per line.
+    """
+    flags = re.IGNORECASE | re.MULTILINE
+    if query.isascii():
+        source = query.encode("ascii")
+        return re.compile(source if regex else re.escape(source), flags), True
+    # Non-ASCII letters need Unicode case folding: match decoded text instead.
+    return re.compile(query if regex else re.escape(query), flags), False
+
+def _search_text(text: str, pattern) -> Optional[List[Dict[str, Any]]]:
+    if not pattern.search(text):
+        return None
+    matches = []
+    for i, line in enumerate(text.split('\n'), 1):
+        if pattern.search(line):
+            matches.append({"line": i, "content": line.strip()})
+            if len(matches) >= MAX_MATCHES_PER_FILE:
+                break
+    return matches
+
+def _search_bytes(buf, pattern) -> Optional[List[Dict[str, Any]]]:
+    m = pattern.search(buf)
+    if m is None:
+        return None
+    matches: List[Dict[str, Any]] = []
+    line_no, counted_to, size = 1, 0, len(buf)
+    while m is not None and len(matches) < MAX_MATCHES_PER_FILE:
+        start = buf.rfind(b"\n", 0, m.start()) + 1
+        end = buf.find(b"\n", m.start())
+        if end == -1:
+            end = size
+        line_no += buf[counted_to:start].count(b"\n")
+        counted_to = start
+        line = buf[start:end]
+        # A hit spanning lines doesn't count as a line match (same as per-line search).
+        if pattern.search(line):
+            matches.append({"line": line_no, "content": line.decode("utf-8", errors="ignore").strip()})
+        if end >= size:
+            break
+        m = pattern.search(buf, end + 1)
+    return matches
+
+def search_file(file_path: str, query: str, regex: bool) -> Optional[Dict[str, Any]]:
+    """Search one file; returns {"file_path", "matches"} or None when it doesn't match."""
+    pattern, as_bytes = _compile(query, regex)
+    try:
+        with open(file_path, "rb") as f:
+            if not as_bytes:
+                matches = _search_text(f.read().decode("utf-8", errors="ignore"), pattern)
+            elif os.fstat(f.fileno()).st_size == 0:
+                matches = _search_bytes(b"", pattern)
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    matches = _search_bytes(buf, pattern)
+    except (OSError, ValueError):
+        return None  # Skip files that can't be read
+    if matches is None:
+        return None
+    return {"file_path": file_path, "matches": matches}
+
+def _search_shard(shard: List[Tuple[int, str]], query: str, regex: bool) -> List[Tuple[int, Dict[str, Any]]]:
+    out = []
+    for order, file_path in shard:
+        result = search_file(file_path, query, regex)
+        if result is not None:
+            out.append((order, result))
+    return out
+
+def _shards(files: List[str]) -> Iterator[List[Tuple[int, str]]]:
+    shard, shard_bytes = [], 0
+    for order, file_path in enumerate(files):
+        shard.append((order, file_path))
+        try:
+            shard_bytes += os.path.getsize(file_path)
+        except OSError:
+            pass
+        if len(shard) >= _SHARD_FILES or shard_bytes >= _SHARD_BYTES:
+            yield shard
+            shard, shard_bytes = [], 0
+    if shard:
+        yield shard
+
+class SearchRun:
+    """Limits and counters for one search."""
+
+    def __init__(self, max_results: Optional[int], time_limit: Optional[float]):
+        self.max_results = max_results
+        self.deadline = time.monotonic() + time_limit if time_limit else None
+        self.started = time.monotonic()
+        self.results = 0
+        self.truncated = False
+
+    def accept(self) -> bool:
+        if self.max_results is not None and self.results >= self.max_results:
+            self.truncated = True
+            return False
+        self.results += 1
+        return True
+
+    def expired(self) -> bool:
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.truncated = True
+            return True
+        return False
+
+    def summary(self, files: int) -> Dict[str, Any]:
+        return {
+            "files_searched": files,
+            "results": self.results,
+            "truncated": self.truncated,
+            "elapsed_ms": round((time.monotonic() - self.started) * 1000, 1),
+        }
+
+def search(files: List[str], query: str, regex: bool, run: SearchRun,
+           workers: int = 0) -> List[Dict[str, Any]]:
+    """Search `files`, returning results in `files` order (stops early on limits)."""
+    _compile(query, regex)  # surface regex errors before fanning out
+    found: List[Tuple[int, Dict[str, Any]]] = []
+    if len(files) <= _INLINE_FILES:
+        for order, file_path in enumerate(files):
+            if run.expired():
+                break
+            result = search_file(file_path, query, regex)
+            if result is not None:
+                if not run.accept():
+                    break
+                found.append((order, result))
+        return [r for _, r in found]
+
+    executor = _get_executor(workers)
+    shards = enumerate(_shards(files))
+    in_flight: Dict[Any, int] = {}  # future -> shard number
+    completed: Dict[int, List[Tuple[int, Dict[str, Any]]]] = {}
+    next_shard = 0  # results are taken in shard order, so a cap keeps the first N in `files` order
+    limit = 2 * (workers or os.cpu_count() or 1)
+
+    def take(upto: Optional[int] = None):
+        nonlocal next_shard
+        for number in sorted(n for n in completed if upto is None or n <= upto):
+            for item in completed.pop(number):
+                if not run.accept():
+                    return
+                found.append(item)
+            next_shard = max(next_shard, number + 1)
+
+    try:
+        while True:
+            while len(in_flight) < limit and not run.truncated:
+                number, shard = next(shards, (None, None))
+                if shard is None:
+                    break
+                in_flight[executor.submit(_search_shard, shard, query, regex)] = number
+            if not in_flight:
+                break
+            timeout = max(0.0, run.deadline - time.monotonic()) if run.deadline else None
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                completed[in_flight.pop(future)] = future.result()
+            contiguous = next_shard
+            while contiguous in completed:
+                contiguous += 1
+            take(contiguous - 1)
+            if run.truncated:
+                break
+            if run.expired():
+                take()  # out of time: keep what did finish, still in order
+                break
+    finally:
+        for future in in_flight:
+            future.cancel()
+    return [r for _, r in found]
+
+async def astream(files: List[str], query: str, regex: bool, run: SearchRun,
+                  workers: int = 0) -> AsyncIterator[Dict[str, Any]]:
+    """Yield results as shards complete (completion order), stopping early on limits."""
+    _compile(query, regex)
+    loop = asyncio.get_running_loop()
+    if len(files) <= _INLINE_FILES:
+        for file_path in files:
+            if run.expired():
+                return
+            result = await loop.run_in_executor(None, search_file, file_path, query, regex)
+            if result is not None:
+                if not run.accept():
+                    return
+                yield result
+        return
+
+    executor = _get_executor(workers)
+    shards = _shards(files)
+    in_flight = set()
+    limit = 2 * (workers or os.cpu_count() or 1)
+    try:
+        while True:
+            while len(in_flight) < limit and not run.truncated:
+                # Sizing a shard stats its files: not on the event loop
+                shard = await loop.run_in_executor(None, next, shards, None)
+                if shard is None:
+                    break
+                in_flight.add(loop.run_in_executor(executor, _search_shard, shard, query, regex))
+            if not in_flight:
+                return
+            timeout = max(0.0, run.deadline - time.monotonic()) if run.deadline else None
+            done, in_flight = await asyncio.wait(in_flight, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                for _order, result in future.result():
+                    if not run.accept():
+                        return
+                    yield result
+            if run.expired():
+                return
+    finally:
+        for future in in_flight:
+            future.cancel()
@@ -0,0 +1,374 @@
+"""
+Persistent trigram index for FileSystemTool.search_files (codesearch-style).
+
+For each search root, the lowercased text of every indexed file is reduced to
+its set of byte trigrams and stored as an inverted index in a memory-mapped
+segment file under `fs_trigram_index_dir`. A query is narrowed to the files
+that contain all of its trigrams before any file is opened.
+
+Files that change after a segment is written live in a small in-memory delta
+(and their old segment entries are masked) until the delta is merged into a
+new segment. Segments are replaced atomically, so every uvicorn worker can map
+the same file and picks up a new one on its next search.
+"""
+import array
+import bisect
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+from ..settings import settings
+from .fs_index import DirectoryIndex, RootCache
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"KTRIGRM1"
+# magic, n_files, files_off, files_len, n_trigrams, table_off, postings_off
+_HEADER = struct.Struct("=8sQQQQQQ")
+_ROW = 3  # table rows are (trigram, postings offset, count) as uint32
+
+def trigrams(data: bytes) -> Set[int]:
+    """Distinct trigrams of `data` as 24-bit integers."""
+    grams = {data[i:i + 3] for i in range(len(data) - 2)}
+    return {int.from_bytes(g, "big") for g in grams}
+
+def _text_trigrams(text: str) -> Set[int]:
+    return trigrams(text.lower().encode("utf-8"))
+
+def required_literals(query: str, regex: bool = False) -> List[str]:
+    """Literal strings that every match of `query` must contain (best effort).
+
+    For regexes only top-level concatenations are used; alternations, classes
+    and optional parts end a literal run. An empty list means "can't narrow".
+    """
+    if not regex:
+        return [query]
+    try:
+        parsed = sre_parse.parse(query, re.IGNORECASE)
+    except re.error:
+        return []
+
+    literals: List[str] = []
+    run: List[str] = []
+
+    def flush():
+        if run:
+            literals.append("".join(run))
+            run.clear()
+
+    def walk(items):
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                run.append(chr(av))
+            elif op is sre_parse.SUBPATTERN:
+                walk(av[-1])
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+                flush()
+                walk(av[2])
+                flush()
+            elif op is sre_parse.AT:
+                continue  # zero-width anchors don't break contiguity
+            else:
+                flush()
+
+    walk(parsed)
+    flush()
+    return literals
+
+def _contains(posting, value: int) -> bool:
+    i = bisect.bisect_left(posting, value)
+    return i < len(posting) and posting[i] == value
+
+class _Segment:
+    """A read-only, memory-mapped segment file."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        magic, n_files, files_off, files_len, n_trigrams, table_off, postings_off = _HEADER.unpack_from(self.mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a trigram index: {path}")
+        # files[i] is [rel_path, size, mtime_ns], or None once superseded
+        self.files: List[Optional[list]] = json.loads(self.mm[files_off:files_off + files_len])
+        self.ids = {f[0]: i for i, f in enumerate(self.files) if f is not None}
+        mv = memoryview(self.mm)
+        self.table = mv[table_off:table_off + n_trigrams * _ROW * 4].cast("I")
+        self.keys = self.table[0::_ROW]
+        self.postings = mv[postings_off:table_off].cast("I")
+
+    def posting(self, trigram: int):
+        i = bisect.bisect_left(self.keys, trigram)
+        if i == len(self.keys) or self.keys[i] != trigram:
+            return None
+        offset, count = self.table[i * _ROW + 1], self.table[i * _ROW + 2]
+        return self.postings[offset:offset + count]
+
+    def rows(self) -> Iterable[Tuple[int, memoryview]]:
+        for i in range(len(self.keys)):
+            offset, count = self.table[i * _ROW + 1], self.table[i * _ROW + 2]
+            yield self.keys[i], self.postings[offset:offset + count]
+
+def _write_segment(path: str, files: List[Optional[list]], keys: List[int], posting_parts):
+    """Write a segment atomically. `posting_parts(key)` yields uint32 arrays/views for a key."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    files_blob = json.dumps(files, separators=(",", ":")).encode("utf-8")
+    files_blob += b" " * (-len(files_blob) % 4)
+    table = array.array("I")
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        files_off = f.tell()
+        f.write(files_blob)
+        postings_off = f.tell()
+        offset = 0
+        for key in keys:
+            count = 0
+            for part in posting_parts(key):
+                f.write(part)  # arrays and memoryviews are written as raw uint32s
+                count += len(part)
+            table.extend((key, offset, count))
+            offset += count
+        table_off = f.tell()
+        f.write(table.tobytes())
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, len(files), files_off, len(files_blob),
+                             len(keys), table_off, postings_off))
+    os.replace(tmp, path)
+
+class TrigramIndex:
+    """Trigram index of one search root: an on-disk segment plus an in-memory delta."""
+
+    def __init__(self, root: str, directory: str, max_file_size: int, merge_threshold: int):
+        self.root = root
+        self.path = os.path.join(directory, hashlib.sha1(root.encode()).hexdigest()[:16] + ".tri")
+        self.max_file_size = max_file_size
+        self.merge_threshold = merge_threshold
+        self._segment: Optional[_Segment] = None
+        self._delta: Dict[str, Tuple[Tuple[int, int], Set[int]]] = {}  # rel -> ((size, mtime), trigrams)
+        self._dead: Set[int] = set()  # segment ids changed or deleted since it was written
+        self._large: List[str] = []  # text files too big to index: always candidates
+        self._synced = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    def _read_trigrams(self, rel: str) -> Optional[Set[int]]:
+        try:
+            with open(os.path.join(self.root, rel), 'r', encoding='utf-8', errors='ignore') as f:
+                return _text_trigrams(f.read())
+        except OSError:
+            return None
+
+    def _load_segment(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._segment = None
+            return
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._segment is None or self._segment.stamp != stamp:
+            try:
+                self._segment = _Segment(self.path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning("Ignoring unreadable trigram index %s: %s", self.path, e)
+                self._segment = None
+
+    def _sync(self, dir_index: DirectoryIndex):
+        """Bring delta/dead/large in line with the directory index."""
+        self._load_segment()
+        seg = self._segment
+        # The index object itself, not id(): a new one can reuse a freed one's id
+        stamp = (dir_index, dir_index.version, seg.stamp if seg else None)
+        if stamp == self._synced:
+            return
+
+        delta, seen, large = {}, set(), []
+        for rel, size, mtime_ns, _is_link, is_text in dir_index.file_list():
+            if not is_text:
+                continue
+            if size > self.max_file_size:
+                large.append(rel)
+                continue
+            i = seg.ids.get(rel) if seg else None
+            if i is not None and seg.files[i][1] == size and seg.files[i][2] == mtime_ns:
+                seen.add(i)
+                continue
+            cached = self._delta.get(rel)
+            if cached is not None and cached[0] == (size, mtime_ns):
+                delta[rel] = cached
+                continue
+            grams = self._read_trigrams(rel)
+            if grams is not None:
+                delta[rel] = ((size, mtime_ns), grams)
+
+        self._delta = delta
+        self._dead = set(seg.ids.values()) - seen if seg else set()
+        self._large = large
+        self._synced = stamp
+        if len(self._delta) + len(self._dead) > self.merge_threshold:
+            self._merge()
+
+    @contextmanager
+    def _file_lock(self, blocking: bool):
+        """Hold this root's segment lock across workers; yields False if it is busy."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+
+    def _write(self, new_files: Iterable[Tuple[str, int, int, Set[int]]], base: Optional[_Segment]):
+        """Write base (minus dead files) + new_files as a new segment (hold `_file_lock`)."""
+        files = list(base.files) if base else []
+        for i in self._dead:
+            files[i] = None
+        # Ids superseded now or by an earlier merge: drop them from the copied postings
+        gone = {i for i, f in enumerate(files) if f is None}
+
+        added: Dict[int, array.array] = defaultdict(lambda: array.array("I"))
+        for rel, size, mtime_ns, grams in new_files:
+            file_id = len(files)  # new ids are larger, so postings stay sorted
+            files.append([rel, size, mtime_ns])
+            for g in grams:
+                added[g].append(file_id)
+
+        old = dict(base.rows()) if base else {}
+
+        def parts(key):
+            if key in old:
+                posting = old[key]
+                if gone:
+                    posting = array.array("I", (i for i in posting if i not in gone))
+                yield posting
+            if key in added:
+                yield added[key]
+
+        _write_segment(self.path, files, sorted(old.keys() | added.keys()), parts)
+        self._segment, self._delta, self._dead, self._synced = None, {}, set(), None
+        self._load_segment()
+
+    def _merge(self):
+        """Fold the delta into a new segment, or rebuild when it is mostly tombstones."""
+        seg = self._segment
+        if seg is not None and len(self._dead) > len(seg.ids) // 2:
+            self._segment, self._synced = None, None
+            try:
+                os.remove(self.path)  # the next search starts a full rebuild
+            except FileNotFoundError:
+                pass  # another worker removed or is rebuilding it
+            return
+        with self._file_lock(blocking=False) as locked:
+            if not locked:
+                return  # another worker is writing; keep the delta and pick up its segment
+            # The delta is in walk order, so appended ids keep segment order close to it
+            self._write(((rel, size, mtime_ns, grams)
+                         for rel, ((size, mtime_ns), grams) in self._delta.items()), seg)
+
+    def _build_full(self, dir_index: DirectoryIndex):
+        """Index every text file under the root, streaming postings straight to disk."""
+        def files():
+            for rel, size, mtime_ns, _is_link, is_text in dir_index.file_list():
+                if is_text and size <= self.max_file_size:
+                    grams = self._read_trigrams(rel)
+                    if grams is not None:
+                        yield rel, size, mtime_ns, grams
+
+        self._dead = set()
+        with self._file_lock(blocking=True):
+            # A worker that lost the race waits here and maps the winner's segment
+            self._load_segment()
+            if self._segment is None:
+                self._write(files(), None)
+
+    def build(self, dir_index: DirectoryIndex):
+        """Build the segment for this root (runs in a background thread)."""
+        with self._lock:
+            try:
+                self._load_segment()
+                if self._segment is None:
+                    self._build_full(dir_index)
+                self._sync(dir_index)
+            except Exception:
+                logger.exception("Trigram index build failed for %s", self.root)
+            finally:
+                self._building = False
+
+    def candidates(self, dir_index: DirectoryIndex, literals: List[str]) -> Optional[List[str]]:
+        """Relative paths that may match, or None when the index can't help yet.
+
+        None is returned while the first build runs in the background, while
+        another thread holds the index, or when the query has no trigrams.
+        """
+        grams: Set[int] = set()
+        for literal in literals:
+            grams |= _text_trigrams(literal)
+        if not grams:
+            return None
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            self._load_segment()
+            if self._segment is not None:
+                self._sync(dir_index)
+            if self._segment is None:
+                if not self._building:
+                    self._building = True
+                    threading.Thread(target=self.build, args=(dir_index,),
+                                     name="fs-trigram-build", daemon=True).start()
+                return None
+            return self._lookup(grams)
+        finally:
+            self._lock.release()
+
+    def _lookup(self, grams: Set[int]) -> List[str]:
+        found: List[str] = []
+        seg = self._segment
+        if seg is not None:
+            postings = []
+            for g in grams:
+                posting = seg.posting(g)
+                if posting is None:
+                    postings = []
+                    break
+                postings.append(posting)
+            if postings:
+                postings.sort(key=len)
+                ids = [i for i in postings[0] if i not in self._dead]
+                for posting in postings[1:]:
+                    ids = [i for i in ids if _contains(posting, i)]
+                    if not ids:
+                        break
+                found.extend(seg.files[i][0] for i in ids if seg.files[i] is not None)
+        found.extend(rel for rel, (_, file_grams) in self._delta.items() if grams <= file_grams)
+        found.extend(self._large)
+        return found
+
+_indexes = RootCache(settings.fs_index_max_roots)
+
+def get_trigram_index(path: str) -> Optional[TrigramIndex]:
+    """The trigram index for a search root, or None when the feature is off."""
+    if not settings.fs_trigram_index_dir:
+        return None
+    return _indexes.get(path, lambda root: TrigramIndex(
+        root,
+        settings.fs_trigram_index_dir,
+        max_file_size=settings.fs_trigram_max_file_size,
+        merge_threshold=settings.fs_trigram_merge_threshold,
+    ))
@@ -0,0 +1,62 @@
+#!/usr/bin/env node
+// Stub Kilocode agent for benchmarks: speaks the bridge.js --server protocol
+// without loading the real agent or calling a model.
+//
+//   BENCH_AGENT_LATENCY_MS   delay before the first delta / result (default 50)
+//   BENCH_AGENT_DELTAS       deltas per streamed run (default 20)
+//   BENCH_AGENT_DELTA_MS     delay between deltas (default 5)
+//   BENCH_AGENT_FAIL         runs whose step action contains this text fail
+const readline = require("readline");
+
+const latencyMs = Number(process.env.BENCH_AGENT_LATENCY_MS || 50);
+const deltas = Number(process.env.BENCH_AGENT_DELTAS || 20);
+const deltaMs = Number(process.env.BENCH_AGENT_DELTA_MS || 5);
+const failOn = process.env.BENCH_AGENT_FAIL || "";
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+function send(msg) {
+  process.stdout.write(JSON.stringify(msg) + "\n");
+}
+
+async function handle(req) {
+  const id = req.id;
+  if (req.type === "ping") {
+    send({ id, type: "pong", pid: process.pid });
+    return;
+  }
+  await sleep(latencyMs);
+  const action = (req.input && req.input.step && req.input.step.action) || "";
+  if (failOn && action.includes(failOn)) {
+    send({ id, type: "error", error: `Step failed: ${action}` });
+    return;
+  }
+  let content = "";
+  for (let i = 0; i < deltas; i++) {
+    const delta = `step ${i} `;
+    content += delta;
+    if (req.stream) {
+      send({ id, type: "delta", delta });
+      await sleep(deltaMs);
+    }
+  }
+  send({ id, type: "result", result: { content, mode: req.mode } });
+}
+
+const inFlight = new Set();
+const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+rl.on("line", (line) => {
+  if (!line.trim()) return;
+  let req;
+  try {
+    req = JSON.parse(line);
+  } catch (err) {
+    send({ id: null, type: "error", error: `Invalid request: ${err}` });
+    return;
+  }
+  const task = handle(req).finally(() => inFlight.delete(task));
+  inFlight.add(task);
+});
+rl.on("close", () => {
+  Promise.allSettled(inFlight).then(() => process.exit(0));
+});
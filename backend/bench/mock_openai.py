@@ -0,0 +1,80 @@
+"""
+Local mock of the OpenAI chat completions API for benchmarks.
+
+    python -m bench.mock_openai --port 9100 --latency 0.2 --tokens 64 --token-rate 200
+
+Non-streaming calls answer after `latency` + tokens/token_rate seconds;
+streaming calls send the first chunk after `latency` and then `token_rate`
+chunks per second. Requests with response_format json_object get a JSON plan.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock OpenAI")
+config = {"latency": 0.2, "tokens": 64, "token_rate": 200.0}
+
+def _content(body: dict) -> str:
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        if any("depends_on" in (m.get("content") or "") for m in body.get("messages", [])):
+            steps = [{"id": "s1", "action": "Set up", "depends_on": []}]
+            steps += [{"id": f"s{i}", "action": f"Do part {i}", "depends_on": ["s1"]} for i in range(2, 5)]
+            steps.append({"id": "s5", "action": "Wrap up", "depends_on": ["s2", "s3", "s4"]})
+            return json.dumps({"steps": steps, "summary": "A five step plan."})
+        steps = [f"Step {i}: do part {i}" for i in range(1, 6)]
+        return json.dumps({"plan": steps, "summary": "A five step plan."})
+    return " ".join(f"tok{i}" for i in range(config["tokens"]))
+
+def _chunk(model: str, delta: dict, finish_reason=None) -> str:
+    return "data: " + json.dumps({
+        "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+        "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }) + "\n\n"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "mock")
+    content = _content(body)
+    await asyncio.sleep(config["latency"])
+
+    if body.get("stream"):
+        pieces = content.split(" ")
+        interval = 1.0 / config["token_rate"] if config["token_rate"] else 0.0
+
+        async def stream():
+            yield _chunk(model, {"role": "assistant", "content": ""})
+            for i, piece in enumerate(pieces):
+                yield _chunk(model, {"content": piece if i == 0 else " " + piece})
+                if interval:
+                    await asyncio.sleep(interval)
+            yield _chunk(model, {}, "stop")
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    if config["token_rate"]:
+        await asyncio.sleep(len(content.split(" ")) / config["token_rate"])
+    return JSONResponse({
+        "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": config["tokens"], "total_tokens": config["tokens"]},
+    })
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=config["latency"], help="seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=config["tokens"], help="tokens per reply")
+    parser.add_argument("--token-rate", type=float, default=config["token_rate"], help="tokens/sec (0 = instant)")
+    args = parser.parse_args()
+    config.update(latency=args.latency, tokens=args.tokens, token_rate=args.token_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Offline load test for the backend.
+
+    cd backend && python -m bench.run [--levels 1,8,32] [--requests 64] [--save-baseline]
+
+Starts the mock OpenAI server (bench/mock_openai.py) and the backend with the
+stub agent (bench/fake_agent/bridge.js) on a generated repo, then drives each
+scenario at every concurrency level and reports RPS, latency percentiles,
+time to first byte of streamed responses and peak RSS of the backend process
+tree. Results are compared against bench/baseline.json; the exit status is 1
+if any tracked number regressed by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from .synthetic_repo import generate
+
+BENCH_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+
+# Lower is better for these; RPS is higher-is-better.
+_LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms")
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def _tree_peak_rss_kb(pid: int) -> int:
+    """Sum of VmHWM over `pid` and its descendants (Linux only; 0 elsewhere)."""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1])
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                stack.extend(int(c) for c in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+# --- scenarios ------------------------------------------------------------------
+# Each takes (client, i) and returns the time to first byte for streams, else None.
+
+def _chat_body(i: int) -> Dict[str, Any]:
+    # Distinct content per request so single-flight does not collapse the load.
+    return {"mode": "coder", "messages": [{"role": "user", "content": f"Explain step {i} of the build."}]}
+
+async def _post(client: httpx.AsyncClient, path: str, body: Dict[str, Any]) -> None:
+    r = await client.post(path, json=body)
+    r.raise_for_status()
+
+async def _post_stream(client: httpx.AsyncClient, path: str, body: Dict[str, Any]) -> float:
+    start = time.perf_counter()
+    ttfb = None
+    async with client.stream("POST", path, json=body) as r:
+        r.raise_for_status()
+        async for chunk in r.aiter_bytes():
+            if ttfb is None and chunk:
+                ttfb = time.perf_counter() - start
+    return ttfb if ttfb is not None else time.perf_counter() - start
+
+async def chat(client, i):
+    await _post(client, "/chat", _chat_body(i))
+
+async def chat_stream(client, i):
+    return await _post_stream(client, "/chat/stream", _chat_body(i))
+
+async def plan(client, i):
+    await _post(client, "/plan", {"messages": [{"role": "user", "content": f"Plan feature {i}."}]})
+
+async def execute(client, i):
+    return await _post_stream(client, "/execute", {"mode": "coder", "plan": [f"Step {i}", "Verify"]})
+
+async def fs_index(client, i):
+    await _post(client, "/tools/fs/index", {"path": "repo", "max_depth": 8, "page_size": 200})
+
+async def fs_read(client, i):
+    await _post(client, "/tools/fs/read", {"file_path": f"repo/file{i % 8}.py", "start_line": 10, "max_lines": 40})
+
+async def fs_search(client, i):
+    return await _post_stream(client, "/tools/fs/search", {"query": "NEEDLE_TOKEN", "path": "repo"})
+
+SCENARIOS: Dict[str, Callable] = {
+    "chat": chat, "chat_stream": chat_stream, "plan": plan, "execute": execute,
+    "fs_index": fs_index, "fs_read": fs_read, "fs_search": fs_search,
+}
+
+async def run_level(base_url: str, scenario: Callable, concurrency: int, requests: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    ttft = await scenario(client, i)
+                except (httpx.HTTPError, ValueError):
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": ms(_percentile(latencies, 50)),
+        "p95_ms": ms(_percentile(latencies, 95)),
+        "p99_ms": ms(_percentile(latencies, 99)),
+        "ttft_p50_ms": ms(_percentile(ttfts, 50)),
+    }
+
+# --- processes ------------------------------------------------------------------
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{proc.args[2]} exited with status {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).is_success:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+def start_servers(args, workdir: str):
+    mock_port, api_port = _free_port(), _free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "bench.mock_openai", "--port", str(mock_port), "--latency", str(args.latency),
+         "--tokens", str(args.tokens), "--token-rate", str(args.token_rate)],
+        cwd=BACKEND_DIR,
+    )
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(BACKEND_DIR),
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1",
+        "OPENAI_HEDGE_PERCENTILE": "0",
+        "BRIDGE_SCRIPT": str(BENCH_DIR / "fake_agent" / "bridge.js"),
+        "BENCH_AGENT_LATENCY_MS": str(int(args.latency * 1000)),
+        # Measure the request path itself, not cache hits or admission control.
+        "RESPONSE_CACHE_ENABLED": "false",
+        "SCHEDULER_RPM": "1000000",
+        "SCHEDULER_TPM": "1000000000",
+        "SCHEDULER_MAX_IN_FLIGHT": "1024",
+        "SCHEDULER_QUEUE_SIZE": "4096",
+    }
+    # cwd is the workdir so the synthetic repo is inside the fs tools' allowed root.
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    try:
+        _wait_ready(f"http://127.0.0.1:{mock_port}/docs", mock)
+        _wait_ready(f"http://127.0.0.1:{api_port}/readyz", api)  # bridge workers warm
+    except Exception:
+        stop(mock, api)
+        raise
+    return mock, api, f"http://127.0.0.1:{api_port}"
+
+def stop(*procs: subprocess.Popen):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+# --- baseline -------------------------------------------------------------------
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions beyond `tolerance` (a fraction) relative to the baseline."""
+    regressions = []
+    old = baseline.get("scenarios", {})
+    for name, levels in report["scenarios"].items():
+        by_level = {row["concurrency"]: row for row in old.get(name, [])}
+        for row in levels:
+            ref = by_level.get(row["concurrency"])
+            if not ref:
+                continue
+            label = f"{name}@{row['concurrency']}"
+            if ref.get("rps") and row["rps"] < ref["rps"] * (1 - tolerance):
+                regressions.append(f"{label} rps {row['rps']} < baseline {ref['rps']}")
+            for key in _LATENCY_KEYS:
+                if ref.get(key) and row.get(key) is not None and row[key] > ref[key] * (1 + tolerance):
+                    regressions.append(f"{label} {key} {row[key]} > baseline {ref[key]}")
+            if row["errors"] > ref.get("errors", 0):
+                regressions.append(f"{label} errors {row['errors']} > baseline {ref.get('errors', 0)}")
+    rss, ref_rss = report.get("peak_rss_kb"), baseline.get("peak_rss_kb")
+    if rss and ref_rss and rss > ref_rss * (1 + tolerance):
+        regressions.append(f"peak_rss_kb {rss} > baseline {ref_rss}")
+    return regressions
+
+def _print_table(name: str, rows: List[Dict[str, Any]]):
+    print(f"\n{name}")
+    print(f"  {'conc':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttft ms':>9} {'errors':>7}")
+    for r in rows:
+        cells = [r["rps"], r["p50_ms"], r["p95_ms"], r["p99_ms"], r["ttft_p50_ms"]]
+        print(f"  {r['concurrency']:>5} " + " ".join(f"{'-' if c is None else c:>9}" for c in cells)
+              + f" {r['errors']:>7}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the backend against a mock OpenAI API.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated subset of: "
+                        + ", ".join(SCENARIOS))
+    parser.add_argument("--levels", default="1,8,32", help="concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="requests per scenario and level")
+    parser.add_argument("--files", type=int, default=2000, help="files in the synthetic repo")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock time to first token (s)")
+    parser.add_argument("--tokens", type=int, default=64, help="mock tokens per reply")
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="mock tokens per second")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression as a fraction")
+    parser.add_argument("--output", type=Path, help="also write the results JSON here")
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    levels = [int(n) for n in args.levels.split(",")]
+
+    with tempfile.TemporaryDirectory(prefix="kilocode-bench-") as workdir:
+        generate(os.path.join(workdir, "repo"), args.files)
+        mock, api, base_url = start_servers(args, workdir)
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        peak_rss = 0
+        try:
+            for name in names:
+                # One unmeasured request warms pools, prompt caches and the fs index.
+                asyncio.run(run_level(base_url, SCENARIOS[name], 1, 1))
+                results[name] = [asyncio.run(run_level(base_url, SCENARIOS[name], c, args.requests))
+                                 for c in levels]
+                _print_table(name, results[name])
+            peak_rss = _tree_peak_rss_kb(api.pid)
+        finally:
+            stop(api, mock)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {"levels": levels, "requests": args.requests, "files": args.files,
+                   "latency": args.latency, "tokens": args.tokens, "token_rate": args.token_rate},
+        "peak_rss_kb": peak_rss,
+        "scenarios": results,
+    }
+    print(f"\npeak RSS (backend + agents): {peak_rss / 1024:.1f} MiB")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("No baseline to compare against; run with --save-baseline to create one.")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("config") != report["config"]:
+        print("Warning: baseline was recorded with a different configuration.")
+    regressions = compare(report, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline.name}.")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
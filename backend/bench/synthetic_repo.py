@@ -0,0 +1,48 @@
+"""
+Generate a synthetic source tree for the fs tool benchmarks.
+
+    python -m bench.synthetic_repo /tmp/bench-repo --files 5000
+"""
+import argparse
+import os
+import random
+
+_EXTENSIONS = (".py", ".ts", ".js", ".md", ".json", ".txt")
+_WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+          "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa")
+
+def generate(root: str, files: int, lines: int = 80, fanout: int = 8, seed: int = 1) -> str:
+    """Write `files` text files under `root`, `fanout` entries per directory level.
+
+    Every 50th file contains the marker `NEEDLE_TOKEN`, so searches have a
+    known number of hits.
+    """
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    for i in range(files):
+        parts, n = [], i // fanout
+        while n:
+            parts.append(f"pkg{n % fanout}")
+            n //= fanout
+        directory = os.path.join(root, *reversed(parts))
+        os.makedirs(directory, exist_ok=True)
+        body = []
+        for line in range(lines):
+            words = " ".join(rng.choice(_WORDS) for _ in range(8))
+            body.append(f"def fn_{i}_{line}(): return '{words}'")
+        if i % 50 == 0:
+            body.insert(lines // 2, "# NEEDLE_TOKEN marks this file")
+        with open(os.path.join(directory, f"file{i}{_EXTENSIONS[i % len(_EXTENSIONS)]}"), "w") as f:
+            f.write("\n".join(body) + "\n")
+    return root
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic repo for benchmarks.")
+    parser.add_argument("root")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--lines", type=int, default=80)
+    args = parser.parse_args()
+    generate(args.root, args.files, args.lines)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
 #!/usr/bin/env node
 // bridge.js — Kilocode subprocess adapter
+//
+//   node bridge.js <input.json>   run the agent once and print the result
+//   node bridge.js --server       long-lived worker: one JSON request per line on
+//                                 stdin, tagged JSON-lines responses on stdout
 import fs from "fs";
-import path from "path";
+import readline from "readline";
 import { runAgent } from "./dist/index.js"; // adjust if exported differently
 
 async function main() {
@@ -17,7 +21,65 @@ async function main() {
   console.log(JSON.stringify(result, null, 2));
 }
 
-main().catch((err) => {
-  console.error("Agent error:", err);
-  process.exit(1);
-});
\ No newline at end of file
+// --- server mode ----------------------------------------------------------
+//
+// Requests:  {"id": "1", "type": "run", "mode": "coder", "input": {...}, "stream": true}
+//            {"id": "2", "type": "ping"}
+// Responses: {"id": "1", "type": "delta", "delta": "..."}   (stream only, 0..n)
+//            {"id": "1", "type": "result", "result": {...}}
+//            {"id": "1", "type": "error", "error": "..."}
+//            {"id": "2", "type": "pong"}
+
+function send(msg) {
+  process.stdout.write(JSON.stringify(msg) + "\n");
+}
+
+async function handle(req) {
+  const id = req.id;
+  if (req.type === "ping") {
+    send({ id, type: "pong", pid: process.pid });
+    return;
+  }
+  try {
+    const onDelta = req.stream
+      ? (delta) => send({ id, type: "delta", delta: String(delta) })
+      : undefined;
+    const result = await runAgent(req.mode, req.input, { onDelta });
+    send({ id, type: "result", result });
+  } catch (err) {
+    send({ id, type: "error", error: String((err && err.stack) || err) });
+  }
+}
+
+function serve() {
+  // stdout carries the protocol; keep stray agent logging off it.
+  console.log = console.info = console.debug = console.error;
+
+  const inFlight = new Set();
+  const rl = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+  rl.on("line", (line) => {
+    if (!line.trim()) return;
+    let req;
+    try {
+      req = JSON.parse(line);
+    } catch (err) {
+      send({ id: null, type: "error", error: `Invalid request: ${err}` });
+      return;
+    }
+    const task = handle(req).finally(() => inFlight.delete(task));
+    inFlight.add(task);
+  });
+  // Parent closed our stdin: answer the requests already read, then exit.
+  rl.on("close", () => {
+    Promise.allSettled(inFlight).then(() => process.exit(0));
+  });
+}
+
+if (process.argv[2] === "--server") {
+  serve();
+} else {
+  main().catch((err) => {
+    console.error("Agent error:", err);
+    process.exit(1);
+  });
+}
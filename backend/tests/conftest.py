@@ -0,0 +1,4 @@
+import os
+
+# app.settings requires a key at import; tests never call OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,79 @@
+import asyncio
+
+from app import kilocode_bridge, main
+from app.cache import ResponseCache
+from app.schemas import ChatRequest, ChatResponse
+from app.settings import settings
+
+def test_fallback_win_lets_the_agent_finish(monkeypatch):
+    monkeypatch.setattr(settings, "bridge_latency_budget", 0.01)
+    finished = []
+
+    async def slow_agent(req, prepared=None):
+        await asyncio.sleep(0.1)
+        finished.append(True)
+        return ChatResponse(content="agent", meta={"source": "kilocode_agent"})
+
+    async def fallback(req, prepared=None):
+        return ChatResponse(content="openai", meta={"source": "openai_fallback"})
+
+    monkeypatch.setattr(main, "kilocode_chat", slow_agent)
+    monkeypatch.setattr(main, "openai_chat", fallback)
+    req = ChatRequest(messages=[{"role": "user", "content": "hi"}], mode="coder")
+
+    async def run():
+        response = await main.answer_chat(req)
+        assert response.content == "openai"
+        assert len(main._detached_agents) == 1
+        await asyncio.gather(*main._detached_agents)  # not cancelled: it runs to the end
+        assert finished == [True]
+        assert not main._detached_agents
+
+    asyncio.run(run())
+
+def test_agent_gets_the_packed_messages(monkeypatch):
+    sent = {}
+
+    async def agent(mode, input_data):
+        sent.update(input_data)
+        return {"content": "agent"}
+
+    monkeypatch.setattr(kilocode_bridge, "run_kilocode_agent", agent)
+    req = ChatRequest(messages=[{"role": "user", "content": "old " * 400},
+                                {"role": "assistant", "content": "ok"},
+                                {"role": "user", "content": "hi"}], mode="coder")
+    monkeypatch.setattr(settings, "context_max_tokens", 300)
+    prepared = main.chat_messages(req, main.get_mode("coder"))
+
+    response = asyncio.run(main.kilocode_chat(req, prepared))
+    assert sent["messages"] == prepared[0]
+    assert prepared[1]["dropped_messages"] == 1
+    assert response.meta["context"] == prepared[1]
+
+def test_retrieval_runs_once_per_request_for_key_and_prompt(monkeypatch):
+    calls, prompts = [], []
+
+    def related(req):
+        calls.append(req)
+        return f"# Relevant code\nv{len(calls) // 3}"  # changes on the third request
+
+    async def answer(req, prepared=None):
+        prompts.append(prepared[0][1]["content"])
+        return ChatResponse(content="ok", meta={"source": "openai_fallback"})
+
+    monkeypatch.setattr(main, "related_context", related)
+    monkeypatch.setattr(main, "answer_chat", answer)
+    monkeypatch.setattr(main, "response_cache", ResponseCache(max_entries=16, ttl=60))
+    req = ChatRequest(messages=[{"role": "user", "content": "where is the parser"}], mode="coder")
+
+    async def run():
+        first = await main.cached_chat(req)
+        second = await main.cached_chat(req)
+        third = await main.cached_chat(req)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert len(calls) == 3
+    assert "cache" not in first.meta and second.meta["cache"] == "hit"
+    assert "cache" not in third.meta  # what retrieval found changed: a new prompt, not a stale answer
+    assert prompts == ["# Relevant code\nv0", "# Relevant code\nv1"]
@@ -0,0 +1,91 @@
+import asyncio
+import shutil
+from pathlib import Path
+
+import pytest
+
+from app.kilocode_bridge import BridgePool
+
+FAKE_AGENT = Path(__file__).resolve().parents[1] / "bench" / "fake_agent" / "bridge.js"
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+
+def _pool(**kwargs) -> BridgePool:
+    options = {"size": 2, "max_requests": 0, "request_timeout": 10.0, "health_interval": 0}
+    options.update(kwargs)
+    return BridgePool(script_path=FAKE_AGENT, **options)
+
+def test_health_check_returns_each_worker_as_it_answers():
+    async def run():
+        pool = _pool(health_interval=0.05)
+        await pool.start()
+        hung, healthy = list(pool._idle._queue)  # checked in queue order
+        ping_started = asyncio.Event()
+
+        async def slow_ping(timeout=5.0):
+            ping_started.set()
+            await asyncio.sleep(1.0)
+            return True
+
+        hung.ping = slow_ping
+        try:
+            await asyncio.wait_for(ping_started.wait(), 1)
+            # The hung worker's ping is still running; the healthy one serves
+            worker = await asyncio.wait_for(pool._acquire(), 0.5)
+            assert worker is healthy
+            pool._release(worker)
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+def test_worker_is_recycled_after_max_requests():
+    async def run():
+        pool = _pool(size=1, max_requests=2)
+        try:
+            first = await pool.run("coder", {})
+            assert first["mode"] == "coder"
+            (worker,) = pool._workers
+            pid = worker.proc.pid
+            await pool.run("coder", {})  # second request: retired off the request path
+            await asyncio.wait_for(asyncio.gather(*pool._recycling), 5)
+            (replacement,) = pool._workers
+            assert replacement is not worker and replacement.proc.pid != pid
+            assert worker.proc.returncode is not None
+            assert pool.restarts == 1
+            assert (await pool.run("coder", {}))["mode"] == "coder"
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+def test_abandoned_stream_recycles_its_worker():
+    async def run():
+        pool = _pool(size=1)
+        try:
+            stream = pool.stream("coder", {})
+            assert (await stream.__anext__())["type"] == "delta"
+            await stream.aclose()  # caller went away mid-run
+            await asyncio.wait_for(asyncio.gather(*pool._recycling), 5)
+            assert pool.restarts == 1
+            assert (await pool.run("coder", {}))["mode"] == "coder"
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+def test_close_stops_busy_and_idle_workers():
+    async def run():
+        pool = _pool(size=2)
+        await pool.start()
+        procs = [worker.proc for worker in pool._workers]
+        busy = asyncio.create_task(pool.run("coder", {}))
+        await asyncio.sleep(0.01)  # one worker is mid-request
+        await pool.close()
+        assert all(proc.returncode is not None for proc in procs)
+        assert not pool.started and not pool._workers
+        done, _ = await asyncio.wait({busy}, timeout=5)
+        assert done  # the request fails or finishes; it doesn't hang
+        busy.exception()
+
+    asyncio.run(run())
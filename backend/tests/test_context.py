@@ -0,0 +1,28 @@
+from app.context import pack_messages
+from app.sessions import SUMMARY_HEADER, Session, split_summary
+
+def test_session_summary_outlives_the_oldest_history():
+    session = Session("s", messages=[{"role": "user", "content": f"question {i} " * 20} for i in range(10)],
+                      summary="the user is porting the parser to Rust")
+    summary, history = split_summary(session.history())
+    assert summary.startswith(SUMMARY_HEADER)
+    assert history == session.messages
+
+    messages, stats = pack_messages("system", history, {"role": "user", "content": "next"},
+                                    budget=200, summary=summary)
+    assert stats["dropped_messages"] > 0
+    assert messages[1] == {"role": "system", "content": summary}
+    assert messages[2:-1] == history[stats["dropped_messages"]:]
+    assert messages[-1]["content"] == "next"
+
+def test_summary_is_truncated_rather_than_dropped():
+    summary = SUMMARY_HEADER + "\n" + "decision " * 400
+    messages, stats = pack_messages("system", [], {"role": "user", "content": "next"}, budget=100,
+                                    summary=summary)
+    assert "summary" in stats["truncated"]
+    assert messages[1]["content"].startswith(SUMMARY_HEADER)
+    assert stats["packed_tokens"] <= 100
+
+def test_split_summary_without_one():
+    history = [{"role": "system", "content": "client note"}, {"role": "user", "content": "hi"}]
+    assert split_summary(history) == (None, history)
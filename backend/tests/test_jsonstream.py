@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from app.jsonstream import JSONStreamParser
+
+PLAN = {
+    "plan": [
+        {"id": "s1", "action": "Read \"config\" {braces} [brackets]", "depends_on": []},
+        {"id": "s2", "action": "café \\ back\\slash, comma", "depends_on": ["s1"], "weight": -1.5e3},
+        "free text step",
+        42,
+    ],
+    "summary": "done: [ok]",
+    "risky": False,
+    "notes": None,
+    "meta": {"nested": [1, {"deep": True}]},
+}
+
+def _events(chunks):
+    parser = JSONStreamParser()
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    return events, parser
+
+def _expected(document):
+    events = []
+    for key, value in document.items():
+        if isinstance(value, list):
+            events.extend((key, i, item) for i, item in enumerate(value))
+        else:
+            events.append((key, None, value))
+    return events
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_one_character_chunks_match_a_single_feed(ensure_ascii):
+    text = "Here is the plan:\n```json\n" + json.dumps(PLAN, ensure_ascii=ensure_ascii, indent=2) + "\n```"
+    whole, parser = _events([text])
+    assert whole == _expected(PLAN)
+    assert parser.done
+
+    by_char, parser = _events(list(text))
+    assert by_char == whole
+    assert parser.done
+
+@pytest.mark.parametrize("size", [2, 3, 5, 7])
+def test_any_chunk_size_matches(size):
+    text = json.dumps(PLAN)
+    events, _ = _events([text[i:i + size] for i in range(0, len(text), size)])
+    assert events == _expected(PLAN)
+
+def test_elements_are_emitted_as_soon_as_they_close():
+    parser = JSONStreamParser()
+    assert parser.feed('{"plan": [{"id": "a"}, {"id"') == [("plan", 0, {"id": "a"})]
+    assert parser.feed(': "b"}') == [("plan", 1, {"id": "b"})]
+    assert parser.feed("]") == []
+    assert parser.feed(', "summary": 12') == []  # a number may still go on
+    assert parser.feed("3}") == [("summary", None, 123)]
+    assert parser.done and parser.feed('{"ignored": 1}') == []
+
+def test_buffer_keeps_only_the_unfinished_value():
+    parser = JSONStreamParser()
+    for i in range(200):
+        parser.feed(('{"plan": [' if i == 0 else ",") + json.dumps({"id": i, "action": "x" * 50}))
+    assert len(parser._text) < 100
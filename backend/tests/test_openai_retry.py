@@ -0,0 +1,27 @@
+import email.utils
+import time
+
+import httpx
+import pytest
+
+from app.providers.openai import _retry_after, backoff_delay
+from app.settings import settings
+
+class _Error(Exception):
+    def __init__(self, **headers):
+        super().__init__("rate limited")
+        self.response = httpx.Response(429, headers=headers)
+
+def test_retry_after_forms():
+    assert _retry_after(_Error(**{"retry-after": "3"})) == 3.0
+    assert _retry_after(_Error(**{"retry-after-ms": "250", "retry-after": "9"})) == 0.25
+    in_ten = email.utils.formatdate(time.time() + 10, usegmt=True)
+    assert 8 <= _retry_after(_Error(**{"retry-after": in_ten})) <= 10
+    assert _retry_after(_Error(**{"retry-after": email.utils.formatdate(0, usegmt=True)})) == 0.0
+    assert _retry_after(Exception("no response")) is None
+
+@pytest.mark.parametrize("value", ["soon", "Wed, 99 Foo 2024 25:00:00 GMT", "nan", "inf", "1, 2"])
+def test_malformed_retry_after_falls_back_to_backoff(monkeypatch, value):
+    monkeypatch.setattr(settings, "openai_backoff_base", 0.5)
+    assert _retry_after(_Error(**{"retry-after": value})) is None
+    assert 0 <= backoff_delay(2, _Error(**{"retry-after": value})) <= 2.0
@@ -0,0 +1,79 @@
+import asyncio
+
+from app.orchestrator import run_plan_graph
+
+def _step(sid, *depends_on):
+    return {"id": sid, "action": f"do {sid}", "depends_on": list(depends_on)}
+
+DIAMOND = [_step("a"), _step("b", "a"), _step("c", "a"), _step("d", "b", "c")]
+
+def _run(steps, run_step, parallelism=4):
+    async def run():
+        return [event async for event in run_plan_graph(steps, run_step, parallelism)]
+    return asyncio.run(run())
+
+def _outcomes(events):
+    return {e["step"]: e["type"] for e in events if e["type"] in ("done", "error", "cancelled")}
+
+def test_failing_root_cancels_the_whole_diamond():
+    started = []
+
+    async def run_step(step, deps):
+        started.append(step["id"])
+        raise RuntimeError(f"{step['id']} broke")
+        yield  # an async generator
+
+    events = _run(DIAMOND, run_step)
+    assert started == ["a"]
+    assert _outcomes(events) == {"a": "error", "b": "cancelled", "c": "cancelled", "d": "cancelled"}
+    assert [e["reason"] for e in events if e["type"] == "cancelled"] == ["dependency a failed"] * 3
+    assert len([e for e in events if e["step"] == "d"]) == 1  # reached via b and c, reported once
+
+def test_failing_branch_spares_the_independent_one():
+    async def run_step(step, deps):
+        if step["id"] == "b":
+            raise RuntimeError("b broke")
+        yield f"{step['id']}:" + ",".join(sorted(deps))
+
+    events = _run(DIAMOND + [_step("e", "c")], run_step)
+    assert _outcomes(events) == {"a": "done", "b": "error", "c": "done", "d": "cancelled", "e": "done"}
+    assert [e["delta"] for e in events if e["step"] == "e" and e["type"] == "delta"] == ["e:c"]
+
+def test_dependencies_get_outputs_and_parallelism_is_bounded():
+    running, peak, seen = set(), [0], {}
+
+    async def run_step(step, deps):
+        running.add(step["id"])
+        peak[0] = max(peak[0], len(running))
+        seen[step["id"]] = deps
+        await asyncio.sleep(0.01)
+        yield step["id"].upper()
+        running.discard(step["id"])
+
+    steps = [_step("a"), _step("b"), _step("c"), _step("d", "a", "b", "c")]
+    events = _run(steps, run_step, parallelism=2)
+    assert peak[0] == 2
+    assert seen["d"] == {"a": "A", "b": "B", "c": "C"}
+    assert events[-1] == {"step": "d", "type": "done"}
+
+def test_closing_the_iterator_cancels_running_steps():
+    cancelled = []
+
+    async def run_step(step, deps):
+        try:
+            yield "working"
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(step["id"])
+            raise
+
+    async def run():
+        events = run_plan_graph([_step("a"), _step("b")], run_step, 2)
+        async for event in events:
+            if event["type"] == "delta":
+                break
+        await events.aclose()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert sorted(cancelled) == ["a", "b"]
@@ -0,0 +1,27 @@
+from app.tools.fs import FileSystemTool
+
+CHAT_TSX = """import React from "react";
+
+export interface ChatProps {
+  sessionId: string;
+}
+
+export function Chat({ sessionId }: ChatProps) {
+  return <div>{sessionId}</div>;
+}
+"""
+
+def test_outline_includes_tsx(tmp_path):
+    root = tmp_path / "frontend"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "Chat.tsx").write_text(CHAT_TSX)
+    (root / "api.py").write_text("def ping():\n    return 'pong'\n")
+
+    result = FileSystemTool([str(tmp_path)]).outline(str(root))
+    paths = {entry["path"] for entry in result["files"]}
+    assert str(root / "src" / "Chat.tsx") in paths
+    assert "export function Chat" in result["text"]
+
+    one = FileSystemTool([str(tmp_path)]).outline(str(root), file_path=str(root / "src" / "Chat.tsx"))
+    assert "error" not in one
+    assert [s["name"] for s in one["symbols"]] == ["ChatProps", "Chat"]
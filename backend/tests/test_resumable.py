@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app import resumable
+from app.main import app
+from app.resumable import StreamGone
+from app.settings import settings
+
+def _request(last_event_id=None) -> Request:
+    headers = [(b"last-event-id", last_event_id.encode())] if last_event_id else []
+    return Request({"type": "http", "method": "POST", "path": "/chat/stream", "headers": headers})
+
+async def _tokens(n, gate=None):
+    for i in range(n):
+        if gate is not None and i == n // 2:
+            await gate.wait()
+        yield f"t{i}"
+
+async def _collect(stream):
+    return [item async for item in stream]
+
+def test_resume_after_last_event_id_replays_the_rest(monkeypatch):
+    monkeypatch.setattr(settings, "stream_buffer_events", 16)
+
+    async def run():
+        gate = asyncio.Event()
+        stream = resumable.start(_tokens(6, gate))
+        first = stream.subscribe()
+        seen = [await first.__anext__() for _ in range(2)]
+        await first.aclose()  # the connection dropped after two events
+        assert seen == [(f"{stream.id}.0", "t0"), (f"{stream.id}.1", "t1")]
+
+        gate.set()  # generation went on without a reader
+        rest = resumable.resume(_request(seen[-1][0]))
+        assert [item for _id, item in await _collect(rest)] == ["t2", "t3", "t4", "t5"]
+        assert resumable.resume(_request()) is None  # no header: a new stream
+
+    asyncio.run(run())
+
+def test_ring_buffer_drops_old_positions(monkeypatch):
+    monkeypatch.setattr(settings, "stream_buffer_events", 3)
+
+    async def run():
+        stream = resumable.start(_tokens(6))
+        assert [item for _id, item in await _collect(stream.subscribe(2))] == ["t3", "t4", "t5"]
+        assert stream.available(2) and not stream.available(1)
+        with pytest.raises(StreamGone):
+            await _collect(stream.subscribe(0))
+        with pytest.raises(HTTPException) as gone:
+            resumable.resume(_request(f"{stream.id}.0"))
+        assert gone.value.status_code == 410
+
+    asyncio.run(run())
+
+@pytest.mark.parametrize("last_event_id", ["0123abcd.4", "not-a-stream", "{stream}.x"])
+def test_unknown_stream_or_position_is_gone(monkeypatch, last_event_id):
+    async def run():
+        stream = resumable.start(_tokens(1))
+        await _collect(stream.subscribe())
+        with pytest.raises(HTTPException) as gone:
+            resumable.resume(_request(last_event_id.format(stream=stream.id)))
+        assert gone.value.status_code == 410
+
+    asyncio.run(run())
+
+def test_unread_stream_is_cancelled_after_idle_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "stream_idle_timeout", 0.01)
+    closed = []
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.001)
+                yield "t"
+        finally:
+            closed.append(True)
+
+    async def run():
+        stream = resumable.start(endless())
+        await asyncio.sleep(0.1)
+        assert stream.done and closed == [True]
+        assert isinstance(stream.error, StreamGone)
+
+    asyncio.run(run())
+
+def test_chat_stream_answers_410_for_a_gone_stream():
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/chat/stream", headers={"Last-Event-ID": "0123abcd.4"},
+                                     json={"messages": [{"role": "user", "content": "hi"}]})
+
+    assert asyncio.run(run()).status_code == 410
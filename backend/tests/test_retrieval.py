@@ -0,0 +1,33 @@
+from app.tools import retrieval
+from app.tools.fs_index import UNLIMITED_DEPTH, DirectoryIndex, RootCache
+from app.tools.retrieval import ChunkIndex, get_chunk_index
+
+def test_sync_chunks_source_files_by_suffix(tmp_path):
+    sources = {
+        "server.go": "package main\n\nfunc handleWidget() {}\n",
+        "lib.rs": "pub fn parse_widget() {}\n",
+        "Widget.tsx": "export function WidgetCard() { return null; }\n",
+        "Widget.jsx": "export const WidgetList = () => null;\n",
+        "Widget.kt": "class WidgetStore {}\n",
+        "config.cjs": "module.exports = { widget: true };\n",
+        "notes.md": "# Widget notes\n",
+    }
+    for rel, text in sources.items():
+        (tmp_path / rel).write_text(text)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG widget")
+
+    index = ChunkIndex(str(tmp_path), max_file_size=1 << 20, chunk_lines=60)
+    index.sync(DirectoryIndex(str(tmp_path), UNLIMITED_DEPTH).build())
+    assert sorted(index._files) == sorted(sources)
+    assert {rel for _score, rel, _start, _end in index.search("widget", 10)} == set(sources)
+
+def test_chunk_indexes_are_bounded_lru(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "_indexes", RootCache(max_roots=2))
+    a, b, c = (tmp_path / name for name in "abc")
+    first = get_chunk_index(str(a))
+    second = get_chunk_index(str(b))
+    assert get_chunk_index(str(a)) is first  # a is now the most recently used
+    get_chunk_index(str(c))
+    assert len(retrieval._indexes) == 2
+    assert get_chunk_index(str(a)) is first
+    assert get_chunk_index(str(b)) is not second  # b was evicted and is created again
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import Overloaded, Scheduler, TokenBucket
+
+def _scheduler(**kwargs) -> Scheduler:
+    options = {"rpm": 0, "tpm": 0, "max_in_flight": 1, "queue_size": 8, "deadline": 5.0,
+               "priorities": {"chat": 0, "batch": 2}}
+    options.update(kwargs)
+    return Scheduler(**options)
+
+def test_token_bucket_refill(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.scheduler.time.monotonic", lambda: now[0])
+    bucket = TokenBucket(per_minute=60)  # one per second
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    now[0] += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    assert bucket.wait_time(1000) == pytest.approx(59.5)  # clamped to capacity
+    assert TokenBucket(per_minute=0).wait_time(10 ** 9) == 0.0
+
+def test_priority_order_then_fifo():
+    async def run():
+        scheduler = _scheduler()
+        first = await scheduler.acquire("chat", 10)
+        order = []
+
+        async def waiter(kind, name):
+            slot = await scheduler.acquire(kind, 10)
+            order.append(name)
+            slot.release()
+
+        tasks = []
+        for kind, name in (("batch", "batch-1"), ("chat", "chat-1"), ("batch", "batch-2"), ("chat", "chat-2")):
+            tasks.append(asyncio.create_task(waiter(kind, name)))
+            await asyncio.sleep(0)  # queue in this order
+        first.release()
+        await asyncio.gather(*tasks)
+        assert order == ["chat-1", "chat-2", "batch-1", "batch-2"]
+        assert scheduler.in_flight == 0
+
+    asyncio.run(run())
+
+def test_full_queue_sheds_with_retry_after():
+    async def run():
+        scheduler = _scheduler(queue_size=1)
+        slot = await scheduler.acquire("chat", 10)
+        queued = asyncio.create_task(scheduler.acquire("chat", 10))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await scheduler.acquire("chat", 10)
+        assert shed.value.retry_after >= 1
+        # Another priority level has its own queue
+        other = asyncio.create_task(scheduler.acquire("batch", 10, deadline=0.01))
+        with pytest.raises(Overloaded, match="deadline"):
+            await other
+        slot.release()
+        (await queued).release()
+        assert scheduler.stats()["shed"] == 2
+
+    asyncio.run(run())
+
+def test_token_budget_delays_admission():
+    async def run():
+        scheduler = _scheduler(tpm=600, max_in_flight=10)  # 10 tokens per second
+        (await scheduler.acquire("chat", 600)).release()  # drains the bucket
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        (await scheduler.acquire("chat", 2)).release()  # waits ~0.2s for the refill
+        assert loop.time() - started >= 0.15
+        with pytest.raises(Overloaded):
+            await scheduler.acquire("chat", 600, deadline=0.05)
+
+    asyncio.run(run())
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        scheduler = _scheduler()
+        slot = await scheduler.acquire("chat", 10)
+        gone = asyncio.create_task(scheduler.acquire("chat", 10))
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        slot.release()
+        assert scheduler.in_flight == 0
+        (await asyncio.wait_for(scheduler.acquire("chat", 10), 1)).release()
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import threading
+
+from app.tools import search
+
+def test_anchors_match_per_line(tmp_path):
+    path = tmp_path / "mod.py"
+    path.write_text("import os\ndef foo():\n    return 1\ndef bar(): pass\n")
+    run = search.SearchRun(None, None)
+    results = search.search([str(path)], r"^def \w+", True, run)
+    assert [m["line"] for m in results[0]["matches"]] == [2, 4]
+    results = search.search([str(path)], r"\)\:$", True, run)
+    assert [m["line"] for m in results[0]["matches"]] == [2]
+
+def test_capped_pooled_search_keeps_first_results_in_order(tmp_path):
+    files = []
+    for i in range(search._INLINE_FILES + 3 * search._SHARD_FILES):
+        path = tmp_path / f"f{i:04}.txt"
+        path.write_text(f"needle {i}\n")
+        files.append(str(path))
+    run = search.SearchRun(max_results=100, time_limit=None)
+    results = search.search(files, "needle", False, run, workers=2)
+    assert [r["file_path"] for r in results] == files[:100]
+    assert run.truncated
+
+def test_inline_stream_honours_time_limit(tmp_path):
+    files = []
+    for i in range(20):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text("needle\n")
+        files.append(str(path))
+
+    async def collect():
+        run = search.SearchRun(None, time_limit=1e-9)
+        return [r async for r in search.astream(files, "needle", False, run)], run
+
+    results, run = asyncio.run(collect())
+    assert results == [] and run.truncated
+
+def test_pooled_stream_sizes_shards_off_the_event_loop(tmp_path, monkeypatch):
+    files = []
+    for i in range(search._INLINE_FILES + search._SHARD_FILES):
+        path = tmp_path / f"f{i:04}.txt"
+        path.write_text(f"needle {i}\n")
+        files.append(str(path))
+    sized_on = set()
+
+    def getsize(path):
+        sized_on.add(threading.current_thread())
+        return os.stat(path).st_size
+
+    monkeypatch.setattr(search.os.path, "getsize", getsize)
+
+    async def collect():
+        run = search.SearchRun(None, None)
+        return [r async for r in search.astream(files, "needle", False, run, workers=2)]
+
+    results = asyncio.run(collect())
+    assert sorted(r["file_path"] for r in results) == files
+    assert sized_on and threading.main_thread() not in sized_on
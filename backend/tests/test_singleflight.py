@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+def test_do_shares_one_call():
+    async def run():
+        flights, calls = SingleFlight(), []
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return {"answer": 42}
+
+        waiters = [asyncio.create_task(flights.do("k", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert flights.in_flight("k")
+        release.set()
+        results = await asyncio.gather(*waiters)
+        assert calls == [1] and all(r is results[0] for r in results)
+        assert not flights.in_flight("k")
+        assert flights.stats()["coalesced"] == 2
+
+        await flights.do("k", work)  # finished flights are not reused
+        assert calls == [1, 1]
+
+    asyncio.run(run())
+
+def test_do_survives_one_cancelled_caller_and_shares_errors():
+    async def run():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            raise ValueError("upstream failed")
+
+        first = asyncio.create_task(flights.do("k", work))
+        second = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        assert flights.in_flight("k")  # still wanted by `second`
+        release.set()
+        with pytest.raises(ValueError):
+            await second
+
+    asyncio.run(run())
+
+def test_do_cancels_when_every_caller_leaves():
+    async def run():
+        flights, cancelled = SingleFlight(), []
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        caller = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert cancelled == [True] and not flights.in_flight("k")
+
+    asyncio.run(run())
+
+def test_stream_replays_to_late_joiners():
+    async def run():
+        flights, starts = SingleFlight(), []
+        gate = asyncio.Event()
+
+        async def tokens():
+            starts.append(1)
+            for token in ("a", "b"):
+                yield token
+            await gate.wait()
+            for token in ("c", "d"):
+                yield token
+
+        async def collect(stream):
+            return [token async for token in stream]
+
+        early = asyncio.create_task(collect(flights.stream("k", tokens)))
+        await asyncio.sleep(0.01)  # "a" and "b" are out
+        late = asyncio.create_task(collect(flights.stream("k", tokens)))
+        await asyncio.sleep(0)
+        gate.set()
+        assert await early == await late == ["a", "b", "c", "d"]
+        assert starts == [1] and not flights.in_flight("k")
+
+    asyncio.run(run())
+
+def test_stream_error_reaches_every_subscriber():
+    async def run():
+        flights = SingleFlight()
+
+        async def tokens():
+            yield "a"
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        async def collect(stream):
+            seen = []
+            with pytest.raises(RuntimeError, match="boom"):
+                async for token in stream:
+                    seen.append(token)
+            return seen
+
+        results = await asyncio.gather(collect(flights.stream("k", tokens)), collect(flights.stream("k", tokens)))
+        assert results == [["a"], ["a"]]
+
+    asyncio.run(run())
@@ -0,0 +1,63 @@
+import asyncio
+import zlib
+
+from app.sse import _gzip, encode_events, format_event
+
+async def _burst(items, pause_after=None, pause=0.0):
+    for i, item in enumerate(items):
+        yield item
+        if i == pause_after:
+            await asyncio.sleep(pause)
+
+def _encode(source, **kwargs):
+    async def run():
+        return [chunk async for chunk in encode_events(source, **kwargs)]
+    return asyncio.run(run())
+
+def test_first_token_is_written_at_once_and_a_burst_is_merged():
+    writes = _encode(_burst(["a", "b", "c", ("meta", {"n": 1}), "d"]), window=10.0, heartbeat=0)
+    assert writes[0] == format_event("a", "delta")
+    # The rest arrived within the window: one write, consecutive deltas merged
+    assert writes[1:] == [format_event("bc", "delta") + format_event('{"n": 1}', "meta")
+                          + format_event("d", "delta") + format_event("[DONE]", "done")]
+
+def test_window_expiry_flushes_pending_frames():
+    # "b" waits for the window, which ends during the pause; "c" follows a quiet spell
+    writes = _encode(_burst(["a", "b", "c"], pause_after=1, pause=0.1), window=0.02, heartbeat=0)
+    assert writes == [format_event("a", "delta"), format_event("b", "delta"), format_event("c", "delta"),
+                      format_event("[DONE]", "done")]
+
+def test_max_bytes_forces_a_write():
+    writes = _encode(_burst(["a", "x" * 10, "y" * 10, "z"]), window=10.0, max_bytes=8, heartbeat=0)
+    assert writes[:3] == [format_event("a", "delta"), format_event("x" * 10, "delta"),
+                          format_event("y" * 10, "delta")]
+
+def test_heartbeat_during_silence():
+    writes = _encode(_burst(["a", "b"], pause_after=0, pause=0.12), window=0.0, heartbeat=0.05)
+    assert writes[0] == format_event("a", "delta")
+    assert writes.count(": keep-alive\n\n") >= 1
+    assert writes[-2:] == [format_event("b", "delta"), format_event("[DONE]", "done")]
+
+def test_multiline_ids_own_done_and_errors():
+    assert format_event("one\n\ntwo", "delta", "s.3") == "event: delta\nid: s.3\ndata: one\ndata: \ndata: two\n\n"
+
+    writes = _encode(_burst([("s.0", "a"), ("s.1", ("done", "[DONE]"))]), window=0.0, heartbeat=0,
+                     with_ids=True)
+    assert "".join(writes) == format_event("a", "delta", "s.0") + format_event("[DONE]", "done", "s.1")
+
+    async def failing():
+        yield "a"
+        raise RuntimeError("upstream 500")
+
+    body = "".join(_encode(failing(), window=0.0, heartbeat=0, error_message=lambda e: f"failed: {e}"))
+    assert body.endswith(format_event('{"type": "error", "error": "failed: upstream 500"}', "error")
+                         + format_event("[DONE]", "done"))
+
+def test_gzip_writes_decode_as_they_arrive():
+    async def run():
+        chunks = [chunk async for chunk in _gzip(encode_events(_burst(["a", "b"], 0, 0.05), window=0.0,
+                                                                heartbeat=0))]
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        return decoder.decompress(chunks[0]).decode()
+
+    assert asyncio.run(run()) == format_event("a", "delta")
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app.settings import settings
+from app.tools.fs import FileSystemTool
+from app.tools.fs_index import UNLIMITED_DEPTH, DirectoryIndex
+from app.tools.trigram import TrigramIndex, _text_trigrams, required_literals
+
+def _write(root, rel, text, mtime_ns):
+    path = root / rel
+    path.write_text(text)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def _candidates(index, root, query="hello"):
+    dir_index = DirectoryIndex(str(root), UNLIMITED_DEPTH).build()
+    return index.candidates(dir_index, required_literals(query))
+
+def _expected(root, query="hello"):
+    dir_index = DirectoryIndex(str(root), UNLIMITED_DEPTH).build()
+    return [rel for rel, *_ in dir_index.file_list() if query in (root / rel).read_text()]
+
+def test_incremental_update_merge_reload_and_search(tmp_path, monkeypatch):
+    root, index_dir = tmp_path / "src", tmp_path / "index"
+    root.mkdir()
+    for i in range(10):
+        _write(root, f"f{i}.py", f"hello {i}\n" if i % 2 == 0 else f"other {i}\n", 10**18)
+
+    index = TrigramIndex(str(root), str(index_dir), max_file_size=1 << 20, merge_threshold=2)
+    index.build(DirectoryIndex(str(root), UNLIMITED_DEPTH).build())
+    assert sorted(_candidates(index, root)) == sorted(_expected(root))
+
+    # Three changed files: over the threshold, so the delta is merged into a new segment
+    _write(root, "f1.py", "hello again\n", 2 * 10**18)
+    _write(root, "f2.py", "nothing here\n", 2 * 10**18)
+    (root / "f4.py").unlink()
+    assert sorted(_candidates(index, root)) == sorted(_expected(root))
+    assert index._delta == {} and index._dead == set()
+
+    # A second merge on top of a segment that already has superseded ids
+    _write(root, "f3.py", "hello three\n", 3 * 10**18)
+    _write(root, "f6.py", "gone\n", 3 * 10**18)
+    _write(root, "f1.py", "bye\n", 3 * 10**18)
+    assert sorted(_candidates(index, root)) == sorted(_expected(root))
+
+    # Another process (or a restart) maps the merged segment from disk
+    reloaded = TrigramIndex(str(root), str(index_dir), max_file_size=1 << 20, merge_threshold=2)
+    assert sorted(_candidates(reloaded, root)) == sorted(_expected(root))
+
+    monkeypatch.setattr(settings, "fs_trigram_index_dir", str(index_dir))
+    monkeypatch.setattr(settings, "fs_trigram_merge_threshold", 2)
+    result = FileSystemTool([str(root)]).search_files("hello", str(root))
+    assert "error" not in result
+    assert [os.path.relpath(r["file_path"], root) for r in result["results"]] == _expected(root)
+
+def test_losing_build_maps_the_winners_segment(tmp_path):
+    root, index_dir = tmp_path / "src", tmp_path / "index"
+    root.mkdir()
+    for i in range(4):
+        _write(root, f"f{i}.py", f"hello {i}\n", 10**18)
+    dir_index = DirectoryIndex(str(root), UNLIMITED_DEPTH).build()
+    winner = TrigramIndex(str(root), str(index_dir), max_file_size=1 << 20, merge_threshold=2)
+    loser = TrigramIndex(str(root), str(index_dir), max_file_size=1 << 20, merge_threshold=2)
+    loser._read_trigrams = lambda rel: pytest.fail(f"loser read {rel}")
+
+    started = threading.Event()
+    with winner._file_lock(blocking=True):
+        thread = threading.Thread(target=lambda: (started.set(), loser.build(dir_index)))
+        thread.start()
+        started.wait()
+        time.sleep(0.1)
+        assert thread.is_alive()  # waiting on the lock, not indexing on its own
+        winner._write(((rel, size, mtime, winner._read_trigrams(rel))
+                       for rel, size, mtime, *_ in dir_index.file_list()), None)
+    thread.join(5)
+
+    assert loser._segment is not None and loser._delta == {}
+    assert sorted(loser._lookup(_text_trigrams("hello"))) == sorted(_expected(root))
+
+def test_merge_tolerates_a_segment_removed_by_another_worker(tmp_path):
+    root, index_dir = tmp_path / "src", tmp_path / "index"
+    root.mkdir()
+    for i in range(4):
+        _write(root, f"f{i}.py", f"hello {i}\n", 10**18)
+    index = TrigramIndex(str(root), str(index_dir), max_file_size=1 << 20, merge_threshold=1)
+    index.build(DirectoryIndex(str(root), UNLIMITED_DEPTH).build())
+    assert index._segment is not None
+
+    os.remove(index.path)  # another worker dropped the segment first
+    index._dead = set(index._segment.ids.values())
+    index._merge()
+    assert index._segment is None and not os.path.exists(index.path)
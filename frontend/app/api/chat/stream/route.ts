@@ -2,11 +2,16 @@ import { NextRequest } from "next/server";
 
 export async function POST(req: NextRequest) {
   const body = await req.json();
+  const lastEventId = req.headers.get("last-event-id");
   const backend = process.env.BACKEND_URL || "http://localhost:8001";
 
   const response = await fetch(`${backend}/chat/stream`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: {
+      "Content-Type": "application/json",
+      // Resuming a dropped stream: the backend replays what came after this id
+      ...(lastEventId ? { "Last-Event-ID": lastEventId } : {}),
+    },
     body: JSON.stringify(body)
   });
 
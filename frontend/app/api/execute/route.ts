@@ -3,7 +3,10 @@ import { NextRequest } from "next/server";
 export async function POST(req: NextRequest) {
   const backend = process.env.BACKEND_URL || "http://localhost:8001";
   const body = await req.text();
-  const r = await fetch(`${backend}/execute`, { method: 'POST', body, headers: { 'Content-Type': 'application/json' } });
+  const lastEventId = req.headers.get('last-event-id');
+  const headers: Record<string, string> = { 'Content-Type': 'application/json' };
+  if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+  const r = await fetch(`${backend}/execute`, { method: 'POST', body, headers });
 
   // Proxy SSE stream
   const readable = new ReadableStream({
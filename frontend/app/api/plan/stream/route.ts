@@ -0,0 +1,30 @@
+import { NextRequest } from "next/server";
+
+export async function POST(req: NextRequest) {
+  const body = await req.json();
+  const lastEventId = req.headers.get("last-event-id");
+  const backend = process.env.BACKEND_URL || "http://localhost:8001";
+
+  const response = await fetch(`${backend}/plan/stream`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      // Resuming a dropped stream: the backend replays what came after this id
+      ...(lastEventId ? { "Last-Event-ID": lastEventId } : {}),
+    },
+    body: JSON.stringify(body)
+  });
+
+  if (!response.ok) {
+    return new Response("Planning failed", { status: response.status });
+  }
+
+  // Step events pass through as they arrive
+  return new Response(response.body, {
+    headers: {
+      'Content-Type': 'text/event-stream',
+      'Cache-Control': 'no-cache',
+      'Connection': 'keep-alive',
+    },
+  });
+}
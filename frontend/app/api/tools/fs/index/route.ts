@@ -2,7 +2,8 @@ import { NextRequest, NextResponse } from 'next/server';
 
 export async function POST(request: NextRequest) {
   try {
-    const { path, max_depth = 2 } = await request.json();
+    // Forward the body untouched so stream/page_size/cursor reach the backend
+    const body = await request.text();
 
     // Forward to backend
     const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
@@ -11,16 +12,23 @@ export async function POST(request: NextRequest) {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        'Accept': request.headers.get('accept') || 'application/json',
       },
-      body: JSON.stringify({ path, max_depth }),
+      body,
     });
 
     if (!response.ok) {
       throw new Error('Backend request failed');
     }
 
-    const data = await response.json();
-    return NextResponse.json(data);
+    // Pass NDJSON streams through unbuffered; plain JSON (full or paged) as-is
+    return new Response(response.body, {
+      status: response.status,
+      headers: {
+        'Content-Type': response.headers.get('content-type') || 'application/json',
+        'Cache-Control': 'no-cache',
+      },
+    });
   } catch (error) {
     console.error('Tools API error:', error);
     return NextResponse.json(
@@ -28,4 +36,4 @@ export async function POST(request: NextRequest) {
       { status: 500 }
     );
   }
-}
\ No newline at end of file
+}
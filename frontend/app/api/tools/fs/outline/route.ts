@@ -0,0 +1,28 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export async function POST(request: NextRequest) {
+  try {
+    // path/query/max_tokens for a project outline, or file_path for one file
+    const body = await request.text();
+
+    const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
+
+    const response = await fetch(`${backendUrl}/tools/fs/outline`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body,
+    });
+
+    if (!response.ok) {
+      throw new Error('Backend request failed');
+    }
+
+    return NextResponse.json(await response.json());
+  } catch (error) {
+    console.error('Tools API error:', error);
+    return NextResponse.json(
+      { error: 'Internal server error' },
+      { status: 500 }
+    );
+  }
+}
@@ -0,0 +1,24 @@
+import { NextRequest } from 'next/server';
+
+export async function POST(request: NextRequest) {
+  const backendUrl = process.env.BACKEND_URL || 'http://localhost:8000';
+  const body = await request.text();
+
+  const response = await fetch(`${backendUrl}/tools/fs/search`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': request.headers.get('accept') || 'application/x-ndjson',
+    },
+    body,
+  });
+
+  // Pass the NDJSON/SSE stream through unbuffered so first hits arrive immediately
+  return new Response(response.body, {
+    status: response.status,
+    headers: {
+      'Content-Type': response.headers.get('content-type') || 'application/x-ndjson',
+      'Cache-Control': 'no-cache',
+    },
+  });
+}
@@ -1,6 +1,7 @@
 'use client';
-import { useState } from "react";
+import { useRef, useState } from "react";
 import ModeSelector from "./ModeSelector";
+import { readResumableSSE } from "../lib/sse";
 
 type Msg = { role: "user"|"assistant"; content: string };
 
@@ -13,6 +14,31 @@ export default function Chat() {
   const [projectRules, setProjectRules] = useState("Follow existing code style and conventions.\nMaintain backward compatibility.\nWrite comprehensive tests.");
   const [projectPath, setProjectPath] = useState(".");
   const [showRules, setShowRules] = useState(false);
+  // Server-side session: each turn uploads only the new message
+  const sessionRef = useRef<string | null>(null);
+
+  async function createSession(history: Msg[]) {
+    const r = await fetch("/api/sessions", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ messages: history })
+    });
+    sessionRef.current = (await r.json()).session_id;
+  }
+
+  async function streamTurn(message: Msg, lastEventId?: string) {
+    return fetch("/api/chat/stream", {
+      method: "POST",
+      headers: { "Content-Type": "application/json", ...(lastEventId ? { "Last-Event-ID": lastEventId } : {}) },
+      body: JSON.stringify({
+        session_id: sessionRef.current,
+        messages: [message],
+        mode,
+        custom_rules: { global: globalRules, project: projectRules },
+        project_context: { path: projectPath }
+      })
+    });
+  }
 
   async function send() {
     if (!input.trim()) return;
@@ -23,46 +49,34 @@ export default function Chat() {
     const assistantMessage = { role: "assistant" as const, content: "" };
     setMessages([...next, assistantMessage]);
 
-    const eventSource = new EventSource("/api/chat/stream");
-
-    eventSource.onmessage = (event) => {
-      const data = event.data;
-      if (data === "[DONE]") {
-        eventSource.close();
-        setLoading(false);
-        return;
+    const appendToken = (token: string) => setMessages(prev => {
+      const newMessages = [...prev];
+      const lastMsg = newMessages[newMessages.length - 1];
+      if (lastMsg.role === "assistant") {
+        newMessages[newMessages.length - 1] = { ...lastMsg, content: lastMsg.content + token };
       }
+      return newMessages;
+    });
 
-      // Append token to assistant message
-      setMessages(prev => {
-        const newMessages = [...prev];
-        const lastMsg = newMessages[newMessages.length - 1];
-        if (lastMsg.role === "assistant") {
-          lastMsg.content += data;
-        }
-        return newMessages;
+    try {
+      if (!sessionRef.current) await createSession(messages);
+      const message = next[next.length - 1];
+      await readResumableSSE(async (lastEventId) => {
+        const res = await streamTurn(message, lastEventId);
+        if (res.status !== 404 || lastEventId) return res;
+        // The session expired on the server: start a new one from our copy of the history
+        await createSession(messages);
+        return streamTurn(message);
+      }, ({ event, data }) => {
+        if (event === "delta") appendToken(data);
+        else if (event === "error") appendToken(`Error: ${JSON.parse(data).error}`);
+        else if (event === "done") return false;
       });
-    };
-
-    eventSource.onerror = () => {
-      eventSource.close();
+    } catch (error) {
+      console.error("Chat stream failed:", error);
+    } finally {
       setLoading(false);
-    };
-
-    // Start the stream
-    fetch("/api/chat/stream", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        messages: next,
-        mode,
-        custom_rules: { global: globalRules, project: projectRules },
-        project_context: { path: projectPath }
-      })
-    }).catch(() => {
-      eventSource.close();
-      setLoading(false);
-    });
+    }
   }
 
   return (
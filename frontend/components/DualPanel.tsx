@@ -1,10 +1,10 @@
 'use client';
 import { useState } from 'react';
-import PlannerPanel from './PlannerPanel';
+import PlannerPanel, { PlanStep } from './PlannerPanel';
 import KiloPanel from './KiloPanel';
 
 export default function DualPanel(){
-  const [plan, setPlan] = useState<string[]>([]);
+  const [plan, setPlan] = useState<PlanStep[] | string[]>([]);
   return (
     <div className="grid grid-cols-1 md:grid-cols-2 gap-4 h-[80vh]">
       <div className="h-full"><PlannerPanel onConfirm={setPlan} /></div>
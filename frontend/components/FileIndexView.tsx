@@ -12,24 +12,44 @@ interface IndexResult {
   files: FileInfo[];
   total_files: number;
   total_dirs: number;
+  next_cursor?: string | null;
 }
 
+interface OutlineSymbol {
+  kind: string;
+  name: string;
+  signature: string;
+  line: number;
+  depth: number;
+}
+
+const PAGE_SIZE = 50;
+
 export default function FileIndexView() {
   const [files, setFiles] = useState<FileInfo[]>([]);
   const [loading, setLoading] = useState(false);
   const [path, setPath] = useState('.');
   const [expanded, setExpanded] = useState(false);
+  const [totalFiles, setTotalFiles] = useState(0);
+  const [cursor, setCursor] = useState<string | null>(null);
+  // Symbols of the file clicked in the list (undefined while loading)
+  const [outlinePath, setOutlinePath] = useState<string | null>(null);
+  const [symbols, setSymbols] = useState<OutlineSymbol[] | undefined>([]);
 
-  const indexFiles = async () => {
+  // Fetch one page; without a cursor this starts over from the first page
+  const indexFiles = async (after: string | null = null) => {
     setLoading(true);
     try {
       const response = await fetch('/api/tools/fs/index', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ path, max_depth: 2 })
+        body: JSON.stringify({ path, max_depth: 2, page_size: PAGE_SIZE, cursor: after })
       });
       const result: IndexResult = await response.json();
-      setFiles(result.files || []);
+      const page = result.files || [];
+      setFiles(prev => (after ? [...prev, ...page] : page));
+      setTotalFiles(result.total_files || 0);
+      setCursor(result.next_cursor || null);
     } catch (error) {
       console.error('Failed to index files:', error);
     } finally {
@@ -37,7 +57,29 @@ export default function FileIndexView() {
     }
   };
 
+  const showOutline = async (filePath: string) => {
+    if (filePath === outlinePath) {
+      setOutlinePath(null);
+      return;
+    }
+    setOutlinePath(filePath);
+    setSymbols(undefined);
+    try {
+      const response = await fetch('/api/tools/fs/outline', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ path, file_path: filePath })
+      });
+      const result = await response.json();
+      setSymbols(result.symbols || []);
+    } catch (error) {
+      console.error('Failed to outline file:', error);
+      setSymbols([]);
+    }
+  };
+
   useEffect(() => {
+    setOutlinePath(null);
     if (expanded) {
       indexFiles();
     }
@@ -74,7 +116,7 @@ export default function FileIndexView() {
           placeholder="Project path"
         />
         <button
-          onClick={indexFiles}
+          onClick={() => indexFiles()}
           disabled={loading}
           className="text-xs border rounded px-2 py-1 disabled:opacity-50"
         >
@@ -83,18 +125,38 @@ export default function FileIndexView() {
       </div>
 
       <div className="max-h-32 overflow-y-auto text-xs space-y-1">
-        {files.slice(0, 10).map((file, i) => (
-          <div key={i} className="flex justify-between text-gray-700">
-            <span className="truncate flex-1">{file.path}</span>
-            <span className="text-gray-500 ml-2">
-              {file.type === 'file' ? '📄' : '📁'} {file.size}b
-            </span>
+        {files.map((file, i) => (
+          <div key={i}>
+            <div
+              onClick={() => showOutline(file.path)}
+              className="flex justify-between text-gray-700 cursor-pointer hover:text-gray-900"
+            >
+              <span className="truncate flex-1">{file.path}</span>
+              <span className="text-gray-500 ml-2">
+                {file.type === 'file' ? '📄' : '📁'} {file.size}b
+              </span>
+            </div>
+            {outlinePath === file.path && (
+              <div className="font-mono text-gray-600 pl-2 border-l ml-1">
+                {symbols === undefined && <div>Loading...</div>}
+                {symbols && symbols.length === 0 && <div className="text-gray-400">No symbols</div>}
+                {symbols && symbols.map((s, j) => (
+                  <div key={j} className="truncate" style={{ paddingLeft: `${s.depth * 0.75}rem` }} title={`line ${s.line}`}>
+                    {s.signature}
+                  </div>
+                ))}
+              </div>
+            )}
           </div>
         ))}
-        {files.length > 10 && (
-          <div className="text-gray-500 text-center">
-            ... and {files.length - 10} more files
-          </div>
+        {cursor && (
+          <button
+            onClick={() => indexFiles(cursor)}
+            disabled={loading}
+            className="w-full text-gray-500 hover:text-gray-700 text-center disabled:opacity-50"
+          >
+            {loading ? 'Loading...' : `Load more (${files.length} of ${totalFiles})`}
+          </button>
         )}
       </div>
     </div>
@@ -1,12 +1,39 @@
 'use client';
 import { useEffect, useRef, useState } from 'react';
+import type { PlanStep } from './PlannerPanel';
+import { readResumableSSE } from '../lib/sse';
 
-export default function KiloPanel({ plan }: { plan: string[] }) {
+type StepEvent = { step: string; type: 'start' | 'delta' | 'done' | 'error' | 'cancelled'; action?: string; delta?: string; error?: string; reason?: string };
+type StepState = { action: string; status: 'pending' | 'running' | 'done' | 'error' | 'cancelled'; text: string; note?: string };
+
+const STATUS_COLOR: Record<StepState['status'], string> = {
+  pending: 'text-gray-500', running: 'text-yellow-300', done: 'text-green-400', error: 'text-red-400', cancelled: 'text-gray-400',
+};
+
+export default function KiloPanel({ plan }: { plan: PlanStep[] | string[] }) {
   const [lines, setLines] = useState<string[]>([]);
+  // Step-graph plans stream JSON events tagged by step id; one section per step
+  const [steps, setSteps] = useState<Record<string, StepState>>({});
   const srcRef = useRef<EventSource | null>(null);
+  const graph = plan.length > 0 && typeof plan[0] !== 'string';
 
   useEffect(() => {
     if (!plan || plan.length === 0) return;
+    setLines([]);
+    setSteps(graph
+      ? Object.fromEntries((plan as PlanStep[]).map(s => [s.id, { action: s.action, status: 'pending', text: '' }]))
+      : {});
+
+    const applyEvent = (ev: StepEvent) => setSteps(prev => {
+      const cur = prev[ev.step] || { action: ev.action || ev.step, status: 'pending', text: '' };
+      const next: StepState = { ...cur };
+      if (ev.type === 'start') next.status = 'running';
+      else if (ev.type === 'delta') next.text += ev.delta || '';
+      else if (ev.type === 'done') next.status = 'done';
+      else if (ev.type === 'error') { next.status = 'error'; next.note = ev.error; }
+      else if (ev.type === 'cancelled') { next.status = 'cancelled'; next.note = ev.reason; }
+      return { ...prev, [ev.step]: next };
+    });
 
     const start = async () => {
       // Start SSE by POSTing plan
@@ -14,16 +41,15 @@ export default function KiloPanel({ plan }: { plan: string[] }) {
       const body = JSON.stringify({ mode: 'coder', plan });
 
       // Create a local relay that opens SSE stream
-      const res = await fetch('/api/execute', { method: 'POST', body, headers: { 'Content-Type': 'application/json' } });
-      const reader = res.body?.getReader();
-      const dec = new TextDecoder();
-      while (reader) {
-        const { done, value } = await reader.read();
-        if (done) break;
-        const chunk = dec.decode(value);
-        const parts = chunk.split('\n\n').filter(Boolean);
-        setLines(prev => [...prev, ...parts.map(p => p.replace(/^data: /, ''))]);
-      }
+      await readResumableSSE((lastEventId) => fetch('/api/execute', {
+        method: 'POST',
+        body,
+        headers: { 'Content-Type': 'application/json', ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {}) },
+      }), ({ event, data }) => {
+        if (event === 'delta') setLines(prev => [...prev, data]);
+        else if (event === 'step') applyEvent(JSON.parse(data));
+        else if (event === 'error') setLines(prev => [...prev, `Error: ${JSON.parse(data).error}`]);
+      });
     };
 
     start();
@@ -32,7 +58,13 @@ export default function KiloPanel({ plan }: { plan: string[] }) {
 
   return (
     <div className="h-full bg-black text-green-300 font-mono p-3 rounded border overflow-auto">
+      {Object.entries(steps).map(([id, s]) => (
+        <div key={id} className="mb-2">
+          <div className={STATUS_COLOR[s.status]}>[{id}] {s.status} · {s.action}{s.note ? ` (${s.note})` : ''}</div>
+          {s.text && <div className="whitespace-pre-wrap pl-4">{s.text}</div>}
+        </div>
+      ))}
       {lines.map((ln,i)=> (<div key={i}>{ln}</div>))}
     </div>
   );
-}
\ No newline at end of file
+}
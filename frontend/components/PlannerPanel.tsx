@@ -1,22 +1,44 @@
 'use client';
 import { useState } from 'react';
+import { readResumableSSE } from '../lib/sse';
 
 type Msg = { role: 'user' | 'assistant' | 'system'; content: string };
+export type PlanStep = { id: string; action: string; depends_on: string[] };
 
-export default function PlannerPanel({ onConfirm }: { onConfirm: (plan: string[]) => void }) {
+export default function PlannerPanel({ onConfirm }: { onConfirm: (plan: PlanStep[] | string[]) => void }) {
   const [messages, setMessages] = useState<Msg[]>([]);
   const [input, setInput] = useState('');
   const [plan, setPlan] = useState<string[]>([]);
+  const [steps, setSteps] = useState<PlanStep[]>([]);
   const [summary, setSummary] = useState('');
   const [loading, setLoading] = useState(false);
 
   async function askPlanner() {
     const next = [...messages, { role: 'user', content: input }];
     setMessages(next); setLoading(true); setInput('');
-    const res = await fetch('/api/plan', { method: 'POST', headers: {'Content-Type':'application/json'}, body: JSON.stringify({ messages: next })});
-    const json = await res.json();
-    setPlan(Array.isArray(json.plan) ? json.plan : []);
-    setSummary(json.summary || '');
+    setPlan([]); setSteps([]); setSummary('');
+    // Steps stream in as the planner writes them; `done` carries the final (normalized) plan
+    const body = JSON.stringify({ messages: next, graph: true });
+    await readResumableSSE((lastEventId) => fetch('/api/plan/stream', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {}) },
+      body,
+    }), ({ event, data }) => {
+      let ev: any;
+      try { ev = JSON.parse(data); } catch { return; }
+      if (event === 'step') {
+        setSteps(prev => [...prev, ev.step]);
+        setPlan(prev => [...prev, ev.step.action]);
+      } else if (event === 'summary') {
+        setSummary(ev.summary);
+      } else if (event === 'done') {
+        setPlan(Array.isArray(ev.plan) ? ev.plan : []);
+        setSteps(Array.isArray(ev.steps) ? ev.steps : []);
+        setSummary(ev.summary || '');
+      } else if (event === 'error') {
+        setSummary(`Error: ${ev.error}`);
+      }
+    });
     setLoading(false);
   }
 
@@ -31,10 +53,17 @@ export default function PlannerPanel({ onConfirm }: { onConfirm: (plan: string[]
           <div className="mt-3">
             <h3 className="font-semibold">Proposed Plan</h3>
             <ol className="list-decimal ml-5 space-y-1">
-              {plan.map((s,i)=>(<li key={i}>{s}</li>))}
+              {steps.length>0
+                ? steps.map(s=>(
+                    <li key={s.id}>
+                      <span className="mr-1 text-xs text-gray-500">{s.id}</span>{s.action}
+                      {s.depends_on.length>0 && <span className="ml-2 text-xs text-gray-500">after {s.depends_on.join(', ')}</span>}
+                    </li>
+                  ))
+                : plan.map((s,i)=>(<li key={i}>{s}</li>))}
             </ol>
             {summary && <p className="mt-2 text-sm text-gray-600">{summary}</p>}
-            <button onClick={()=>onConfirm(plan)} className="mt-3 border rounded px-3 py-1">Yes, run this with Kilo</button>
+            <button disabled={loading} onClick={()=>onConfirm(steps.length>0 ? steps : plan)} className="mt-3 border rounded px-3 py-1">Yes, run this with Kilo</button>
           </div>
         )}
       </div>
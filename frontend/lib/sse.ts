@@ -0,0 +1,74 @@
+export type SSEEvent = { event: string; data: string; id?: string };
+
+// Parse a text/event-stream body, calling `onEvent` for each complete event.
+// Multi-line data is joined with "\n"; comment lines (heartbeats) are skipped.
+// Return false from `onEvent` to stop reading.
+export async function readSSE(res: Response, onEvent: (ev: SSEEvent) => boolean | void): Promise<void> {
+  const reader = res.body?.getReader();
+  if (!reader) return;
+  const dec = new TextDecoder();
+  let buffer = '';
+
+  const parse = (block: string): SSEEvent | null => {
+    let event = 'message';
+    let id: string | undefined;
+    const data: string[] = [];
+    for (const line of block.split('\n')) {
+      if (!line || line.startsWith(':')) continue;
+      const colon = line.indexOf(':');
+      const field = colon < 0 ? line : line.slice(0, colon);
+      let value = colon < 0 ? '' : line.slice(colon + 1);
+      if (value.startsWith(' ')) value = value.slice(1);
+      if (field === 'event') event = value;
+      else if (field === 'data') data.push(value);
+      else if (field === 'id') id = value;
+    }
+    return data.length ? { event, data: data.join('\n'), id } : null;
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += dec.decode(value, { stream: true });
+    const blocks = buffer.split('\n\n');
+    buffer = blocks.pop() || '';
+    for (const block of blocks) {
+      const ev = parse(block);
+      if (ev && onEvent(ev) === false) {
+        await reader.cancel();
+        return;
+      }
+    }
+  }
+  const last = parse(buffer);
+  if (last) onEvent(last);
+}
+
+// Like readSSE, for the backend's resumable streams (chat, plan, execute): if the
+// connection drops before the `done` event, `send` is called again with the last
+// event id it delivered, and the backend replays the rest of the same run
+// instead of starting over.
+export async function readResumableSSE(
+  send: (lastEventId?: string) => Promise<Response>,
+  onEvent: (ev: SSEEvent) => boolean | void,
+  retries = 3,
+): Promise<void> {
+  let lastEventId: string | undefined;
+  for (let attempt = 0; ; attempt++) {
+    let finished = false;
+    try {
+      const res = await send(lastEventId);
+      if (!res.ok && attempt > 0) return;  // e.g. 410: the position is no longer buffered
+      await readSSE(res, (ev) => {
+        if (ev.id) lastEventId = ev.id;
+        if (ev.event === 'done') finished = true;
+        const more = onEvent(ev);
+        if (more === false) finished = true;
+        return more;
+      });
+    } catch (error) {
+      if (attempt >= retries || !lastEventId) throw error;
+    }
+    if (finished || !lastEventId || attempt >= retries) return;
+  }
+}